@@ -11,11 +11,17 @@ import os
 import sys
 import json
 import base64
+import math
+import mimetypes
 import tempfile
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict
 from pathlib import Path
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import cv2
@@ -26,10 +32,18 @@ IS_PRODUCTION = os.getenv('FLASK_ENV') == 'production' or os.getenv('RENDER')
 
 # Import OMR processing modules
 from src.entry import process_dir
-from src.template import Template
-from src.defaults import CONFIG_DEFAULTS
-from src.utils.parsing import open_config_with_defaults
-from src import constants
+from src.jobs import (
+    CANCELLED,
+    JOB_QUEUE_BACKENDS,
+    QUEUED,
+    RUNNING,
+    JobRunner,
+    QueueFullError,
+    SQLiteJobQueue,
+)
+from src.processing import MarkedImageOptions, process_image_data
+from src.utils.janitor import StorageJanitor
+from src.utils.template_cache import TemplateCache
 
 app = Flask(__name__)
 
@@ -55,11 +69,61 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 RESULTS_FOLDER.mkdir(exist_ok=True)
 
+# Uploads and marked images are only written to disk when asked to (per request)
+PERSIST_UPLOADS = os.getenv('PERSIST_UPLOADS', 'false').lower() in ('1', 'true', 'yes', 'on')
+
+# Workers processing the sheets of batch requests, shared by all batches
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', min(4, os.cpu_count() or 1)))
+BATCH_EXECUTOR = ThreadPoolExecutor(BATCH_WORKERS, thread_name_prefix='omr-batch')
+MAX_BATCH_FILES = int(os.getenv('MAX_BATCH_FILES', 100))
+MAX_BATCH_CONTENT_LENGTH = int(os.getenv('MAX_BATCH_CONTENT_LENGTH', 256 * 1024 * 1024))
+
+# Background jobs: the queue backend ('sqlite' is shared by the server processes,
+# 'memory' only works with a single process), its maximum backlog and the job TTLs
+JOB_QUEUE_BACKEND = os.getenv('JOB_QUEUE_BACKEND', 'sqlite')
+JOB_QUEUE_PATH = Path(os.getenv('JOB_QUEUE_PATH', 'omr_jobs.sqlite3'))
+JOB_QUEUE_MAX_DEPTH = int(os.getenv('JOB_QUEUE_MAX_DEPTH', 20))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 1))
+JOB_TTL = float(os.getenv('JOB_TTL', 3600))
+JOB_MAX_TTL = float(os.getenv('JOB_MAX_TTL', 24 * 3600))
+# The running jobs of a stopped server process are run again after their lease
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', 60))
+JOB_RUNNER = None
+JOB_RUNNER_LOCK = threading.Lock()
+
+# Longest edge of the marked image thumbnails, unless asked otherwise
+THUMBNAIL_MAX_EDGE = int(os.getenv('THUMBNAIL_MAX_EDGE', 800))
+
+# Sessions (their upload and results folders) are deleted after SESSION_TTL seconds, and the oldest ones first
+# once they take more than STORAGE_QUOTA bytes (0 for no quota)
+SESSION_TTL = float(os.getenv('SESSION_TTL', 3600))
+STORAGE_QUOTA = int(os.getenv('STORAGE_QUOTA', 800 * 1024 * 1024)) or None
+JANITOR_INTERVAL = float(os.getenv('JANITOR_INTERVAL', 60))
+# Sessions modified in the last SESSION_MIN_IDLE seconds are still being written to
+SESSION_MIN_IDLE = float(os.getenv('SESSION_MIN_IDLE', 60))
+STORAGE_JANITOR = StorageJanitor(
+    [UPLOAD_FOLDER, RESULTS_FOLDER], SESSION_TTL, STORAGE_QUOTA, JANITOR_INTERVAL,
+    min_idle=SESSION_MIN_IDLE
+)
+STORAGE_JANITOR.start()
+
+# Parsed templates reused across requests (number of template files kept),
+# with a warm instance per batch worker
+TEMPLATE_CACHE = TemplateCache(
+    int(os.getenv('TEMPLATE_CACHE_SIZE', 8)), max_idle=max(4, BATCH_WORKERS)
+)
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def parse_bool_option(value):
+    """Parse a boolean request option sent either as JSON or as a form string"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
 def cleanup_temp_files(session_id):
     """Clean up temporary files for a session"""
     try:
@@ -73,103 +137,121 @@ def cleanup_temp_files(session_id):
     except Exception as e:
         print(f"Cleanup error: {e}")
 
-def process_omr_image(image_path, template_path, output_dir):
+def process_omr_image(image_data, file_name, template_path, output_dir=None, marked_image_options=None):
     """
-    Process a single OMR image using the template
+    Process a single OMR image using the template, in memory
     
     Args:
-        image_path: Path to the image file
+        image_data: Encoded bytes of the image file
+        file_name: Name of the image file
         template_path: Path to template.json
-        output_dir: Directory for output files
+        output_dir: (optional) Directory to also save the marked image in
+        marked_image_options: (optional) MarkedImageOptions, the full image by default
         
     Returns:
         dict: Processing results including answers, score, etc.
+            The marked image is in 'marked_image_bytes', encoded as per the options
     """
-    try:
-        # Load template
-        tuning_config = CONFIG_DEFAULTS
-        local_config_path = template_path.parent / constants.CONFIG_FILENAME
-        if local_config_path.exists():
-            tuning_config = open_config_with_defaults(local_config_path)
-        
-        template = Template(template_path, tuning_config)
-        
-        # Set up output paths
-        from src.utils.file import Paths, setup_dirs_for_paths, setup_outputs_for_template
-        paths = Paths(output_dir)
-        setup_dirs_for_paths(paths)
-        outputs_namespace = setup_outputs_for_template(paths, template)
-        
-        # Read image
-        image_path = Path(image_path)
-        in_omr = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
-        
-        if in_omr is None:
-            return {
-                'success': False,
-                'error': 'Failed to read image'
-            }
-        
-        # Reset image saves
-        template.image_instance_ops.reset_all_save_img()
-        template.image_instance_ops.append_save_img(1, in_omr)
-        
-        # Apply preprocessors
-        in_omr = template.image_instance_ops.apply_preprocessors(
-            str(image_path), in_omr, template
-        )
-        
-        if in_omr is None:
-            return {
-                'success': False,
-                'error': 'Image preprocessing failed - markers not detected'
-            }
-        
-        # Read OMR response
-        file_id = image_path.name
-        save_dir = paths.save_marked_dir
-        
-        (
-            response_dict,
-            final_marked,
-            multi_marked,
-            _,
-        ) = template.image_instance_ops.read_omr_response(
-            template, image=in_omr, name=file_id, save_dir=save_dir
-        )
-        
-        # Get concatenated response
-        from src.utils.parsing import get_concatenated_response
-        omr_response = get_concatenated_response(response_dict, template)
-        
-        # Prepare response array
-        resp_array = []
-        for k in template.output_columns:
-            resp_array.append(omr_response.get(k, '-'))
-        
-        # Save marked image
-        marked_image_path = save_dir / file_id
-        if final_marked is not None:
-            cv2.imwrite(str(marked_image_path), final_marked)
-        
-        return {
-            'success': True,
-            'file_name': file_id,
-            'answers': omr_response,
-            'answers_array': resp_array,
-            'multi_marked_count': multi_marked,
-            'marked_image_path': str(marked_image_path),
-            'output_columns': template.output_columns,
-            'total_questions': len([k for k in omr_response.keys() if k.startswith('Q')])
-        }
+    return process_image_data(
+        TEMPLATE_CACHE, image_data, file_name, template_path, output_dir, marked_image_options
+    )
+
+def parse_marked_image_options(options, responses_only=False):
+    """
+    Parse the marked image options of a request (form or JSON)
+    
+        - marked_image: full (default), thumbnail, url (to /api/marked-image) or none
+        - marked_image_max_edge: longest edge of the thumbnails, in pixels
+        - marked_image_format: jpeg, webp or png, defaults to the format of the upload
+        - marked_image_quality: 1-100, for jpeg and webp
         
-    except Exception as e:
-        import traceback
-        return {
+    Requests for responses only get no marked image. Raises ValueError for invalid options.
+    """
+    mode = 'none' if responses_only else str(options.get('marked_image') or 'full').lower()
+    image_format = options.get('marked_image_format')
+    if image_format:
+        image_format = str(image_format).lower()
+        image_format = 'jpeg' if image_format == 'jpg' else image_format
+    try:
+        max_edge = int(options.get('marked_image_max_edge') or THUMBNAIL_MAX_EDGE)
+        quality = options.get('marked_image_quality')
+        quality = int(quality) if quality not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError('Invalid marked_image_max_edge or marked_image_quality, expected integers')
+    return MarkedImageOptions(mode, max_edge, image_format or None, quality)
+
+def get_marked_image_url(marked_image_path):
+    """URL of a marked image saved in a session folder"""
+    marked_image_path = Path(marked_image_path)
+    session_id = marked_image_path.parent.parent.name
+    return f'/api/marked-image/{session_id}/{marked_image_path.name}'
+
+def respond_with_processed_image(image_data, filename, persist, marked_image_options):
+    """
+    Process an uploaded image and build the response of the process endpoints.
+    The upload and the marked image are saved in the session folders only when persisting,
+    the marked image also in the url mode.
+    """
+    session_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    filename = secure_filename(filename or '') or f"omr_{session_id}.jpg"
+    
+    # Get template path
+    template_path = Path('inputs') / 'template.json'
+    if not template_path.exists():
+        return jsonify({
             'success': False,
-            'error': str(e),
-            'traceback': traceback.format_exc()
-        }
+            'error': f'Template not found: {template_path}'
+        }), 404
+    
+    session_result_dir = None
+    if persist:
+        session_upload_dir = UPLOAD_FOLDER / session_id
+        session_upload_dir.mkdir(parents=True, exist_ok=True)
+        (session_upload_dir / filename).write_bytes(image_data)
+    if persist or marked_image_options.mode == 'url':
+        session_result_dir = RESULTS_FOLDER / session_id
+        session_result_dir.mkdir(parents=True, exist_ok=True)
+    
+    # Process the image
+    result = process_omr_image(
+        image_data, filename, template_path, session_result_dir, marked_image_options
+    )
+    
+    if not result['success']:
+        if session_result_dir is not None:
+            cleanup_temp_files(session_id)
+        return jsonify(result), 400
+    if session_result_dir is not None:
+        STORAGE_JANITOR.register(session_id)
+    
+    # Encode marked image to base64, unless only its url is asked for
+    marked_image_base64 = None
+    if result['marked_image_bytes'] is not None and marked_image_options.mode != 'url':
+        marked_image_base64 = base64.b64encode(result['marked_image_bytes']).decode('utf-8')
+    marked_image_url = None
+    if result['marked_image_path'] is not None:
+        marked_image_url = get_marked_image_url(result['marked_image_path'])
+    
+    # Prepare response
+    response_data = {
+        'success': True,
+        'session_id': session_id,
+        'persisted': persist,
+        'file_name': result['file_name'],
+        'answers': result['answers'],
+        'answers_array': result['answers_array'],
+        'score': result['score'],
+        'output_columns': result['output_columns'],
+        'total_questions': result['total_questions'],
+        'multi_marked_count': result['multi_marked_count'],
+        'thresholds': result['thresholds'],
+        'marked_image': marked_image_base64,
+        'marked_image_url': marked_image_url,
+        'marked_image_format': result['marked_image_format'],
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    return jsonify(response_data), 200
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -189,12 +271,23 @@ def process_image():
     Request:
         - file: Image file (multipart/form-data)
         - template: (optional) Template ID, defaults to 'dxuian'
+        - responses_only: (optional) 'true' to skip rendering the marked image
+        - persist: (optional) 'true' to save the upload and marked image on disk
+          (served by /api/marked-image), defaults to PERSIST_UPLOADS
+        - marked_image: (optional) full (default), thumbnail, url or none
+        - marked_image_max_edge: (optional) longest edge of the thumbnail, defaults to 800
+        - marked_image_format: (optional) jpeg, webp or png, defaults to the upload's
+        - marked_image_quality: (optional) 1-100, for jpeg and webp
         
     Response:
         - success: bool
         - file_name: str
         - answers: dict of question -> answer
-        - marked_image: base64 encoded marked image
+        - score: score from the template's evaluation.json (null without one)
+        - thresholds: global and per question strip thresholds
+        - marked_image: base64 encoded marked image (null in the url and none modes)
+        - marked_image_url: url of the saved marked image (null unless saved)
+        - marked_image_format: jpeg, webp or png (null without a marked image)
         - total_questions: int
     """
     try:
@@ -221,64 +314,22 @@ def process_image():
         
         # Get template ID (default to 'dxuian')
         template_id = request.form.get('template', 'dxuian')
-        
-        # Create session directory
-        session_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-        session_upload_dir = UPLOAD_FOLDER / session_id
-        session_result_dir = RESULTS_FOLDER / session_id
-        session_upload_dir.mkdir(parents=True, exist_ok=True)
-        session_result_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        if not filename:
-            filename = f"omr_{session_id}.jpg"
-        
-        upload_path = session_upload_dir / filename
-        file.save(str(upload_path))
-        
-        # Get template path
-        template_path = Path('inputs') / 'template.json'
-        if not template_path.exists():
-            cleanup_temp_files(session_id)
+        responses_only = parse_bool_option(request.form.get('responses_only'))
+        persist = parse_bool_option(request.form.get('persist', PERSIST_UPLOADS))
+        try:
+            marked_image_options = parse_marked_image_options(request.form, responses_only)
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'error': f'Template not found: {template_path}'
-            }), 404
-        
-        # Process the image
-        result = process_omr_image(upload_path, template_path, session_result_dir)
-        
-        if not result['success']:
-            cleanup_temp_files(session_id)
-            return jsonify(result), 400
-        
-        # Encode marked image to base64
-        marked_image_path = Path(result['marked_image_path'])
-        marked_image_base64 = None
-        
-        if marked_image_path.exists():
-            with open(marked_image_path, 'rb') as img_file:
-                marked_image_base64 = base64.b64encode(img_file.read()).decode('utf-8')
-        
-        # Prepare response
-        response_data = {
-            'success': True,
-            'session_id': session_id,
-            'file_name': result['file_name'],
-            'answers': result['answers'],
-            'answers_array': result['answers_array'],
-            'output_columns': result['output_columns'],
-            'total_questions': result['total_questions'],
-            'multi_marked_count': result['multi_marked_count'],
-            'marked_image': marked_image_base64,
-            'timestamp': datetime.now().isoformat()
-        }
+                'error': str(e)
+            }), 400
         
-        # Clean up temporary files after a delay (or you can keep them)
-        # cleanup_temp_files(session_id)
+        # Read the upload in memory
+        image_data = file.read()
         
-        return jsonify(response_data), 200
+        return respond_with_processed_image(
+            image_data, file.filename, persist, marked_image_options
+        )
         
     except Exception as e:
         import traceback
@@ -297,6 +348,10 @@ def process_image_base64():
         - image: base64 encoded image
         - filename: (optional) original filename
         - template: (optional) Template ID
+        - responses_only: (optional) true to skip rendering the marked image
+        - persist: (optional) true to save the upload and marked image on disk
+        - marked_image, marked_image_max_edge, marked_image_format,
+          marked_image_quality: (optional) as in /api/process
         
     Response: Same as /api/process
     """
@@ -318,62 +373,344 @@ def process_image_base64():
                 'error': f'Invalid base64 image: {str(e)}'
             }), 400
         
-        # Create session directory
-        session_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-        session_upload_dir = UPLOAD_FOLDER / session_id
-        session_result_dir = RESULTS_FOLDER / session_id
-        session_upload_dir.mkdir(parents=True, exist_ok=True)
-        session_result_dir.mkdir(parents=True, exist_ok=True)
+        responses_only = parse_bool_option(data.get('responses_only'))
+        persist = parse_bool_option(data.get('persist', PERSIST_UPLOADS))
+        try:
+            marked_image_options = parse_marked_image_options(data, responses_only)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
+        # Get template ID
+        template_id = data.get('template', 'dxuian')
         
-        # Save image
-        filename = data.get('filename', f'omr_{session_id}.jpg')
-        filename = secure_filename(filename)
-        upload_path = session_upload_dir / filename
+        return respond_with_processed_image(
+            image_data, data.get('filename'), persist, marked_image_options
+        )
+        
+    except Exception as e:
+        import traceback
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+def stream_batch_results(sheets, template_path, marked_image_options, batch_id):
+    """
+    Process the sheets on the batch workers, yielding an NDJSON line per sheet as it
+    completes (in any order, with its index in the request), then a summary line.
+    In the url mode, the marked image of each sheet is saved in its own session folder.
+    """
+    started = time.perf_counter()
+    futures = {}
+    rejected_lines = []
+    for index, (filename, image_data, error) in enumerate(sheets):
+        if error is not None:
+            rejected_lines.append({
+                'type': 'sheet',
+                'index': index,
+                'file_name': filename,
+                'success': False,
+                'error': error,
+            })
+            continue
+        output_dir = None
+        if marked_image_options.mode == 'url':
+            output_dir = RESULTS_FOLDER / f'{batch_id}_{index + 1}'
+        future = BATCH_EXECUTOR.submit(
+            process_omr_image, image_data, filename, template_path, output_dir, marked_image_options
+        )
+        futures[future] = (index, filename)
+    
+    succeeded, scores = 0, []
+    try:
+        for line in rejected_lines:
+            yield json.dumps(line) + '\n'
+        
+        for future in as_completed(futures):
+            index, filename = futures[future]
+            result = future.result()
+            line = {
+                'type': 'sheet',
+                'index': index,
+                'file_name': filename,
+                'success': result['success'],
+            }
+            if result['success']:
+                succeeded += 1
+                if result['marked_image_path'] is not None:
+                    STORAGE_JANITOR.register(f'{batch_id}_{index + 1}')
+                if result['score'] is not None:
+                    scores.append(result['score'])
+                marked_image_base64 = None
+                if result['marked_image_bytes'] is not None and marked_image_options.mode != 'url':
+                    marked_image_base64 = base64.b64encode(result['marked_image_bytes']).decode('utf-8')
+                marked_image_url = None
+                if result['marked_image_path'] is not None:
+                    marked_image_url = get_marked_image_url(result['marked_image_path'])
+                line.update({
+                    'answers': result['answers'],
+                    'answers_array': result['answers_array'],
+                    'score': result['score'],
+                    'multi_marked_count': result['multi_marked_count'],
+                    'marked_image': marked_image_base64,
+                    'marked_image_url': marked_image_url,
+                    'marked_image_format': result['marked_image_format'],
+                })
+            else:
+                line['error'] = result['error']
+            yield json.dumps(line) + '\n'
+    finally:
+        # Stop the pending sheets when the client goes away
+        for future in futures:
+            future.cancel()
+    
+    yield json.dumps({
+        'type': 'summary',
+        'total': len(sheets),
+        'succeeded': succeeded,
+        'failed': len(sheets) - succeeded,
+        'scores': {
+            'count': len(scores),
+            'mean': sum(scores) / len(scores),
+            'min': min(scores),
+            'max': max(scores),
+        } if scores else None,
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+        'timestamp': datetime.now().isoformat()
+    }) + '\n'
+
+@app.route('/api/process-batch', methods=['POST'])
+def process_batch():
+    """
+    Process a set of OMR images concurrently, streaming the results
+    
+    Request (multipart/form-data):
+        - files: Image files
+        - responses_only: (optional) 'false' to render the marked images, defaults to
+          'true' unless a marked_image mode is given
+        - marked_image, marked_image_max_edge, marked_image_format,
+          marked_image_quality: (optional) as in /api/process
+    Request JSON:
+        - images: list of {image: base64 encoded image, filename: (optional) str}
+        - responses_only, marked_image...: (optional) as above
+        
+    Response (application/x-ndjson), one JSON object per line:
+        - per sheet, as each one completes: type 'sheet', index (in the request),
+          file_name, success, answers, answers_array, score, multi_marked_count,
+          marked_image, marked_image_url, marked_image_format, or error
+        - last: type 'summary', total, succeeded, failed, scores (count, mean, min, max)
+    """
+    try:
+        # A class set of photos is larger than a single upload
+        request.max_content_length = MAX_BATCH_CONTENT_LENGTH
+        
+        sheets = []
+        if request.is_json:
+            data = request.get_json()
+            images = data.get('images') if isinstance(data, dict) else None
+            if not isinstance(images, list):
+                return jsonify({
+                    'success': False,
+                    'error': 'No images provided'
+                }), 400
+            options = data
+            for index, item in enumerate(images):
+                filename = secure_filename(str(item.get('filename') or '')) or f'omr_{index + 1}.jpg'
+                try:
+                    sheets.append((filename, base64.b64decode(item['image']), None))
+                except Exception as e:
+                    sheets.append((filename, None, f'Invalid base64 image: {str(e)}'))
+        else:
+            files = request.files.getlist('files')
+            if not files:
+                return jsonify({
+                    'success': False,
+                    'error': 'No files provided'
+                }), 400
+            options = request.form
+            for index, file in enumerate(files):
+                filename = secure_filename(file.filename or '') or f'omr_{index + 1}.jpg'
+                if not allowed_file(filename):
+                    sheets.append((filename, None, 'Invalid file type. Allowed: png, jpg, jpeg'))
+                else:
+                    sheets.append((filename, file.read(), None))
+        
+        if len(sheets) > MAX_BATCH_FILES:
+            return jsonify({
+                'success': False,
+                'error': f'Too many images: {len(sheets)}, the limit is {MAX_BATCH_FILES}'
+            }), 400
         
-        with open(upload_path, 'wb') as f:
-            f.write(image_data)
+        # No marked images unless asked for
+        responses_only = parse_bool_option(
+            options.get('responses_only', 'marked_image' not in options)
+        )
+        try:
+            marked_image_options = parse_marked_image_options(options, responses_only)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        batch_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
         
         # Get template path
-        template_id = data.get('template', 'dxuian')
         template_path = Path('inputs') / 'template.json'
-        
         if not template_path.exists():
-            cleanup_temp_files(session_id)
             return jsonify({
                 'success': False,
                 'error': f'Template not found: {template_path}'
             }), 404
         
-        # Process the image
-        result = process_omr_image(upload_path, template_path, session_result_dir)
+        return Response(
+            stream_batch_results(sheets, template_path, marked_image_options, batch_id),
+            mimetype='application/x-ndjson'
+        )
         
-        if not result['success']:
-            cleanup_temp_files(session_id)
-            return jsonify(result), 400
+    except Exception as e:
+        import traceback
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+def register_job_session(options, result):
+    """Index the session folder a job worker saved its marked image in"""
+    if options.get('output_dir'):
+        STORAGE_JANITOR.register(Path(options['output_dir']).name)
+
+def get_job_runner():
+    """The job runner of this server process, started on the first job request"""
+    global JOB_RUNNER
+    with JOB_RUNNER_LOCK:
+        if JOB_RUNNER is None:
+            if JOB_QUEUE_BACKEND == 'sqlite':
+                job_queue = SQLiteJobQueue(
+                    JOB_QUEUE_MAX_DEPTH, JOB_QUEUE_PATH, lease_seconds=JOB_LEASE_SECONDS
+                )
+            else:
+                job_queue = JOB_QUEUE_BACKENDS[JOB_QUEUE_BACKEND](
+                    JOB_QUEUE_MAX_DEPTH, lease_seconds=JOB_LEASE_SECONDS
+                )
+            JOB_RUNNER = JobRunner(job_queue, JOB_WORKERS, on_finished=register_job_session)
+        return JOB_RUNNER
+
+def get_job_urls(job_id):
+    return {
+        'status_url': f'/api/jobs/{job_id}',
+        'result_url': f'/api/jobs/{job_id}/result',
+    }
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue an OMR image for processing in the background
+    
+    Request: an image as in /api/process (multipart 'file') or /api/process-base64 (JSON 'image')
+        - responses_only: (optional) true to skip rendering the marked image
+        - marked_image, marked_image_max_edge, marked_image_format,
+          marked_image_quality: (optional) as in /api/process
+        - ttl: (optional) seconds to keep the job and its result, positive, up to JOB_MAX_TTL
+        
+    Response (202):
+        - job_id: str
+        - status: 'queued'
+        - status_url, result_url: str
+    Response (429) when the queue is full, with a Retry-After header
+    """
+    try:
+        if request.is_json:
+            data = request.get_json() or {}
+            if 'image' not in data:
+                return jsonify({
+                    'success': False,
+                    'error': 'No image data provided'
+                }), 400
+            try:
+                image_data = base64.b64decode(data['image'])
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid base64 image: {str(e)}'
+                }), 400
+            filename = data.get('filename')
+            options = data
+        else:
+            file = request.files.get('file')
+            if file is None or file.filename == '':
+                return jsonify({
+                    'success': False,
+                    'error': 'No file provided'
+                }), 400
+            if not allowed_file(file.filename):
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid file type. Allowed: png, jpg, jpeg'
+                }), 400
+            image_data = file.read()
+            filename = file.filename
+            options = request.form
         
-        # Encode marked image to base64
-        marked_image_path = Path(result['marked_image_path'])
-        marked_image_base64 = None
+        try:
+            ttl = float(options.get('ttl', JOB_TTL))
+            # Jobs expiring at once (or never, for nan) would hold a backlog slot
+            if not math.isfinite(ttl) or ttl <= 0:
+                raise ValueError(ttl)
+            ttl = min(ttl, JOB_MAX_TTL)
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid ttl, expected a positive number of seconds'
+            }), 400
+        try:
+            responses_only = parse_bool_option(options.get('responses_only'))
+            marked_image_options = parse_marked_image_options(options, responses_only)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
-        if marked_image_path.exists():
-            with open(marked_image_path, 'rb') as img_file:
-                marked_image_base64 = base64.b64encode(img_file.read()).decode('utf-8')
+        # Get template path
+        template_path = Path('inputs') / 'template.json'
+        if not template_path.exists():
+            return jsonify({
+                'success': False,
+                'error': f'Template not found: {template_path}'
+            }), 404
         
-        # Prepare response
-        response_data = {
-            'success': True,
-            'session_id': session_id,
-            'file_name': result['file_name'],
-            'answers': result['answers'],
-            'answers_array': result['answers_array'],
-            'output_columns': result['output_columns'],
-            'total_questions': result['total_questions'],
-            'multi_marked_count': result['multi_marked_count'],
-            'marked_image': marked_image_base64,
-            'timestamp': datetime.now().isoformat()
+        job_runner = get_job_runner()
+        job_options = {
+            'file_name': secure_filename(filename or '') or 'omr.jpg',
+            'template_path': str(template_path.resolve()),
+            'marked_image': asdict(marked_image_options),
         }
+        if marked_image_options.mode == 'url':
+            session_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+            job_options['output_dir'] = str((RESULTS_FOLDER / session_id).resolve())
+        try:
+            job_id = job_runner.queue.submit(job_options, image_data, ttl)
+        except QueueFullError as e:
+            retry_after = job_runner.get_retry_after()
+            response = jsonify({
+                'success': False,
+                'error': str(e),
+                'retry_after': retry_after
+            })
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
         
-        return jsonify(response_data), 200
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': QUEUED,
+            **get_job_urls(job_id)
+        }), 202
         
     except Exception as e:
         import traceback
@@ -383,6 +720,61 @@ def process_image_base64():
             'traceback': traceback.format_exc()
         }), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Get the status of a job: queued, running, done, failed or cancelled"""
+    job = get_job_runner().queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found or expired'
+        }), 404
+    return jsonify({'success': True, **job, **get_job_urls(job_id)}), 200
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """
+    Get the result of a finished job, same as the response of /api/process
+    202 (with Retry-After) while the job is pending, 409 when it was cancelled
+    """
+    job_runner = get_job_runner()
+    job = job_runner.queue.get(job_id, with_result=True)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found or expired'
+        }), 404
+    
+    result = job.pop('result')
+    if job['status'] in (QUEUED, RUNNING):
+        response = jsonify({'success': True, **job, **get_job_urls(job_id)})
+        response.headers['Retry-After'] = str(job_runner.get_retry_after())
+        return response, 202
+    if job['status'] == CANCELLED:
+        return jsonify({
+            'success': False,
+            'error': 'Job was cancelled',
+            **job
+        }), 409
+    
+    # The saved marked image is served by /api/marked-image
+    marked_image_path = result.pop('marked_image_path', None)
+    result['marked_image_url'] = marked_image_path and get_marked_image_url(marked_image_path)
+    return jsonify({**result, **job}), 200
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job (the result of a running job is discarded)"""
+    job_queue = get_job_runner().queue
+    cancelled = job_queue.cancel(job_id)
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found or expired'
+        }), 404
+    return jsonify({'success': True, 'cancelled': cancelled, **job}), 200
+
 @app.route('/api/templates', methods=['GET'])
 def get_templates():
     """Get list of available templates"""
@@ -416,11 +808,45 @@ def get_templates():
             'error': str(e)
         }), 500
 
+@app.route('/api/templates/cache', methods=['GET'])
+def get_template_cache():
+    """Get the templates loaded in the template cache"""
+    return jsonify({
+        'success': True,
+        'cache': TEMPLATE_CACHE.get_stats()
+    }), 200
+
+@app.route('/api/templates/cache/invalidate', methods=['POST'])
+def invalidate_template_cache():
+    """
+    Drop cached templates, to reload them on the next request
+    
+    Request JSON:
+        - template: (optional) path of the template.json, defaults to all templates
+    """
+    data = request.get_json(silent=True) or {}
+    template_path = data.get('template')
+    invalidated = TEMPLATE_CACHE.invalidate(template_path)
+    return jsonify({
+        'success': True,
+        'invalidated': invalidated,
+        'cache': TEMPLATE_CACHE.get_stats()
+    }), 200
+
+@app.route('/api/storage', methods=['GET'])
+def get_storage():
+    """Get the session folders usage and the actions of the storage janitor"""
+    return jsonify({
+        'success': True,
+        'storage': STORAGE_JANITOR.get_stats()
+    }), 200
+
 @app.route('/api/marked-image/<session_id>/<filename>', methods=['GET'])
 def get_marked_image(session_id, filename):
     """Get marked image file"""
     try:
-        image_path = RESULTS_FOLDER / session_id / 'CheckedOMRs' / filename
+        # Resolved, as send_file takes relative paths from the app root, not the cwd
+        image_path = (RESULTS_FOLDER / secure_filename(session_id) / 'CheckedOMRs' / secure_filename(filename)).resolve()
         
         if not image_path.exists():
             return jsonify({
@@ -428,7 +854,8 @@ def get_marked_image(session_id, filename):
                 'error': 'Image not found'
             }), 404
         
-        return send_file(str(image_path), mimetype='image/jpeg')
+        mimetype = mimetypes.guess_type(image_path.name)[0] or 'image/jpeg'
+        return send_file(str(image_path), mimetype=mimetype)
         
     except Exception as e:
         return jsonify({
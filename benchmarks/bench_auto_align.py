@@ -0,0 +1,128 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+ Benchmark of the auto-align morphology: page-wide vs field block border bands.
+ Usage: python benchmarks/bench_auto_align.py [-t inputs/template.json] [-i image]
+
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import src.utils.alignment as alignment_utils  # noqa: E402
+from src.defaults import CONFIG_DEFAULTS  # noqa: E402
+from src.template import Template  # noqa: E402
+from src.utils.image import CLAHE_HELPER, ImageUtils  # noqa: E402
+
+
+def get_page_morph_v(image, gamma_low):
+    # The page-wide morphology that auto-align used to run
+    morph = CLAHE_HELPER.apply(image)
+    morph = alignment_utils.brighten_for_morph(morph, gamma_low)
+    morph = ImageUtils.normalize_util(morph)
+    morph_v = cv2.morphologyEx(
+        morph,
+        cv2.MORPH_OPEN,
+        alignment_utils.V_KERNEL,
+        iterations=alignment_utils.OPEN_ITERATIONS,
+    )
+    _, morph_v = cv2.threshold(morph_v, 200, 200, cv2.THRESH_TRUNC)
+    morph_v = 255 - ImageUtils.normalize_util(morph_v)
+    _, morph_v = cv2.threshold(
+        morph_v, alignment_utils.MORPH_THRESHOLD, 255, cv2.THRESH_BINARY
+    )
+    return cv2.erode(
+        morph_v,
+        alignment_utils.ERODE_KERNEL,
+        iterations=alignment_utils.ERODE_ITERATIONS,
+    )
+
+
+def time_ms(funcs, repeats):
+    # Interleaved, so that all the funcs see the same machine load
+    timings = [[] for _ in funcs]
+    for _ in range(repeats):
+        for func, func_timings in zip(funcs, timings):
+            start = time.perf_counter()
+            func()
+            func_timings.append((time.perf_counter() - start) * 1000)
+    return [float(np.median(func_timings)) for func_timings in timings]
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("-t", "--template", default="inputs/template.json")
+    argparser.add_argument("-i", "--image", default="dxuian/omrcollegesheet.jpg")
+    argparser.add_argument("-n", "--repeats", type=int, default=20)
+    args = argparser.parse_args()
+
+    config = CONFIG_DEFAULTS
+    template = Template(Path(args.template), config)
+    image = cv2.imread(args.image, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise FileNotFoundError(f"Could not read image: '{args.image}'")
+    image = ImageUtils.resize_util(image, *template.page_dimensions)
+    image = ImageUtils.normalize_util(image)
+
+    compiled = template.compiled
+    alignment_params = config.alignment_params
+    rois = alignment_utils.get_border_rois(
+        compiled.block_origins,
+        compiled.block_dimensions,
+        alignment_params.match_col,
+        alignment_params.max_steps,
+        alignment_params.stride,
+        alignment_params.thickness,
+    )
+    gamma_low = config.threshold_params.GAMMA_LOW
+
+    page_morph_v = get_page_morph_v(image, gamma_low)
+    _, band_morph_v = alignment_utils.get_border_morphs(image, rois, gamma_low)
+    mismatches = 0
+    for roi in rois:
+        x0, y0, x1, y1 = alignment_utils.clip_roi(roi, image.shape)
+        mismatches += np.count_nonzero(
+            page_morph_v[y0:y1, x0:x1] != band_morph_v[y0:y1, x0:x1]
+        )
+
+    # Both pipelines start with the same page-wide clahe and opening
+    page_ms, band_ms, shared_ms = time_ms(
+        [
+            lambda: get_page_morph_v(image, gamma_low),
+            lambda: alignment_utils.get_border_morphs(image, rois, gamma_low),
+            lambda: cv2.morphologyEx(
+                CLAHE_HELPER.apply(image),
+                cv2.MORPH_OPEN,
+                alignment_utils.V_KERNEL,
+                iterations=alignment_utils.OPEN_ITERATIONS,
+            ),
+        ],
+        args.repeats,
+    )
+    band_area = sum(
+        alignment_utils.get_area(alignment_utils.clip_roi(roi, image.shape))
+        for roi in rois
+    )
+    print(f"Page dimensions:\t{template.page_dimensions}")
+    print(f"Border bands:\t\t{len(rois)} ({band_area / image.size:.1%} of the page)")
+    print(f"Page-wide morphology:\t{page_ms:.2f} ms")
+    print(f"Border band morphology:\t{band_ms:.2f} ms ({page_ms / band_ms:.2f}x)")
+    print(
+        f"Restricted stages:\t{page_ms - shared_ms:.2f} ms -> {band_ms - shared_ms:.2f} ms"
+        f" (page-wide clahe and opening: {shared_ms:.2f} ms)"
+    )
+    print(f"Mismatched band pixels:\t{mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+ Benchmark of each stage of the pipeline on the sample sets and synthetic large
+ templates, with a gate against a saved baseline.
+ Usage: python benchmarks/bench_pipeline.py [-i samples] [--save-baseline baseline.json]
+        python benchmarks/bench_pipeline.py --baseline baseline.json [--tolerance 0.25]
+
+"""
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src import constants  # noqa: E402
+from src.defaults import CONFIG_DEFAULTS  # noqa: E402
+from src.evaluation import evaluate_concatenated_response  # noqa: E402
+from src.logger import console, logger  # noqa: E402
+from src.planner import DirectoryContext, plan_dir  # noqa: E402
+from src.template import Template  # noqa: E402
+from src.utils.decode import get_decode_size  # noqa: E402
+from src.utils.file import ResultsSink  # noqa: E402
+from src.utils.image import ImageUtils  # noqa: E402
+from src.utils.parsing import get_concatenated_response  # noqa: E402
+from src.utils.sampling import get_box_means, get_integral_image  # noqa: E402
+from src.utils.sources import read_sheet  # noqa: E402
+from src.utils.synthetic import SheetGenerator, SyntheticOptions  # noqa: E402
+
+# Parts of the detection stage, timed separately as well
+DETECTION_PARTS = ("sampling", "thresholding")
+
+
+class StageTimer:
+    """Durations (in ms) of each stage, and of each sheet as a whole"""
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.sheet_duration = 0
+
+    @contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        yield
+        duration = (time.perf_counter() - start) * 1000
+        self.durations[stage].append(duration)
+        if stage not in DETECTION_PARTS:
+            self.sheet_duration += duration
+
+    @contextmanager
+    def sheet(self):
+        self.sheet_duration = 0
+        yield
+        self.durations["sheet"].append(self.sheet_duration)
+
+
+def get_stage_stats(durations):
+    durations = np.array(durations)
+    return {
+        "calls": len(durations),
+        "p50_ms": round(float(np.percentile(durations, 50)), 3),
+        "p95_ms": round(float(np.percentile(durations, 95)), 3),
+        # Calls per second of the stage alone
+        "throughput": round(
+            float(1000 * len(durations) / max(durations.sum(), 1e-9)), 2
+        ),
+    }
+
+
+def run_sheet(timer, file_path, context, results_sink, evaluation_dir):
+    template, tuning_config = context.template, context.tuning_config
+    image_instance_ops = template.image_instance_ops
+    with timer.sheet():
+        with timer("decode"):
+            image = read_sheet(file_path, get_decode_size(tuning_config))
+        if image is None:
+            return False
+        with timer("resize"):
+            image = ImageUtils.resize_util(
+                image,
+                tuning_config.dimensions.processing_width,
+                tuning_config.dimensions.processing_height,
+            )
+        for pre_processor in template.pre_processors:
+            with timer(f"preprocess:{pre_processor.__class__.__name__}"):
+                image = pre_processor.apply_filter(image, file_path)
+            if image is None:
+                return False
+
+        compiled = template.compiled
+        with timer("sampling"):
+            img = ImageUtils.resize_util(image, *template.page_dimensions)
+            ImageUtils.normalize_util(img, out=img)
+            q_vals = get_box_means(
+                get_integral_image(img),
+                compiled.get_shifted_xs(template.get_block_shifts()),
+                compiled.bubble_ys,
+                compiled.bubble_box_ws,
+                compiled.bubble_box_hs,
+            )
+        with timer("thresholding"):
+            image_instance_ops.get_sheet_thresholds(q_vals, template)
+        with timer("detection"):
+            detection = image_instance_ops.detect_omr_response(
+                template, image, file_path.name, responses_only=True
+            )
+        omr_response = get_concatenated_response(detection.omr_response, template)
+
+        score = 0
+        if context.evaluation_config is not None:
+            with timer("evaluation"):
+                score = evaluate_concatenated_response(
+                    omr_response, context.evaluation_config, file_path, evaluation_dir
+                )
+        with timer("output"):
+            results_sink.write_row(
+                "Results",
+                [file_path.name, file_path, file_path, score]
+                + [omr_response[column] for column in template.output_columns],
+            )
+    return True
+
+
+def run_set(set_name, omr_files, context, repeats, output_dir):
+    timer = StageTimer()
+    set_dir = Path(output_dir, set_name.replace("/", "_"))
+    set_dir.mkdir(parents=True)
+    results_path = set_dir / "Results.csv"
+    results_sink = ResultsSink({"Results": results_path})
+    failed = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for file_path in omr_files:
+            if not run_sheet(timer, file_path, context, results_sink, set_dir):
+                failed += 1
+    with timer("output"):
+        results_sink.close()
+    elapsed = time.perf_counter() - start
+    stages = {
+        stage: get_stage_stats(durations)
+        for stage, durations in timer.durations.items()
+    }
+    return {
+        "sheets": len(omr_files) * repeats,
+        "failed": failed,
+        "sheets_per_second": round(len(omr_files) * repeats / elapsed, 2),
+        "stages": stages,
+    }
+
+
+def write_synthetic_set(set_dir, questions, sheets, seed=0):
+    """A template of `questions` 4-option MCQs in blocks of 50, with filled sheets"""
+    set_dir.mkdir(parents=True)
+    block_count = -(-questions // 50)
+    page_width, page_height = 200 + 220 * block_count, 1700
+    field_blocks = {}
+    for block_no in range(block_count):
+        first, last = block_no * 50 + 1, min(questions, block_no * 50 + 50)
+        field_blocks[f"MCQ_Block_{block_no + 1}"] = {
+            "fieldType": "QTYPE_MCQ4",
+            "origin": [100 + 220 * block_no, 100],
+            "fieldLabels": [f"q{first}..{last}"],
+            "bubblesGap": 40,
+            "labelsGap": 30,
+        }
+    template_json = {
+        "pageDimensions": [page_width, page_height],
+        "bubbleDimensions": [24, 24],
+        "fieldBlocks": field_blocks,
+    }
+    config_json = {
+        "dimensions": {"processing_width": page_width, "processing_height": page_height}
+    }
+    for file_name, content in [
+        ("template.json", template_json),
+        ("config.json", config_json),
+    ]:
+        with open(set_dir / file_name, "w") as file:
+            json.dump(content, file)
+
+    template = Template(set_dir / "template.json", CONFIG_DEFAULTS)
+    options = SyntheticOptions(blank_rate=0, noise_std=6)
+    SheetGenerator(template, options, seed).generate(set_dir, sheets)
+
+
+def get_regressions(results, baseline, tolerance, min_ms):
+    """The (set, stage) p50 latencies slower than the baseline beyond the tolerance"""
+    regressions = []
+    for set_name, base_set in baseline["sets"].items():
+        current_set = results["sets"].get(set_name)
+        if current_set is None:
+            continue
+        for stage, base_stats in base_set["stages"].items():
+            stats = current_set["stages"].get(stage)
+            if stats is None:
+                continue
+            limit = base_stats["p50_ms"] * (1 + tolerance) + min_ms
+            if stats["p50_ms"] > limit:
+                regressions.append(
+                    f"{set_name} / {stage}: p50 {stats['p50_ms']:.2f} ms > {limit:.2f} ms (baseline {base_stats['p50_ms']:.2f} ms)"
+                )
+    return regressions
+
+
+def print_results(results):
+    for set_name, reason in results["skipped"].items():
+        print(f"Skipped {set_name}: {reason}")
+    for set_name, set_results in results["sets"].items():
+        print(
+            f"\n{set_name}: {set_results['sheets']} sheets, {set_results['sheets_per_second']} sheets/s"
+            + (f", {set_results['failed']} failed" if set_results["failed"] else "")
+        )
+        print(f"  {'stage':<32}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'calls/s':>10}")
+        for stage, stats in set_results["stages"].items():
+            print(
+                f"  {stage:<32}{stats['calls']:>7}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['throughput']:>10.1f}"
+            )
+
+
+def find_template_dirs(input_dir):
+    """The top-most directories with a template, each one a set of samples"""
+    if Path(input_dir, constants.TEMPLATE_FILENAME).exists():
+        return [input_dir]
+    return [
+        template_dir
+        for subdir in sorted(input_dir.iterdir())
+        if subdir.is_dir()
+        for template_dir in find_template_dirs(subdir)
+    ]
+
+
+def run_benchmarks(input_dirs, synthetic_questions, synthetic_sheets, repeats):
+    results = {"repeats": repeats, "sets": {}, "skipped": {}}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        works = []
+        for input_dir in input_dirs:
+            input_dir = Path(input_dir)
+            for template_dir in find_template_dirs(input_dir):
+                set_name = template_dir.relative_to(input_dir.parent).as_posix()
+                try:
+                    for work in plan_dir(template_dir, False, DirectoryContext()):
+                        work_name = work.curr_dir.relative_to(input_dir.parent)
+                        works.append(
+                            (work_name.as_posix(), work.omr_files, work.context)
+                        )
+                except (Exception, SystemExit) as e:
+                    # e.g. a sample with a missing marker image (which exits)
+                    results["skipped"][set_name] = repr(e)
+        for questions in synthetic_questions:
+            synthetic_dir = Path(temp_dir, "inputs", f"synthetic-{questions}")
+            write_synthetic_set(synthetic_dir, questions, synthetic_sheets)
+            for work in plan_dir(synthetic_dir, False, DirectoryContext()):
+                works.append((synthetic_dir.name, work.omr_files, work.context))
+
+        for set_name, omr_files, context in works:
+            results["sets"][set_name] = run_set(
+                set_name, omr_files, context, repeats, Path(temp_dir, "outputs")
+            )
+    return results
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("-i", "--inputs", nargs="*", default=["samples"])
+    argparser.add_argument(
+        "-s",
+        "--synthetic",
+        nargs="*",
+        type=int,
+        default=[200, 1000],
+        help="Question counts of the synthetic templates",
+    )
+    argparser.add_argument("--synthetic-sheets", type=int, default=5)
+    argparser.add_argument("-n", "--repeats", type=int, default=3)
+    argparser.add_argument("--save-baseline", help="Save the results as a baseline")
+    argparser.add_argument("--baseline", help="Fail on regressions from a baseline")
+    argparser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative slowdown of the p50 latencies",
+    )
+    argparser.add_argument(
+        "--min-ms",
+        type=float,
+        default=0.5,
+        help="Allowed absolute slowdown, for the timer noise of the fast stages",
+    )
+    args = argparser.parse_args()
+
+    # Only the timings are printed
+    logger.log.setLevel(logging.WARNING)
+    console.quiet = True
+
+    results = run_benchmarks(
+        args.inputs, args.synthetic, args.synthetic_sheets, args.repeats
+    )
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nSaved the baseline to '{args.save_baseline}'")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = get_regressions(results, baseline, args.tolerance, args.min_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) from '{args.baseline}':")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions from '{args.baseline}'")
+
+
+if __name__ == "__main__":
+    main()
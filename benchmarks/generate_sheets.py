@@ -0,0 +1,105 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+ Generates filled sheets of a template, with their ground truth, for load and
+ accuracy testing. The output directory can be run as an input directory.
+ Usage: python benchmarks/generate_sheets.py -t samples/sample1 -o inputs/synthetic [-n 100]
+        python benchmarks/generate_sheets.py -t samples/sample1 -o inputs/hard --rotation 2 --blur 1
+
+"""
+import argparse
+import json
+import shutil
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.constants import CONFIG_FILENAME, TEMPLATE_FILENAME  # noqa: E402
+from src.defaults import CONFIG_DEFAULTS  # noqa: E402
+from src.template import Template  # noqa: E402
+from src.utils.parsing import open_config_with_defaults  # noqa: E402
+from src.utils.synthetic import SheetGenerator, SyntheticOptions  # noqa: E402
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "-t",
+        "--template-dir",
+        required=True,
+        help="Directory of the template.json (and its config.json and marker)",
+    )
+    argparser.add_argument("-o", "--output-dir", required=True)
+    argparser.add_argument("-n", "--count", type=int, default=20)
+    argparser.add_argument(
+        "--answers",
+        help="Json file of a list of answers per sheet, as {field label: value(s)}",
+    )
+    argparser.add_argument("--seed", type=int, default=None)
+    argparser.add_argument("--blank-rate", type=float, default=0.05)
+    argparser.add_argument("--multi-mark-rate", type=float, default=0.0)
+    argparser.add_argument(
+        "--min-fill",
+        type=float,
+        default=0.8,
+        help="Minimum fraction of a bubble's area filled by a mark",
+    )
+    argparser.add_argument("--noise", type=float, default=3.0)
+    argparser.add_argument("--blur", type=float, default=0.0)
+    argparser.add_argument("--rotation", type=float, default=0.0)
+    argparser.add_argument("--perspective", type=float, default=0.0)
+    argparser.add_argument("--lighting", type=float, default=0.0)
+    argparser.add_argument(
+        "--no-markers",
+        action="store_true",
+        help="Leave out the markers of CropOnMarkers",
+    )
+    args = argparser.parse_args()
+
+    template_dir, output_dir = Path(args.template_dir), Path(args.output_dir)
+    config_path = template_dir.joinpath(CONFIG_FILENAME)
+    tuning_config = CONFIG_DEFAULTS
+    if config_path.exists():
+        tuning_config = open_config_with_defaults(config_path)
+    template = Template(template_dir.joinpath(TEMPLATE_FILENAME), tuning_config)
+    options = SyntheticOptions(
+        blank_rate=args.blank_rate,
+        multi_mark_rate=args.multi_mark_rate,
+        fill_range=(args.min_fill, 1.0),
+        noise_std=args.noise,
+        blur_sigma=args.blur,
+        max_rotation=args.rotation,
+        max_perspective=args.perspective,
+        lighting=args.lighting,
+        markers=not args.no_markers,
+    )
+    generator = SheetGenerator(template, options, args.seed)
+
+    answers_list = None
+    if args.answers:
+        with open(args.answers) as file:
+            answers_list = json.load(file)
+
+    # The template files alongside the sheets, without an evaluation of random answers
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for file_path in [template.path, config_path]:
+        if file_path.exists():
+            shutil.copy(file_path, output_dir)
+    if generator.marker_processor is not None:
+        marker_path = Path(generator.marker_processor.marker_path)
+        marker_output = output_dir.joinpath(marker_path.relative_to(template_dir))
+        marker_output.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(marker_path, marker_output)
+
+    generator.generate(output_dir, args.count, answers_list)
+    count = len(answers_list) if answers_list is not None else args.count
+    print(f"Generated {count} sheets in '{output_dir}'")
+
+
+if __name__ == "__main__":
+    main()
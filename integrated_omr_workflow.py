@@ -168,15 +168,9 @@ class IntegratedOMRWorkflow:
                        self.outputs_namespace.paths.save_marked_dir / file_name, 
                        score] + resp_array
         
-        import pandas as pd
-        from csv import QUOTE_NONNUMERIC
-        pd.DataFrame(results_line, dtype=str).T.to_csv(
-            self.outputs_namespace.files_obj["Results"],
-            mode="a",
-            quoting=QUOTE_NONNUMERIC,
-            header=False,
-            index=False,
-        )
+        results_sink = self.outputs_namespace.results_sink
+        results_sink.write_row("Results", results_line)
+        results_sink.flush()
         
         print(f"✓ Results saved to: {self.outputs_namespace.files_obj['Results']}")
     
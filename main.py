@@ -69,6 +69,36 @@ def parse_args():
         run again until the template is set.",
     )
 
+    argparser.add_argument(
+        "-r",
+        "--responsesOnly",
+        required=False,
+        dest="responsesOnly",
+        action="store_true",
+        help="Only read the responses - skips drawing, showing and saving \
+        of the marked images for faster processing.",
+    )
+
+    argparser.add_argument(
+        "-w",
+        "--workers",
+        required=False,
+        default=1,
+        type=int,
+        dest="workers",
+        help="Number of worker processes to read the sheets of a directory with. \
+        Results are still written in the input order.",
+    )
+
+    argparser.add_argument(
+        "--incremental",
+        required=False,
+        dest="incremental",
+        action="store_true",
+        help="Keep a manifest of the processed sheets in the output directory, and \
+        on reruns only process the new or changed sheets.",
+    )
+
     (
         args,
         unknown,
@@ -80,6 +110,8 @@ def parse_args():
         logger.warning(f"\nError: Unknown arguments: {unknown}", unknown)
         argparser.print_help()
         exit(11)
+    if args["workers"] < 1:
+        argparser.error("--workers should be at least 1")
     return args
 
 
@@ -1,5 +1,4 @@
-import os
-from collections import defaultdict
+from dataclasses import dataclass
 from typing import Any
 
 import cv2
@@ -7,20 +6,44 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 import src.constants as constants
+import src.utils.alignment as alignment_utils
+import src.utils.rendering as rendering
+import src.utils.thresholding as thresholding
 from src.logger import logger
-from src.utils.image import CLAHE_HELPER, ImageUtils
+from src.utils.debug_images import DebugImageStore
+from src.utils.image import ImageUtils
 from src.utils.interaction import InteractionUtils
+from src.utils.sampling import get_box_means, get_integral_image
+
+
+@dataclass
+class OMRDetection:
+    """Outcome of reading one sheet. final_marked is None in the responses-only mode."""
+
+    omr_response: dict
+    multi_marked: bool
+    multi_roll: bool
+    global_thr: float
+    global_std_thresh: float
+    strip_thresholds: list
+    final_marked: Any = None
+    # Chosen field block shifts with their border scores, None without auto_align
+    alignment: Any = None
 
 
 class ImageInstanceOps:
     """Class to hold fine-tuned utilities for a group of images. One instance for each processing directory."""
 
-    save_img_list: Any = defaultdict(list)
-
     def __init__(self, tuning_config):
         super().__init__()
         self.tuning_config = tuning_config
         self.save_image_level = tuning_config.outputs.save_image_level
+        # Note: each instance keeps its own debug images
+        self.debug_images = DebugImageStore(
+            self.save_image_level,
+            tuning_config.dimensions,
+            tuning_config.outputs.max_debug_images_mb * 2**20,
+        )
 
     def apply_preprocessors(self, file_path, in_omr, template):
         tuning_config = self.tuning_config
@@ -36,42 +59,45 @@ class ImageInstanceOps:
             in_omr = pre_processor.apply_filter(in_omr, file_path)
         return in_omr
 
-    def read_omr_response(self, template, image, name, save_dir=None):
+    def read_omr_response(
+        self, template, image, name, save_dir=None, responses_only=False
+    ):
+        detection = self.detect_omr_response(
+            template, image, name, save_dir, responses_only
+        )
+        return (
+            detection.omr_response,
+            detection.final_marked,
+            detection.multi_marked,
+            detection.multi_roll,
+        )
+
+    def detect_omr_response(
+        self, template, image, name, save_dir=None, responses_only=False
+    ):
+        """
+        Reads the bubbles of a preprocessed sheet into an OMRDetection.
+        With responses_only, no visualization is done at all: the marked image is
+        not rendered (final_marked is None) and nothing is shown or saved.
+        """
         config = self.tuning_config
         auto_align = config.alignment_params.auto_align
+        show_image_level = 0 if responses_only else config.outputs.show_image_level
+
+        def append_save_img(key, img):
+            if not responses_only:
+                self.append_save_img(key, img)
+
         try:
-            img = image.copy()
             # origDim = img.shape[:2]
+            # Note: the resize always allocates, so the input image is left untouched
             img = ImageUtils.resize_util(
-                img, template.page_dimensions[0], template.page_dimensions[1]
+                image, template.page_dimensions[0], template.page_dimensions[1]
             )
             if img.max() > img.min():
-                img = ImageUtils.normalize_util(img)
-            # Processing copies
-            transp_layer = img.copy()
-            final_marked = img.copy()
-
-            morph = img.copy()
-            self.append_save_img(3, morph)
+                ImageUtils.normalize_util(img, out=img)
+            append_save_img(3, img)
 
-            if auto_align:
-                # Note: clahe is good for morphology, bad for thresholding
-                morph = CLAHE_HELPER.apply(morph)
-                self.append_save_img(3, morph)
-                # Remove shadows further, make columns/boxes darker (less gamma)
-                morph = ImageUtils.adjust_gamma(
-                    morph, config.threshold_params.GAMMA_LOW
-                )
-                # TODO: all numbers should come from either constants or config
-                _, morph = cv2.threshold(morph, 220, 220, cv2.THRESH_TRUNC)
-                morph = ImageUtils.normalize_util(morph)
-                self.append_save_img(3, morph)
-                if config.outputs.show_image_level >= 4:
-                    InteractionUtils.show("morph1", morph, 0, 1, config)
-
-            # Move them to data class if needed
-            # Overlay Transparencies
-            alpha = 0.65
             omr_response = {}
             multi_marked, multi_roll = 0, 0
 
@@ -79,303 +105,161 @@ class ImageInstanceOps:
             # blackVals=[0]
             # whiteVals=[255]
 
-            if config.outputs.show_image_level >= 5:
+            if show_image_level >= 5:
                 all_c_box_vals = {"int": [], "mcq": []}
                 # TODO: simplify this logic
                 q_nums = {"int": [], "mcq": []}
 
             # Find Shifts for the field_blocks --> Before calculating threshold!
+            alignment = None
             if auto_align:
-                # print("Begin Alignment")
-                # Open : erode then dilate
-                v_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 10))
-                morph_v = cv2.morphologyEx(
-                    morph, cv2.MORPH_OPEN, v_kernel, iterations=3
+                compiled = template.compiled
+                match_col, max_steps, align_stride, thk = map(
+                    config.alignment_params.get,
+                    [
+                        "match_col",
+                        "max_steps",
+                        "stride",
+                        "thickness",
+                    ],
                 )
-                _, morph_v = cv2.threshold(morph_v, 200, 200, cv2.THRESH_TRUNC)
-                morph_v = 255 - ImageUtils.normalize_util(morph_v)
-
-                if config.outputs.show_image_level >= 3:
-                    InteractionUtils.show(
-                        "morphed_vertical", morph_v, 0, 1, config=config
-                    )
+                # Only the border bands of the field blocks are read for alignment
+                border_rois = alignment_utils.get_border_rois(
+                    compiled.block_origins,
+                    compiled.block_dimensions,
+                    match_col,
+                    max_steps,
+                    align_stride,
+                    thk,
+                )
+                morph, morph_v = alignment_utils.get_border_morphs(
+                    img,
+                    border_rois,
+                    config.threshold_params.GAMMA_LOW,
+                    keep_morph=show_image_level >= 4 or self.save_image_level >= 3,
+                )
+                if morph is not None:
+                    append_save_img(3, morph)
+                    if show_image_level >= 4:
+                        InteractionUtils.show("morph1", morph, 0, 1, config)
 
-                # InteractionUtils.show("morph1",morph,0,1,config=config)
-                # InteractionUtils.show("morphed_vertical",morph_v,0,1,config=config)
-
-                self.append_save_img(3, morph_v)
-
-                morph_thr = 60  # for Mobile images, 40 for scanned Images
-                _, morph_v = cv2.threshold(morph_v, morph_thr, 255, cv2.THRESH_BINARY)
-                # kernel best tuned to 5x5 now
-                morph_v = cv2.erode(morph_v, np.ones((5, 5), np.uint8), iterations=2)
-
-                self.append_save_img(3, morph_v)
-                # h_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (10, 2))
-                # morph_h = cv2.morphologyEx(morph, cv2.MORPH_OPEN, h_kernel, iterations=3)
-                # ret, morph_h = cv2.threshold(morph_h,200,200,cv2.THRESH_TRUNC)
-                # morph_h = 255 - normalize_util(morph_h)
-                # InteractionUtils.show("morph_h",morph_h,0,1,config=config)
-                # _, morph_h = cv2.threshold(morph_h,morph_thr,255,cv2.THRESH_BINARY)
-                # morph_h = cv2.erode(morph_h,  np.ones((5,5),np.uint8), iterations = 2)
-                if config.outputs.show_image_level >= 3:
+                append_save_img(3, morph_v)
+                if show_image_level >= 3:
                     InteractionUtils.show(
                         "morph_thr_eroded", morph_v, 0, 1, config=config
                     )
 
-                self.append_save_img(6, morph_v)
+                append_save_img(6, morph_v)
 
                 # template relative alignment code
-                for field_block in template.field_blocks:
-                    s, d = field_block.origin, field_block.dimensions
-
-                    match_col, max_steps, align_stride, thk = map(
-                        config.alignment_params.get,
-                        [
-                            "match_col",
-                            "max_steps",
-                            "stride",
-                            "thickness",
-                        ],
-                    )
-                    shift, steps = 0, 0
-                    while steps < max_steps:
-                        left_mean = np.mean(
-                            morph_v[
-                                s[1] : s[1] + d[1],
-                                s[0] + shift - thk : -thk + s[0] + shift + match_col,
-                            ]
-                        )
-                        right_mean = np.mean(
-                            morph_v[
-                                s[1] : s[1] + d[1],
-                                s[0]
-                                + shift
-                                - match_col
-                                + d[0]
-                                + thk : thk
-                                + s[0]
-                                + shift
-                                + d[0],
-                            ]
-                        )
+                alignment = alignment_utils.find_field_block_shifts(
+                    morph_v,
+                    compiled.block_origins,
+                    compiled.block_dimensions,
+                    match_col,
+                    max_steps,
+                    align_stride,
+                    thk,
+                )
+                for field_block, shift in zip(template.field_blocks, alignment.shifts):
+                    field_block.shift = int(shift)
+                logger.debug(
+                    f"Aligned field blocks: {dict(zip(compiled.block_names, alignment.shifts.tolist()))}"
+                )
 
-                        # For demonstration purposes-
-                        # if(field_block.name == "int1"):
-                        #     ret = morph_v.copy()
-                        #     cv2.rectangle(ret,
-                        #                   (s[0]+shift-thk,s[1]),
-                        #                   (s[0]+shift+thk+d[0],s[1]+d[1]),
-                        #                   constants.CLR_WHITE,
-                        #                   3)
-                        #     appendSaveImg(6,ret)
-                        # print(shift, left_mean, right_mean)
-                        left_shift, right_shift = left_mean > 100, right_mean > 100
-                        if left_shift:
-                            if right_shift:
-                                break
-                            else:
-                                shift -= align_stride
-                        else:
-                            if right_shift:
-                                shift += align_stride
-                            else:
-                                break
-                        steps += 1
-
-                    field_block.shift = shift
-                    # print("Aligned field_block: ",field_block.name,"Corrected Shift:",
-                    #   field_block.shift,", dimensions:", field_block.dimensions,
-                    #   "origin:", field_block.origin,'\n')
-                # print("End Alignment")
+            # Get mean bubbleValues n other stats
+            compiled = template.compiled
+            bubble_xs = compiled.get_shifted_xs(template.get_block_shifts())
+            all_q_box_vals = get_box_means(
+                get_integral_image(img),
+                bubble_xs,
+                compiled.bubble_ys,
+                compiled.bubble_box_ws,
+                compiled.bubble_box_hs,
+            )
 
             final_align = None
-            if config.outputs.show_image_level >= 2:
+            # The layouts are only drawn when they will be saved or shown
+            if show_image_level >= 3 or (
+                show_image_level >= 2 and self.save_image_level >= 2
+            ):
                 initial_align = self.draw_template_layout(img, template, shifted=False)
                 final_align = self.draw_template_layout(
-                    img, template, shifted=True, draw_qvals=True
+                    img, template, shifted=True, draw_qvals=True, q_vals=all_q_box_vals
                 )
                 # appendSaveImg(4,mean_vals)
-                self.append_save_img(2, initial_align)
-                self.append_save_img(2, final_align)
+                append_save_img(2, initial_align)
+                append_save_img(2, final_align)
 
-                if auto_align:
+                if auto_align and show_image_level >= 3:
                     final_align = np.hstack((initial_align, final_align))
-            self.append_save_img(5, img)
+                del initial_align
+            append_save_img(5, img)
 
-            # Get mean bubbleValues n other stats
-            all_q_vals, all_q_strip_arrs, all_q_std_vals = [], [], []
-            total_q_strip_no = 0
-            for field_block in template.field_blocks:
-                box_w, box_h = field_block.bubble_dimensions
-                q_std_vals = []
-                for field_block_bubbles in field_block.traverse_bubbles:
-                    q_strip_vals = []
-                    for pt in field_block_bubbles:
-                        # shifted
-                        x, y = (pt.x + field_block.shift, pt.y)
-                        rect = [y, y + box_h, x, x + box_w]
-                        q_strip_vals.append(
-                            cv2.mean(img[rect[0] : rect[1], rect[2] : rect[3]])[0]
-                            # detectCross(img, rect) ? 100 : 0
-                        )
-                    q_std_vals.append(round(np.std(q_strip_vals), 2))
-                    all_q_strip_arrs.append(q_strip_vals)
-                    # _, _, _ = get_global_threshold(q_strip_vals, "QStrip Plot",
-                    #   plot_show=False, sort_in_plot=True)
-                    # hist = getPlotImg()
-                    # InteractionUtils.show("QStrip "+field_block_bubbles[0].field_label, hist, 0, 1,config=config)
-                    all_q_vals.extend(q_strip_vals)
-                    # print(total_q_strip_no, field_block_bubbles[0].field_label, q_std_vals[len(q_std_vals)-1])
-                    total_q_strip_no += 1
-                all_q_std_vals.extend(q_std_vals)
-
-            global_std_thresh, _, _ = self.get_global_threshold(
-                all_q_std_vals
-            )  # , "Q-wise Std-dev Plot", plot_show=True, sort_in_plot=True)
-            # plt.show()
-            # hist = getPlotImg()
-            # InteractionUtils.show("StdHist", hist, 0, 1,config=config)
-
-            # Note: Plotting takes Significant times here --> Change Plotting args
-            # to support show_image_level
-            # , "Mean Intensity Histogram",plot_show=True, sort_in_plot=True)
-            global_thr, _, _ = self.get_global_threshold(all_q_vals, looseness=4)
+            (
+                global_thr,
+                global_std_thresh,
+                all_q_strip_thresholds,
+            ) = self.get_sheet_thresholds(all_q_box_vals, template)
 
             logger.info(
                 f"Thresholding: \tglobal_thr: {round(global_thr, 2)} \tglobal_std_THR: {round(global_std_thresh, 2)}\t{'(Looks like a Xeroxed OMR)' if (global_thr == 255) else ''}"
             )
-            # plt.show()
-            # hist = getPlotImg()
-            # InteractionUtils.show("StdHist", hist, 0, 1,config=config)
-
-            # if(config.outputs.show_image_level>=1):
-            #     hist = getPlotImg()
-            #     InteractionUtils.show("Hist", hist, 0, 1,config=config)
-            #     appendSaveImg(4,hist)
-            #     appendSaveImg(5,hist)
-            #     appendSaveImg(2,hist)
-
-            per_omr_threshold_avg, total_q_strip_no, total_q_box_no = 0, 0, 0
-            for field_block in template.field_blocks:
-                block_q_strip_no = 1
-                box_w, box_h = field_block.bubble_dimensions
-                shift = field_block.shift
-                s, d = field_block.origin, field_block.dimensions
-                key = field_block.name[:3]
-                # cv2.rectangle(final_marked,(s[0]+shift,s[1]),(s[0]+shift+d[0],
-                #   s[1]+d[1]),CLR_BLACK,3)
-                for field_block_bubbles in field_block.traverse_bubbles:
-                    # All Black or All White case
-                    no_outliers = all_q_std_vals[total_q_strip_no] < global_std_thresh
-                    # print(total_q_strip_no, field_block_bubbles[0].field_label,
-                    #   all_q_std_vals[total_q_strip_no], "no_outliers:", no_outliers)
-                    per_q_strip_threshold = self.get_local_threshold(
-                        all_q_strip_arrs[total_q_strip_no],
-                        global_thr,
-                        no_outliers,
-                        f"Mean Intensity Histogram for {key}.{field_block_bubbles[0].field_label}.{block_q_strip_no}",
-                        config.outputs.show_image_level >= 6,
-                    )
-                    # print(field_block_bubbles[0].field_label,key,block_q_strip_no, "THR: ",
-                    #   round(per_q_strip_threshold,2))
-                    per_omr_threshold_avg += per_q_strip_threshold
-
-                    # Note: Little debugging visualization - view the particular Qstrip
-                    # if(
-                    #     0
-                    #     # or "q17" in (field_block_bubbles[0].field_label)
-                    #     # or (field_block_bubbles[0].field_label+str(block_q_strip_no))=="q15"
-                    #  ):
-                    #     st, end = qStrip
-                    #     InteractionUtils.show("QStrip: "+key+"-"+str(block_q_strip_no),
-                    #     img[st[1] : end[1], st[0]+shift : end[0]+shift],0,config=config)
-
-                    # TODO: get rid of total_q_box_no
-                    detected_bubbles = []
-                    for bubble in field_block_bubbles:
-                        bubble_is_marked = (
-                            per_q_strip_threshold > all_q_vals[total_q_box_no]
-                        )
-                        total_q_box_no += 1
-                        if bubble_is_marked:
-                            detected_bubbles.append(bubble)
-                            x, y, field_value = (
-                                bubble.x + field_block.shift,
-                                bubble.y,
-                                bubble.field_value,
-                            )
-                            cv2.rectangle(
-                                final_marked,
-                                (int(x + box_w / 12), int(y + box_h / 12)),
-                                (
-                                    int(x + box_w - box_w / 12),
-                                    int(y + box_h - box_h / 12),
-                                ),
-                                constants.CLR_DARK_GRAY,
-                                3,
-                            )
-
-                            cv2.putText(
-                                final_marked,
-                                str(field_value),
-                                (x, y),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                constants.TEXT_SIZE,
-                                (20, 20, 10),
-                                int(1 + 3.5 * constants.TEXT_SIZE),
-                            )
-                        else:
-                            cv2.rectangle(
-                                final_marked,
-                                (int(x + box_w / 10), int(y + box_h / 10)),
-                                (
-                                    int(x + box_w - box_w / 10),
-                                    int(y + box_h - box_h / 10),
-                                ),
-                                constants.CLR_GRAY,
-                                -1,
-                            )
-
-                    for bubble in detected_bubbles:
-                        field_label, field_value = (
-                            bubble.field_label,
-                            bubble.field_value,
-                        )
-                        # Only send rolls multi-marked in the directory
-                        multi_marked_local = field_label in omr_response
-                        omr_response[field_label] = (
-                            (omr_response[field_label] + field_value)
-                            if multi_marked_local
-                            else field_value
+
+            strip_block_ids = compiled.strip_block_ids.tolist()
+            if show_image_level >= 5:
+                block_offsets = compiled.block_offsets.tolist()
+                strip_offsets = compiled.strip_offsets.tolist()
+                for strip_no, block_id in enumerate(strip_block_ids):
+                    key = compiled.block_names[block_id][:3]
+                    if key in all_c_box_vals:
+                        block_q_strip_no = strip_no - block_offsets[block_id] + 1
+                        q_nums[key].append(f"{key[:2]}_c{str(block_q_strip_no)}")
+                        all_c_box_vals[key].append(
+                            all_q_box_vals[
+                                strip_offsets[strip_no] : strip_offsets[strip_no + 1]
+                            ].tolist()
                         )
-                        # TODO: generalize this into identifier
-                        # multi_roll = multi_marked_local and "Roll" in str(q)
-                        multi_marked = multi_marked or multi_marked_local
-
-                    if len(detected_bubbles) == 0:
-                        field_label = field_block_bubbles[0].field_label
-                        omr_response[field_label] = field_block.empty_val
-
-                    if config.outputs.show_image_level >= 5:
-                        if key in all_c_box_vals:
-                            q_nums[key].append(f"{key[:2]}_c{str(block_q_strip_no)}")
-                            all_c_box_vals[key].append(
-                                all_q_strip_arrs[total_q_strip_no]
-                            )
-
-                    block_q_strip_no += 1
-                    total_q_strip_no += 1
-                # /for field_block
-
-            per_omr_threshold_avg /= total_q_strip_no
-            per_omr_threshold_avg = round(per_omr_threshold_avg, 2)
-            # Translucent
-            cv2.addWeighted(
-                final_marked, alpha, transp_layer, 1 - alpha, 0, final_marked
+
+            # Compare each bubble against the threshold of its own strip
+            bubbles_marked = (
+                np.array(all_q_strip_thresholds)[compiled.bubble_strip_ids]
+                > all_q_box_vals
+            )
+
+            # Concatenate the marked values per field label (in bubble order)
+            marked_strip_values = {}
+            for strip_no, value_id in zip(
+                compiled.bubble_strip_ids[bubbles_marked].tolist(),
+                compiled.bubble_value_ids[bubbles_marked].tolist(),
+            ):
+                field_value = compiled.bubble_values[value_id]
+                # Only send rolls multi-marked in the directory
+                multi_marked = multi_marked or strip_no in marked_strip_values
+                marked_strip_values[strip_no] = (
+                    marked_strip_values.get(strip_no, "") + field_value
+                )
+                # TODO: generalize this into identifier
+                # multi_roll = multi_marked_local and "Roll" in str(q)
+
+            for strip_no, field_label in enumerate(compiled.field_labels):
+                omr_response[field_label] = marked_strip_values.get(
+                    strip_no, compiled.block_empty_vals[strip_block_ids[strip_no]]
+                )
+
+            per_omr_threshold_avg = sum(all_q_strip_thresholds) / len(
+                all_q_strip_thresholds
             )
+            per_omr_threshold_avg = round(per_omr_threshold_avg, 2)
+
+            final_marked = None
+            if not responses_only:
+                final_marked = self.draw_marked_bubbles(
+                    img, template, bubble_xs, bubbles_marked
+                )
+
             # Box types
-            if config.outputs.show_image_level >= 6:
+            if show_image_level >= 6:
                 # plt.draw()
                 f, axes = plt.subplots(len(all_c_box_vals), sharey=True)
                 f.canvas.manager.set_window_title(name)
@@ -399,7 +283,7 @@ class ImageInstanceOps:
                 plt.tight_layout(pad=0.5)
                 plt.show()
 
-            if config.outputs.show_image_level >= 3 and final_align is not None:
+            if show_image_level >= 3 and final_align is not None:
                 final_align = ImageUtils.resize_util_h(
                     final_align, int(config.dimensions.display_height)
                 )
@@ -408,77 +292,147 @@ class ImageInstanceOps:
                     "Template Alignment Adjustment", final_align, 0, 0, config=config
                 )
 
-            if config.outputs.save_detections and save_dir is not None:
-                if multi_roll:
-                    save_dir = save_dir.joinpath("_MULTI_")
-                image_path = str(save_dir.joinpath(name))
-                ImageUtils.save_img(image_path, final_marked)
-
-            self.append_save_img(2, final_marked)
-
-            if save_dir is not None:
-                for i in range(config.outputs.save_image_level):
-                    self.save_image_stacks(i + 1, name, save_dir)
-
-            return omr_response, final_marked, multi_marked, multi_roll
+            if not responses_only:
+                if config.outputs.save_detections and save_dir is not None:
+                    if multi_roll:
+                        save_dir = save_dir.joinpath("_MULTI_")
+                    image_path = str(save_dir.joinpath(name))
+                    ImageUtils.save_img(image_path, final_marked)
+
+                append_save_img(2, final_marked)
+
+                if save_dir is not None:
+                    for i in range(config.outputs.save_image_level):
+                        self.save_image_stacks(i + 1, name, save_dir)
+
+            return OMRDetection(
+                omr_response=omr_response,
+                multi_marked=multi_marked,
+                multi_roll=multi_roll,
+                global_thr=global_thr,
+                global_std_thresh=global_std_thresh,
+                strip_thresholds=all_q_strip_thresholds,
+                final_marked=final_marked,
+                alignment=alignment,
+            )
 
         except Exception as e:
             raise e
 
     @staticmethod
-    def draw_template_layout(img, template, shifted=True, draw_qvals=False, border=-1):
-        img = ImageUtils.resize_util(
+    def draw_marked_bubbles(img, template, bubble_xs, bubbles_marked):
+        compiled = template.compiled
+        # Overlay Transparencies
+        alpha = 0.65
+        # img itself serves as the untouched transparent layer
+        final_marked = img.copy()
+        bubble_ys = compiled.bubble_ys
+        box_ws, box_hs = compiled.bubble_box_ws, compiled.bubble_box_hs
+
+        # Note: astype(int) truncates like int() for the positive coordinates
+        unmarked = ~bubbles_marked
+        rendering.fill_boxes(
+            final_marked,
+            (bubble_xs + box_ws / 10)[unmarked].astype(np.int64),
+            (bubble_ys + box_hs / 10)[unmarked].astype(np.int64),
+            (bubble_xs + box_ws - box_ws / 10)[unmarked].astype(np.int64),
+            (bubble_ys + box_hs - box_hs / 10)[unmarked].astype(np.int64),
+            constants.CLR_GRAY,
+        )
+        rendering.draw_box_outlines(
+            final_marked,
+            (bubble_xs + box_ws / 12)[bubbles_marked].astype(np.int64),
+            (bubble_ys + box_hs / 12)[bubbles_marked].astype(np.int64),
+            (bubble_xs + box_ws - box_ws / 12)[bubbles_marked].astype(np.int64),
+            (bubble_ys + box_hs - box_hs / 12)[bubbles_marked].astype(np.int64),
+            constants.CLR_DARK_GRAY,
+            3,
+        )
+        bubble_value_texts = np.array([str(value) for value in compiled.bubble_values])
+        rendering.draw_texts(
+            final_marked,
+            bubble_value_texts[compiled.bubble_value_ids[bubbles_marked]],
+            bubble_xs[bubbles_marked],
+            bubble_ys[bubbles_marked],
+            cv2.FONT_HERSHEY_SIMPLEX,
+            constants.TEXT_SIZE,
+            (20, 20, 10),
+            int(1 + 3.5 * constants.TEXT_SIZE),
+        )
+
+        # Translucent
+        cv2.addWeighted(final_marked, alpha, img, 1 - alpha, 0, final_marked)
+        return final_marked
+
+    @staticmethod
+    def draw_template_layout(
+        img, template, shifted=True, draw_qvals=False, border=-1, q_vals=None
+    ):
+        """q_vals are the already sampled means of the (shifted) bubbles, if available"""
+        # Note: the resize always allocates, hence final_align can be drawn on directly
+        final_align = ImageUtils.resize_util(
             img, template.page_dimensions[0], template.page_dimensions[1]
         )
-        final_align = img.copy()
-        for field_block in template.field_blocks:
-            s, d = field_block.origin, field_block.dimensions
-            box_w, box_h = field_block.bubble_dimensions
-            shift = field_block.shift
-            if shifted:
-                cv2.rectangle(
-                    final_align,
-                    (s[0] + shift, s[1]),
-                    (s[0] + shift + d[0], s[1] + d[1]),
-                    constants.CLR_BLACK,
-                    3,
-                )
-            else:
-                cv2.rectangle(
-                    final_align,
-                    (s[0], s[1]),
-                    (s[0] + d[0], s[1] + d[1]),
-                    constants.CLR_BLACK,
-                    3,
-                )
-            for field_block_bubbles in field_block.traverse_bubbles:
-                for pt in field_block_bubbles:
-                    x, y = (pt.x + field_block.shift, pt.y) if shifted else (pt.x, pt.y)
-                    cv2.rectangle(
-                        final_align,
-                        (int(x + box_w / 10), int(y + box_h / 10)),
-                        (int(x + box_w - box_w / 10), int(y + box_h - box_h / 10)),
-                        constants.CLR_GRAY,
-                        border,
-                    )
-                    if draw_qvals:
-                        rect = [y, y + box_h, x, x + box_w]
-                        cv2.putText(
-                            final_align,
-                            f"{int(cv2.mean(img[rect[0] : rect[1], rect[2] : rect[3]])[0])}",
-                            (rect[2] + 2, rect[0] + (box_h * 2) // 3),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.6,
-                            constants.CLR_BLACK,
-                            2,
-                        )
-            if shifted:
+        compiled = template.compiled
+        block_shifts = template.get_block_shifts()
+        bubble_xs = (
+            compiled.get_shifted_xs(block_shifts) if shifted else compiled.bubble_xs
+        )
+        bubble_ys = compiled.bubble_ys
+        box_ws, box_hs = compiled.bubble_box_ws, compiled.bubble_box_hs
+        if draw_qvals and q_vals is None:
+            # Sampled before anything is drawn over the page
+            q_vals = get_box_means(
+                get_integral_image(final_align), bubble_xs, bubble_ys, box_ws, box_hs
+            )
+
+        for block_id in range(len(compiled.block_names)):
+            s = compiled.block_origins[block_id].tolist()
+            d = compiled.block_dimensions[block_id].tolist()
+            shift = int(block_shifts[block_id]) if shifted else 0
+            cv2.rectangle(
+                final_align,
+                (s[0] + shift, s[1]),
+                (s[0] + shift + d[0], s[1] + d[1]),
+                constants.CLR_BLACK,
+                3,
+            )
+
+        bubble_boxes = (
+            (bubble_xs + box_ws / 10).astype(np.int64),
+            (bubble_ys + box_hs / 10).astype(np.int64),
+            (bubble_xs + box_ws - box_ws / 10).astype(np.int64),
+            (bubble_ys + box_hs - box_hs / 10).astype(np.int64),
+        )
+        if border < 0:
+            rendering.fill_boxes(final_align, *bubble_boxes, constants.CLR_GRAY)
+        else:
+            rendering.draw_box_outlines(
+                final_align, *bubble_boxes, constants.CLR_GRAY, border
+            )
+
+        if draw_qvals:
+            rendering.draw_texts(
+                final_align,
+                q_vals.astype(np.int64).astype(str),
+                bubble_xs + 2,
+                bubble_ys + (box_hs * 2) // 3,
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.6,
+                constants.CLR_BLACK,
+                2,
+            )
+
+        if shifted:
+            for block_id, block_name in enumerate(compiled.block_names):
+                s = compiled.block_origins[block_id].tolist()
+                d = compiled.block_dimensions[block_id].tolist()
                 text_in_px = cv2.getTextSize(
-                    field_block.name, cv2.FONT_HERSHEY_SIMPLEX, constants.TEXT_SIZE, 4
+                    block_name, cv2.FONT_HERSHEY_SIMPLEX, constants.TEXT_SIZE, 4
                 )
                 cv2.putText(
                     final_align,
-                    field_block.name,
+                    block_name,
                     (int(s[0] + d[0] - text_in_px[0][0]), int(s[1] - text_in_px[0][1])),
                     cv2.FONT_HERSHEY_SIMPLEX,
                     constants.TEXT_SIZE,
@@ -487,6 +441,98 @@ class ImageInstanceOps:
                 )
         return final_align
 
+    def get_sheet_thresholds(self, all_q_box_vals, template):
+        """Returns (global_thr, global_std_thresh, per strip thresholds) for the bubble means of a sheet"""
+        config = self.tuning_config
+        # Note: per strip plots are only drawn by the iterative method
+        if (
+            config.threshold_params.THRESHOLD_METHOD == "vectorized"
+            and config.outputs.show_image_level < 6
+        ):
+            return self.get_vectorized_sheet_thresholds(all_q_box_vals, template)
+        return self.get_iterative_sheet_thresholds(all_q_box_vals, template)
+
+    def get_iterative_sheet_thresholds(self, all_q_box_vals, template):
+        config = self.tuning_config
+        compiled = template.compiled
+        all_q_vals = all_q_box_vals.tolist()
+        strip_offsets = compiled.strip_offsets.tolist()
+        all_q_strip_arrs = [
+            all_q_vals[strip_start:strip_end]
+            for strip_start, strip_end in zip(strip_offsets, strip_offsets[1:])
+        ]
+        all_q_std_vals = [
+            round(np.std(q_strip_vals), 2) for q_strip_vals in all_q_strip_arrs
+        ]
+
+        global_std_thresh, _, _ = self.get_global_threshold(
+            all_q_std_vals
+        )  # , "Q-wise Std-dev Plot", plot_show=True, sort_in_plot=True)
+        # plt.show()
+        # hist = getPlotImg()
+        # InteractionUtils.show("StdHist", hist, 0, 1,config=config)
+
+        # Note: Plotting takes Significant times here --> Change Plotting args
+        # to support show_image_level
+        # , "Mean Intensity Histogram",plot_show=True, sort_in_plot=True)
+        global_thr, _, _ = self.get_global_threshold(all_q_vals, looseness=4)
+
+        strip_block_ids = compiled.strip_block_ids.tolist()
+        block_offsets = compiled.block_offsets.tolist()
+        all_q_strip_thresholds = []
+        for strip_no, field_label in enumerate(compiled.field_labels):
+            block_id = strip_block_ids[strip_no]
+            block_q_strip_no = strip_no - block_offsets[block_id] + 1
+            key = compiled.block_names[block_id][:3]
+            # All Black or All White case
+            no_outliers = all_q_std_vals[strip_no] < global_std_thresh
+            per_q_strip_threshold = self.get_local_threshold(
+                all_q_strip_arrs[strip_no],
+                global_thr,
+                no_outliers,
+                f"Mean Intensity Histogram for {key}.{field_label}.{block_q_strip_no}",
+                config.outputs.show_image_level >= 6,
+            )
+            all_q_strip_thresholds.append(per_q_strip_threshold)
+
+        return global_thr, global_std_thresh, all_q_strip_thresholds
+
+    def get_vectorized_sheet_thresholds(self, all_q_box_vals, template):
+        threshold_params = self.tuning_config.threshold_params
+        strip_offsets = template.compiled.strip_offsets
+        global_default_threshold = self.get_global_default_threshold()
+        all_q_std_vals = thresholding.get_strip_std_vals(all_q_box_vals, strip_offsets)
+        global_std_thresh, _, _, _ = thresholding.get_global_threshold(
+            all_q_std_vals,
+            threshold_params.MIN_JUMP,
+            threshold_params.JUMP_DELTA,
+            global_default_threshold,
+        )
+        global_thr, _, _, _ = thresholding.get_global_threshold(
+            all_q_box_vals,
+            threshold_params.MIN_JUMP,
+            threshold_params.JUMP_DELTA,
+            global_default_threshold,
+            looseness=4,
+        )
+        all_q_strip_thresholds = thresholding.get_local_thresholds(
+            all_q_box_vals,
+            strip_offsets,
+            global_thr,
+            all_q_std_vals < global_std_thresh,
+            threshold_params.MIN_GAP,
+            threshold_params.MIN_JUMP,
+            threshold_params.CONFIDENT_SURPLUS,
+        )
+        return global_thr, global_std_thresh, all_q_strip_thresholds.tolist()
+
+    def get_global_default_threshold(self):
+        return (
+            constants.GLOBAL_PAGE_THRESHOLD_WHITE
+            if self.tuning_config.threshold_params.PAGE_TYPE_FOR_THRESHOLD == "white"
+            else constants.GLOBAL_PAGE_THRESHOLD_BLACK
+        )
+
     def get_global_threshold(
         self,
         q_vals_orig,
@@ -521,20 +567,15 @@ class ImageInstanceOps:
 
         """
         config = self.tuning_config
-        PAGE_TYPE_FOR_THRESHOLD, MIN_JUMP, JUMP_DELTA = map(
+        MIN_JUMP, JUMP_DELTA = map(
             config.threshold_params.get,
             [
-                "PAGE_TYPE_FOR_THRESHOLD",
                 "MIN_JUMP",
                 "JUMP_DELTA",
             ],
         )
 
-        global_default_threshold = (
-            constants.GLOBAL_PAGE_THRESHOLD_WHITE
-            if PAGE_TYPE_FOR_THRESHOLD == "white"
-            else constants.GLOBAL_PAGE_THRESHOLD_BLACK
-        )
+        global_default_threshold = self.get_global_default_threshold()
 
         # Sort the Q bubbleValues
         # TODO: Change var name of q_vals
@@ -692,30 +733,14 @@ class ImageInstanceOps:
         return thr1
 
     def append_save_img(self, key, img):
-        if self.save_image_level >= int(key):
-            self.save_img_list[key].append(img.copy())
+        self.debug_images.append(key, img)
 
     def save_image_stacks(self, key, filename, save_dir):
-        config = self.tuning_config
-        if self.save_image_level >= int(key) and self.save_img_list[key] != []:
-            name = os.path.splitext(filename)[0]
-            result = np.hstack(
-                tuple(
-                    [
-                        ImageUtils.resize_util_h(img, config.dimensions.display_height)
-                        for img in self.save_img_list[key]
-                    ]
-                )
-            )
-            result = ImageUtils.resize_util(
-                result,
-                min(
-                    len(self.save_img_list[key]) * config.dimensions.display_width // 3,
-                    int(config.dimensions.display_width * 2.5),
-                ),
-            )
-            ImageUtils.save_img(f"{save_dir}stack/{name}_{str(key)}_stack.jpg", result)
+        self.debug_images.save_stack(key, filename, save_dir)
 
     def reset_all_save_img(self):
-        for i in range(self.save_image_level):
-            self.save_img_list[i + 1] = []
+        self.debug_images.reset()
+
+    def flush_saved_images(self):
+        """Waits for the images being saved in the background"""
+        self.debug_images.flush()
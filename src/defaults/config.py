@@ -15,6 +15,8 @@ CONFIG_DEFAULTS = DotMap(
             "CONFIDENT_SURPLUS": 5,
             "JUMP_DELTA": 30,
             "PAGE_TYPE_FOR_THRESHOLD": "white",
+            # Note: 'vectorized' finds all strip thresholds of a sheet in one numpy pass (same results)
+            "THRESHOLD_METHOD": "iterative",
         },
         "alignment_params": {
             # Note: 'auto_align' enables automatic template alignment, use if the scans show slight misalignments.
@@ -24,10 +26,24 @@ CONFIG_DEFAULTS = DotMap(
             "stride": 1,
             "thickness": 3,
         },
+        "processing": {
+            # Number of the next images decoded in the background (0 to disable)
+            "prefetch_depth": 2,
+            # Memory cap (in MB) of the decoded images waiting to be processed
+            "max_prefetch_mb": 256,
+            "decode_threads": 2,
+            # Let the JPEG decoder scale large images down to the processing size
+            # (disable to read the sheets in full resolution)
+            "reduced_decode": True,
+        },
         "outputs": {
             "show_image_level": 0,
             "save_image_level": 0,
             "save_detections": True,
+            # Also save the results as a parquet file (requires pyarrow)
+            "save_parquet": False,
+            # Memory budget (in MB) of the debug images kept per sheet for save_image_level
+            "max_debug_images_mb": 128,
             "filter_out_multimarked_files": False,
         },
     },
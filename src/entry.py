@@ -6,24 +6,32 @@
  Github: https://github.com/Udayraj123
 
 """
+import multiprocessing
 import os
-from csv import QUOTE_NONNUMERIC
+from dataclasses import dataclass
 from pathlib import Path
 from time import time
 
 import cv2
-import pandas as pd
 from rich.table import Table
 
 from src import constants
 from src.defaults import CONFIG_DEFAULTS
-from src.evaluation import EvaluationConfig, evaluate_concatenated_response
+from src.evaluation import evaluate_concatenated_response
 from src.logger import console, logger
-from src.template import Template
+from src.planner import DirectoryContext, plan_dir
+from src.utils.decode import get_decode_size
 from src.utils.file import Paths, setup_dirs_for_paths, setup_outputs_for_template
 from src.utils.image import ImageUtils
 from src.utils.interaction import InteractionUtils, Stats
-from src.utils.parsing import get_concatenated_response, open_config_with_defaults
+from src.utils.manifest import (
+    MANIFEST_FILENAME,
+    RunManifest,
+    get_settings_hash,
+)
+from src.utils.parsing import get_concatenated_response
+from src.utils.prefetch import ImagePrefetcher
+from src.utils.sources import get_sheet_hash, read_sheet
 
 # Load processors
 STATS = Stats()
@@ -52,6 +60,11 @@ def print_config_summary(
     table.add_row("Directory Path", f"{curr_dir}")
     table.add_row("Count of Images", f"{len(omr_files)}")
     table.add_row("Set Layout Mode ", "ON" if args["setLayout"] else "OFF")
+    table.add_row(
+        "Responses Only Mode", "ON" if args.get("responsesOnly", False) else "OFF"
+    )
+    table.add_row("Workers", f"{args.get('workers', 1)}")
+    table.add_row("Incremental Mode", "ON" if args.get("incremental", False) else "OFF")
     pre_processor_names = [pp.__class__.__name__ for pp in template.pre_processors]
     table.add_row(
         "Markers Detection",
@@ -79,104 +92,57 @@ def process_dir(
     tuning_config=CONFIG_DEFAULTS,
     evaluation_config=None,
 ):
-    # Update local tuning_config (in current recursion stack)
-    local_config_path = curr_dir.joinpath(constants.CONFIG_FILENAME)
-    if os.path.exists(local_config_path):
-        tuning_config = open_config_with_defaults(local_config_path)
-
-    # Update local template (in current recursion stack)
-    local_template_path = curr_dir.joinpath(constants.TEMPLATE_FILENAME)
-    local_template_exists = os.path.exists(local_template_path)
-    if local_template_exists:
-        template = Template(
-            local_template_path,
-            tuning_config,
-        )
-    # Look for subdirectories for processing
-    subdirs = [d for d in curr_dir.iterdir() if d.is_dir()]
+    context = DirectoryContext(template, tuning_config, evaluation_config)
+    for work in plan_dir(curr_dir, args["setLayout"], context):
+        process_directory_work(root_dir, work, args)
 
+
+def process_directory_work(root_dir, work, args):
+    curr_dir, omr_files = work.curr_dir, work.omr_files
+    template, tuning_config, evaluation_config = (
+        work.context.template,
+        work.context.tuning_config,
+        work.context.evaluation_config,
+    )
     output_dir = Path(args["output_dir"], curr_dir.relative_to(root_dir))
     paths = Paths(output_dir)
 
-    # look for images in current dir to process
-    exts = ("*.[pP][nN][gG]", "*.[jJ][pP][gG]", "*.[jJ][pP][eE][gG]")
-    omr_files = sorted([f for ext in exts for f in curr_dir.glob(ext)])
-
-    # Exclude images (take union over all pre_processors)
-    excluded_files = []
-    if template:
-        for pp in template.pre_processors:
-            excluded_files.extend(Path(p) for p in pp.exclude_files())
-
-    local_evaluation_path = curr_dir.joinpath(constants.EVALUATION_FILENAME)
-    if not args["setLayout"] and os.path.exists(local_evaluation_path):
-        if not local_template_exists:
-            logger.warning(
-                f"Found an evaluation file without a parent template file: {local_evaluation_path}"
-            )
-        evaluation_config = EvaluationConfig(
-            curr_dir,
-            local_evaluation_path,
-            template,
-            tuning_config,
-        )
-
-        excluded_files.extend(
-            Path(exclude_file) for exclude_file in evaluation_config.get_exclude_files()
-        )
-
-    omr_files = [f for f in omr_files if f not in excluded_files]
-
-    if omr_files:
-        if not template:
-            logger.error(
-                f"Found images, but no template in the directory tree \
-                of '{curr_dir}'. \nPlace {constants.TEMPLATE_FILENAME} in the \
-                appropriate directory."
-            )
-            raise Exception(
-                f"No template file found in the directory tree of {curr_dir}"
-            )
-
-        setup_dirs_for_paths(paths)
-        outputs_namespace = setup_outputs_for_template(paths, template)
-
-        print_config_summary(
-            curr_dir,
-            omr_files,
-            template,
-            tuning_config,
-            local_config_path,
-            evaluation_config,
-            args,
-        )
-        if args["setLayout"]:
-            show_template_layouts(omr_files, template, tuning_config)
-        else:
-            process_files(
-                omr_files,
+    setup_dirs_for_paths(paths)
+    manifest = None
+    if args.get("incremental", False):
+        manifest = RunManifest(
+            output_dir.joinpath(MANIFEST_FILENAME),
+            get_settings_hash(
                 template,
                 tuning_config,
                 evaluation_config,
-                outputs_namespace,
-            )
-
-    elif not subdirs:
-        # Each subdirectory should have images or should be non-leaf
-        logger.info(
-            f"No valid images or sub-folders found in {curr_dir}.\
-            Empty directories not allowed."
+                args.get("responsesOnly", False),
+            ),
         )
+    outputs_namespace = setup_outputs_for_template(
+        paths, template, tuning_config.outputs.save_parquet, manifest
+    )
 
-    # recursively process sub-folders
-    for d in subdirs:
-        process_dir(
-            root_dir,
-            d,
-            args,
+    print_config_summary(
+        curr_dir,
+        omr_files,
+        template,
+        tuning_config,
+        work.local_config_path,
+        evaluation_config,
+        args,
+    )
+    if args["setLayout"]:
+        show_template_layouts(omr_files, template, tuning_config)
+    else:
+        process_files(
+            omr_files,
             template,
             tuning_config,
             evaluation_config,
+            outputs_namespace,
+            responses_only=args.get("responsesOnly", False),
+            workers=args.get("workers", 1),
         )
 
 
@@ -196,143 +162,320 @@ def show_template_layouts(omr_files, template, tuning_config):
         )
 
 
+def skip_unchanged_files(omr_files, outputs_namespace):
+    """
+    Carries over the results of the sheets unchanged since the manifest of an incremental run,
+    returns the files left to process and the content hashes of them.
+    """
+    results_sink = outputs_namespace.results_sink
+    changed_files, content_hashes = [], {}
+    for file_path in omr_files:
+        content_hash = get_sheet_hash(file_path)
+        entry = results_sink.manifest.get_unchanged_entry(file_path.name, content_hash)
+        if entry is None:
+            changed_files.append(file_path)
+            content_hashes[file_path] = content_hash
+            continue
+        results_sink.write_manifest_entry(entry)
+        outputs_namespace.OUTPUT_SET.append(
+            [file_path.name]
+            + [
+                entry["record"].get(column, "")
+                for column in outputs_namespace.output_columns
+            ]
+        )
+    skipped_count = len(omr_files) - len(changed_files)
+    if skipped_count > 0:
+        logger.info(
+            f"Skipping {skipped_count} unchanged files of the manifest, processing {len(changed_files)} new or changed files"
+        )
+    return changed_files, content_hashes
+
+
+@dataclass
+class SheetResult:
+    """Outcome of reading one sheet, resp_array is None when it could not be read"""
+
+    file_path: Path
+    resp_array: list = None
+    score: float = 0
+    multi_marked: int = 0
+    global_thr: float = None
+    global_std_thresh: float = None
+    strip_thresholds: list = None
+
+
 def process_files(
     omr_files,
     template,
     tuning_config,
     evaluation_config,
     outputs_namespace,
+    responses_only=False,
+    workers=1,
 ):
     start_time = int(time())
     files_counter = 0
     STATS.files_not_moved = 0
 
-    for file_path in omr_files:
-        files_counter += 1
-        file_name = file_path.name
-
-        in_omr = cv2.imread(str(file_path), cv2.IMREAD_GRAYSCALE)
+    content_hashes = {}
+    if outputs_namespace.results_sink.manifest is not None:
+        omr_files, content_hashes = skip_unchanged_files(omr_files, outputs_namespace)
 
-        logger.info("")
-        logger.info(
-            f"({files_counter}) Opening image: \t'{file_path}'\tResolution: {in_omr.shape}"
+    sheet_args = (
+        template,
+        tuning_config,
+        evaluation_config,
+        outputs_namespace.paths,
+        responses_only,
+    )
+    if workers > 1 and len(omr_files) > 1:
+        sheet_results = process_files_in_pool(omr_files, workers, *sheet_args)
+    else:
+        # The next images are decoded while the current one is processed
+        processing = tuning_config.processing
+        images = ImagePrefetcher(
+            omr_files,
+            depth=processing.prefetch_depth,
+            max_bytes=processing.max_prefetch_mb * 2**20,
+            threads=processing.decode_threads,
+            decode_size=get_decode_size(tuning_config),
+        )
+        sheet_results = (
+            process_file(file_path, files_counter, *sheet_args, image=image)
+            for files_counter, (file_path, image) in enumerate(images, 1)
         )
 
-        template.image_instance_ops.reset_all_save_img()
+    # The results are written by this process alone, in the input order
+    try:
+        for files_counter, sheet_result in enumerate(sheet_results, 1):
+            write_sheet_result(
+                sheet_result,
+                files_counter,
+                tuning_config,
+                outputs_namespace,
+                content_hashes.get(sheet_result.file_path),
+            )
+    finally:
+        outputs_namespace.results_sink.close()
 
+    template.image_instance_ops.flush_saved_images()
+    print_stats(start_time, files_counter, tuning_config)
+
+
+def process_file(
+    file_path,
+    files_counter,
+    template,
+    tuning_config,
+    evaluation_config,
+    paths,
+    responses_only=False,
+    image=None,
+):
+    """Reads the sheet, from its already decoded image if given"""
+    file_name = file_path.name
+
+    in_omr = (
+        image
+        if image is not None
+        else read_sheet(file_path, get_decode_size(tuning_config))
+    )
+    if in_omr is None:
+        # Error OMR case
+        return SheetResult(file_path)
+
+    logger.info("")
+    logger.info(
+        f"({files_counter}) Opening image: \t'{file_path}'\tResolution: {in_omr.shape}"
+    )
+
+    template.image_instance_ops.reset_all_save_img()
+
+    if not responses_only:
         template.image_instance_ops.append_save_img(1, in_omr)
 
-        in_omr = template.image_instance_ops.apply_preprocessors(
-            file_path, in_omr, template
-        )
+    in_omr = template.image_instance_ops.apply_preprocessors(
+        file_path, in_omr, template
+    )
 
-        if in_omr is None:
-            # Error OMR case
-            new_file_path = outputs_namespace.paths.errors_dir.joinpath(file_name)
-            outputs_namespace.OUTPUT_SET.append(
-                [file_name] + outputs_namespace.empty_resp
-            )
-            if check_and_move(
-                constants.ERROR_CODES.NO_MARKER_ERR, file_path, new_file_path
-            ):
-                err_line = [
-                    file_name,
-                    file_path,
-                    new_file_path,
-                    "NA",
-                ] + outputs_namespace.empty_resp
-                pd.DataFrame(err_line, dtype=str).T.to_csv(
-                    outputs_namespace.files_obj["Errors"],
-                    mode="a",
-                    quoting=QUOTE_NONNUMERIC,
-                    header=False,
-                    index=False,
-                )
-            continue
+    if in_omr is None:
+        # Error OMR case
+        return SheetResult(file_path)
+
+    # uniquify
+    file_id = str(file_name)
+    save_dir = paths.save_marked_dir
+    detection = template.image_instance_ops.detect_omr_response(
+        template,
+        image=in_omr,
+        name=file_id,
+        save_dir=save_dir,
+        responses_only=responses_only,
+    )
+    response_dict, final_marked = detection.omr_response, detection.final_marked
 
-        # uniquify
-        file_id = str(file_name)
-        save_dir = outputs_namespace.paths.save_marked_dir
-        (
-            response_dict,
-            final_marked,
-            multi_marked,
-            _,
-        ) = template.image_instance_ops.read_omr_response(
-            template, image=in_omr, name=file_id, save_dir=save_dir
-        )
+    # TODO: move inner try catch here
+    # concatenate roll nos, set unmarked responses, etc
+    omr_response = get_concatenated_response(response_dict, template)
 
-        # TODO: move inner try catch here
-        # concatenate roll nos, set unmarked responses, etc
-        omr_response = get_concatenated_response(response_dict, template)
+    if evaluation_config is None or not evaluation_config.get_should_explain_scoring():
+        logger.info(f"Read Response: \n{omr_response}")
 
-        if (
-            evaluation_config is None
-            or not evaluation_config.get_should_explain_scoring()
-        ):
-            logger.info(f"Read Response: \n{omr_response}")
+    score = 0
+    if evaluation_config is not None:
+        score = evaluate_concatenated_response(
+            omr_response, evaluation_config, file_path, paths.evaluation_dir
+        )
+        logger.info(
+            f"(/{files_counter}) Graded with score: {round(score, 2)}\t for file: '{file_id}'"
+        )
+    else:
+        logger.info(f"(/{files_counter}) Processed file: '{file_id}'")
 
-        score = 0
-        if evaluation_config is not None:
-            score = evaluate_concatenated_response(
-                omr_response, evaluation_config, file_path, outputs_namespace.paths.evaluation_dir
-            )
-            logger.info(
-                f"(/{files_counter}) Graded with score: {round(score, 2)}\t for file: '{file_id}'"
-            )
-        else:
-            logger.info(f"(/{files_counter}) Processed file: '{file_id}'")
-
-        if tuning_config.outputs.show_image_level >= 2:
-            InteractionUtils.show(
-                f"Final Marked Bubbles : '{file_id}'",
-                ImageUtils.resize_util_h(
-                    final_marked, int(tuning_config.dimensions.display_height * 1.3)
-                ),
-                1,
-                1,
-                config=tuning_config,
-            )
+    if tuning_config.outputs.show_image_level >= 2 and final_marked is not None:
+        InteractionUtils.show(
+            f"Final Marked Bubbles : '{file_id}'",
+            ImageUtils.resize_util_h(
+                final_marked, int(tuning_config.dimensions.display_height * 1.3)
+            ),
+            1,
+            1,
+            config=tuning_config,
+        )
+
+    resp_array = []
+    for k in template.output_columns:
+        resp_array.append(omr_response[k])
+
+    return SheetResult(
+        file_path,
+        resp_array,
+        score,
+        detection.multi_marked,
+        detection.global_thr,
+        detection.global_std_thresh,
+        detection.strip_thresholds,
+    )
 
-        resp_array = []
-        for k in template.output_columns:
-            resp_array.append(omr_response[k])
 
+def write_sheet_result(
+    sheet_result, files_counter, tuning_config, outputs_namespace, content_hash=None
+):
+    file_path = sheet_result.file_path
+    file_name = file_path.name
+    resp_array = sheet_result.resp_array
+    row = None
+
+    if resp_array is None:
+        # Error OMR case
+        status = "Errors"
+        new_file_path = outputs_namespace.paths.errors_dir.joinpath(file_name)
+        outputs_namespace.OUTPUT_SET.append([file_name] + outputs_namespace.empty_resp)
+        if check_and_move(
+            constants.ERROR_CODES.NO_MARKER_ERR, file_path, new_file_path
+        ):
+            row = [
+                file_name,
+                file_path,
+                new_file_path,
+                "NA",
+            ] + outputs_namespace.empty_resp
+    else:
+        file_id = str(file_name)
         outputs_namespace.OUTPUT_SET.append([file_name] + resp_array)
 
-        if multi_marked == 0 or not tuning_config.outputs.filter_out_multimarked_files:
+        if (
+            sheet_result.multi_marked == 0
+            or not tuning_config.outputs.filter_out_multimarked_files
+        ):
+            status = "Results"
             STATS.files_not_moved += 1
-            new_file_path = save_dir.joinpath(file_id)
+            new_file_path = outputs_namespace.paths.save_marked_dir.joinpath(file_id)
             # Enter into Results sheet-
-            results_line = [file_name, file_path, new_file_path, score] + resp_array
-            # Write/Append to results_line file(opened in append mode)
-            pd.DataFrame(results_line, dtype=str).T.to_csv(
-                outputs_namespace.files_obj["Results"],
-                mode="a",
-                quoting=QUOTE_NONNUMERIC,
-                header=False,
-                index=False,
-            )
+            row = [
+                file_name,
+                file_path,
+                new_file_path,
+                sheet_result.score,
+            ] + resp_array
         else:
             # multi_marked file
+            status = "MultiMarked"
             logger.info(f"[{files_counter}] Found multi-marked file: '{file_id}'")
             new_file_path = outputs_namespace.paths.multi_marked_dir.joinpath(file_name)
             if check_and_move(
                 constants.ERROR_CODES.MULTI_BUBBLE_WARN, file_path, new_file_path
             ):
-                mm_line = [file_name, file_path, new_file_path, "NA"] + resp_array
-                pd.DataFrame(mm_line, dtype=str).T.to_csv(
-                    outputs_namespace.files_obj["MultiMarked"],
-                    mode="a",
-                    quoting=QUOTE_NONNUMERIC,
-                    header=False,
-                    index=False,
-                )
+                row = [file_name, file_path, new_file_path, "NA"] + resp_array
             # else:
             #     TODO:  Add appropriate record handling here
             #     pass
 
-    print_stats(start_time, files_counter, tuning_config)
+    # Write/Append the row to the file of its status
+    outputs_namespace.results_sink.write_sheet(
+        status,
+        row,
+        get_results_record(sheet_result, status, new_file_path, outputs_namespace),
+        content_hash,
+    )
+
+
+def get_results_record(sheet_result, status, output_path, outputs_namespace):
+    """Typed fields of the sheet for the columnar results"""
+    record = {
+        "file_id": sheet_result.file_path.name,
+        "input_path": str(sheet_result.file_path),
+        "output_path": str(output_path),
+        "status": status,
+    }
+    if sheet_result.resp_array is not None:
+        record.update(
+            score=float(sheet_result.score),
+            multi_marked=bool(sheet_result.multi_marked),
+            global_threshold=float(sheet_result.global_thr),
+            global_std_threshold=float(sheet_result.global_std_thresh),
+            strip_thresholds=[float(thr) for thr in sheet_result.strip_thresholds],
+        )
+        record.update(zip(outputs_namespace.output_columns, sheet_result.resp_array))
+    return record
+
+
+# Per process state of the --workers pool, set once by init_worker
+WORKER_STATE = {}
+
+
+def init_worker(template, tuning_config, evaluation_config, paths, responses_only):
+    # Images can't be shown from the workers
+    for config in (tuning_config, template.image_instance_ops.tuning_config):
+        config.outputs.show_image_level = 0
+    WORKER_STATE["sheet_args"] = (
+        template,
+        tuning_config,
+        evaluation_config,
+        paths,
+        responses_only,
+    )
+
+
+def process_file_in_worker(task):
+    files_counter, file_path = task
+    template = WORKER_STATE["sheet_args"][0]
+    sheet_result = process_file(file_path, files_counter, *WORKER_STATE["sheet_args"])
+    # Pool workers exit without running the atexit handlers
+    template.image_instance_ops.flush_saved_images()
+    return sheet_result
+
+
+def process_files_in_pool(omr_files, workers, *sheet_args):
+    """Reads the sheets in a pool of worker processes, yields their results in the input order"""
+    tuning_config = sheet_args[1]
+    if tuning_config.outputs.show_image_level > 0:
+        logger.warning("Images are not shown when processing with multiple workers")
+    with multiprocessing.Pool(
+        min(workers, len(omr_files)), initializer=init_worker, initargs=sheet_args
+    ) as pool:
+        yield from pool.imap(process_file_in_worker, enumerate(omr_files, 1))
 
 
 def check_and_move(error_code, file_path, filepath2):
@@ -352,7 +495,8 @@ def print_stats(start_time, files_counter, tuning_config):
         f"{'Total file(s) processed': <27}: {files_counter} ({'Sum Tallied!' if files_counter == (STATS.files_moved + STATS.files_not_moved) else 'Not Tallying!'})"
     )
 
-    if tuning_config.outputs.show_image_level <= 0:
+    # Note: an incremental run can have no files left to process
+    if tuning_config.outputs.show_image_level <= 0 and files_counter > 0:
         log(
             f"\nFinished Checking {files_counter} file(s) in {round(time_checking, 1)} seconds i.e. ~{round(time_checking / 60, 1)} minute(s)."
         )
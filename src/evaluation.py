@@ -4,7 +4,6 @@ import re
 from copy import deepcopy
 from csv import QUOTE_NONNUMERIC
 
-import cv2
 import pandas as pd
 from rich.table import Table
 
@@ -14,6 +13,7 @@ from src.schemas.constants import (
     DEFAULT_SECTION_KEY,
     MARKING_VERDICT_TYPES,
 )
+from src.utils.decode import get_decode_size, read_image
 from src.utils.parsing import (
     get_concatenated_response,
     open_evaluation_with_validation,
@@ -198,6 +198,8 @@ class EvaluationConfig:
         self.should_explain_scoring = options.get("should_explain_scoring", False)
         self.has_non_default_section = False
         self.exclude_files = []
+        # The files the answer key was read from
+        self.answer_key_files = []
         self.enable_evaluation_table_to_csv = options.get(
             "enable_evaluation_table_to_csv", False
         )
@@ -209,6 +211,7 @@ class EvaluationConfig:
 
             answer_key_image_path = options.get("answer_key_image_path", None)
             if os.path.exists(csv_path):
+                self.answer_key_files.append(csv_path)
                 # TODO: CSV parsing/validation for each row with a (qNo, <ans string/>) pair
                 answer_key = pd.read_csv(
                     csv_path,
@@ -227,12 +230,13 @@ class EvaluationConfig:
                     raise Exception(f"Answer key image not found at '{image_path}'")
 
                 # self.exclude_files.append(image_path)
+                self.answer_key_files.append(image_path)
 
                 logger.debug(
                     f"Attempting to generate answer key from image: '{image_path}'"
                 )
                 # TODO: use a common function for below changes?
-                in_omr = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+                in_omr = read_image(image_path, get_decode_size(tuning_config))
                 in_omr = template.image_instance_ops.apply_preprocessors(
                     image_path, in_omr, template
                 )
@@ -383,6 +387,9 @@ class EvaluationConfig:
     def get_exclude_files(self):
         return self.exclude_files
 
+    def get_answer_key_files(self):
+        return self.answer_key_files
+
     @staticmethod
     def parse_answer_column(answer_column):
         if answer_column[0] == "[":
@@ -528,9 +535,8 @@ class EvaluationConfig:
             self.explanation_table.add_row(*row)
 
 
-def evaluate_concatenated_response(
-    concatenated_response, evaluation_config, file_path, evaluation_output_dir
-):
+def get_concatenated_response_score(concatenated_response, evaluation_config):
+    """The score of a response, without printing or saving its explanation"""
     evaluation_config.prepare_and_validate_omr_response(concatenated_response)
     current_score = 0.0
     for question in evaluation_config.questions_in_order:
@@ -539,6 +545,15 @@ def evaluate_concatenated_response(
             current_score, question, marked_answer
         )
         current_score += delta
+    return current_score
+
+
+def evaluate_concatenated_response(
+    concatenated_response, evaluation_config, file_path, evaluation_output_dir
+):
+    current_score = get_concatenated_response_score(
+        concatenated_response, evaluation_config
+    )
 
     evaluation_config.conditionally_print_explanation()
     evaluation_config.conditionally_save_explanation_csv(file_path, evaluation_output_dir)
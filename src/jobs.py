@@ -0,0 +1,562 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import base64
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+from functools import partial
+
+from src.logger import logger
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = (
+    "queued",
+    "running",
+    "done",
+    "failed",
+    "cancelled",
+)
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+INTERRUPTED_RESULT = {
+    "success": False,
+    "error": "The job was interrupted, its server process stopped",
+}
+
+
+class QueueFullError(Exception):
+    def __init__(self, depth):
+        super().__init__(f"The job queue is full with {depth} pending jobs")
+        self.depth = depth
+
+
+class JobQueue(ABC):
+    """
+    Interface of the job queue backends. A job has json options and the bytes of its
+    input, a result once finished, and is forgotten after its ttl.
+
+    A running job is claimed by a queue instance for lease_seconds, renewed by its
+    runner. The jobs of a runner that stopped (e.g. on a redeploy) are queued again
+    once their lease expires, and failed after max_attempts claims.
+    """
+
+    def __init__(self, max_depth, lease_seconds=60, max_attempts=2):
+        self.max_depth = max_depth
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # The claims of this instance, unique across the server processes
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    @abstractmethod
+    def submit(self, options, data, ttl):
+        """Returns the id of the new queued job, raises QueueFullError at max_depth"""
+
+    @abstractmethod
+    def claim(self):
+        """Marks the oldest queued job as running, returns (job_id, options, data) or None"""
+
+    @abstractmethod
+    def renew(self, job_ids):
+        """Extends the leases of the given running jobs claimed by this instance"""
+
+    @abstractmethod
+    def finish(self, job_id, status, result):
+        """Records the result of a job claimed by this instance, unless it was cancelled"""
+
+    @abstractmethod
+    def cancel(self, job_id):
+        """Cancels a job not finished yet, returns whether it was cancelled"""
+
+    @abstractmethod
+    def get(self, job_id, with_result=False):
+        """The status (and result) of a job as a dict, None if unknown or expired"""
+
+    @abstractmethod
+    def get_depth(self):
+        """The number of queued and running jobs"""
+
+    @abstractmethod
+    def delete_expired(self):
+        """Forgets the jobs past their ttl, returns their count"""
+
+
+def get_job_info(job_id, status, created_at, started_at, finished_at, expires_at):
+    return {
+        "job_id": job_id,
+        "status": status,
+        "created_at": created_at,
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "expires_at": expires_at,
+    }
+
+
+class MemoryJobQueue(JobQueue):
+    """Jobs kept in the memory of the server process, for a single process server"""
+
+    def __init__(self, max_depth, **kwargs):
+        super().__init__(max_depth, **kwargs)
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+
+    def recover_expired_leases(self, now):
+        # Needs self.lock
+        for job in self.jobs.values():
+            info = job["info"]
+            if info["status"] == RUNNING and job["lease_expires_at"] < now:
+                if job["attempts"] >= self.max_attempts:
+                    info.update(status=FAILED, finished_at=now)
+                    job.update(result=INTERRUPTED_RESULT, data=None)
+                else:
+                    info.update(status=QUEUED, started_at=None)
+                job.update(claimed_by=None, lease_expires_at=None)
+
+    def submit(self, options, data, ttl):
+        with self.lock:
+            self.recover_expired_leases(time.time())
+            depth = self.get_depth_unlocked()
+            if depth >= self.max_depth:
+                raise QueueFullError(depth)
+            job_id, now = uuid.uuid4().hex, time.time()
+            self.jobs[job_id] = {
+                "info": get_job_info(job_id, QUEUED, now, None, None, now + ttl),
+                "options": options,
+                "data": data,
+                "result": None,
+                "claimed_by": None,
+                "lease_expires_at": None,
+                "attempts": 0,
+            }
+            return job_id
+
+    def claim(self):
+        with self.lock:
+            now = time.time()
+            self.recover_expired_leases(now)
+            for job_id, job in self.jobs.items():
+                info = job["info"]
+                # Expired jobs are not run
+                if info["status"] == QUEUED and info["expires_at"] >= now:
+                    info.update(status=RUNNING, started_at=now)
+                    job.update(
+                        claimed_by=self.owner,
+                        lease_expires_at=now + self.lease_seconds,
+                        attempts=job["attempts"] + 1,
+                    )
+                    return job_id, job["options"], job["data"]
+        return None
+
+    def renew(self, job_ids):
+        with self.lock:
+            lease_expires_at = time.time() + self.lease_seconds
+            for job_id in job_ids:
+                job = self.jobs.get(job_id)
+                if (
+                    job is not None
+                    and job["info"]["status"] == RUNNING
+                    and job["claimed_by"] == self.owner
+                ):
+                    job["lease_expires_at"] = lease_expires_at
+
+    def finish(self, job_id, status, result):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if (
+                job is not None
+                and job["info"]["status"] == RUNNING
+                and job["claimed_by"] == self.owner
+            ):
+                job["info"].update(status=status, finished_at=time.time())
+                job.update(result=result, data=None)
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["info"]["status"] in FINISHED_STATUSES:
+                return False
+            job["info"].update(status=CANCELLED, finished_at=time.time())
+            job["data"] = None
+            return True
+
+    def get(self, job_id, with_result=False):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["info"]["expires_at"] < time.time():
+                return None
+            info = dict(job["info"])
+            if with_result:
+                info["result"] = job["result"]
+            return info
+
+    def get_depth_unlocked(self):
+        return sum(
+            job["info"]["status"] in (QUEUED, RUNNING) for job in self.jobs.values()
+        )
+
+    def get_depth(self):
+        with self.lock:
+            return self.get_depth_unlocked()
+
+    def delete_expired(self):
+        with self.lock:
+            now = time.time()
+            expired = [
+                job_id
+                for job_id, job in self.jobs.items()
+                if job["info"]["expires_at"] < now
+            ]
+            for job_id in expired:
+                del self.jobs[job_id]
+            return len(expired)
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Jobs kept in a SQLite database file, shared by the server processes on the host
+    (e.g. the gunicorn workers), with no outside service
+    """
+
+    def __init__(self, max_depth, path, **kwargs):
+        super().__init__(max_depth, **kwargs)
+        self.path = str(path)
+        with closing(self.connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    data BLOB,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    expires_at REAL NOT NULL,
+                    claimed_by TEXT,
+                    lease_expires_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            # The lease columns of the databases created without them
+            columns = [
+                row["name"] for row in connection.execute("PRAGMA table_info(jobs)")
+            ]
+            for column, definition in [
+                ("claimed_by", "TEXT"),
+                ("lease_expires_at", "REAL"),
+                ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+            ]:
+                if column not in columns:
+                    connection.execute(
+                        f"ALTER TABLE jobs ADD COLUMN {column} {definition}"
+                    )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+            )
+
+    def connect(self):
+        # A connection per call, as the callers run on different threads
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def submit(self, options, data, ttl):
+        job_id, now = uuid.uuid4().hex, time.time()
+        with closing(self.connect()) as connection:
+            # The write lock makes the depth check and the insert atomic
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.recover_expired_leases(connection, now)
+                depth = self.get_depth_with(connection)
+                if depth >= self.max_depth:
+                    raise QueueFullError(depth)
+                connection.execute(
+                    "INSERT INTO jobs (job_id, status, options, data, created_at, expires_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, QUEUED, json.dumps(options), data, now, now + ttl),
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def claim(self):
+        now = time.time()
+        with closing(self.connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.recover_expired_leases(connection, now)
+                # Expired jobs are not run
+                row = connection.execute(
+                    "SELECT job_id, options, data FROM jobs"
+                    " WHERE status = ? AND expires_at >= ? ORDER BY created_at LIMIT 1",
+                    (QUEUED, now),
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, claimed_by = ?,"
+                        " lease_expires_at = ?, attempts = attempts + 1 WHERE job_id = ?",
+                        (
+                            RUNNING,
+                            now,
+                            self.owner,
+                            now + self.lease_seconds,
+                            row["job_id"],
+                        ),
+                    )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row["job_id"], json.loads(row["options"]), row["data"]
+
+    def recover_expired_leases(self, connection, now):
+        # Needs a write transaction. Jobs claimed before the leases have none
+        connection.execute(
+            "UPDATE jobs SET status = ?, result = ?, data = NULL, finished_at = ?"
+            " WHERE status = ? AND IFNULL(lease_expires_at, 0) < ? AND attempts >= ?",
+            (
+                FAILED,
+                json.dumps(INTERRUPTED_RESULT),
+                now,
+                RUNNING,
+                now,
+                self.max_attempts,
+            ),
+        )
+        connection.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL, claimed_by = NULL,"
+            " lease_expires_at = NULL WHERE status = ? AND IFNULL(lease_expires_at, 0) < ?",
+            (QUEUED, RUNNING, now),
+        )
+
+    def renew(self, job_ids):
+        if not job_ids:
+            return
+        with closing(self.connect()) as connection:
+            connection.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE status = ? AND claimed_by = ?"
+                f" AND job_id IN ({', '.join('?' * len(job_ids))})",
+                (time.time() + self.lease_seconds, RUNNING, self.owner, *job_ids),
+            )
+
+    def finish(self, job_id, status, result):
+        with closing(self.connect()) as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, data = NULL, finished_at = ?"
+                " WHERE job_id = ? AND status = ? AND claimed_by = ?",
+                (status, json.dumps(result), time.time(), job_id, RUNNING, self.owner),
+            )
+
+    def cancel(self, job_id):
+        with closing(self.connect()) as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, data = NULL, finished_at = ?"
+                " WHERE job_id = ? AND status IN (?, ?)",
+                (CANCELLED, time.time(), job_id, QUEUED, RUNNING),
+            )
+            return cursor.rowcount > 0
+
+    def get(self, job_id, with_result=False):
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                "SELECT job_id, status, result, created_at, started_at, finished_at,"
+                " expires_at FROM jobs WHERE job_id = ? AND expires_at >= ?",
+                (job_id, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        info = get_job_info(
+            row["job_id"],
+            row["status"],
+            row["created_at"],
+            row["started_at"],
+            row["finished_at"],
+            row["expires_at"],
+        )
+        if with_result:
+            info["result"] = row["result"] and json.loads(row["result"])
+        return info
+
+    @staticmethod
+    def get_depth_with(connection):
+        return connection.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+        ).fetchone()[0]
+
+    def get_depth(self):
+        with closing(self.connect()) as connection:
+            return self.get_depth_with(connection)
+
+    def delete_expired(self):
+        with closing(self.connect()) as connection:
+            cursor = connection.execute(
+                "DELETE FROM jobs WHERE expires_at < ?", (time.time(),)
+            )
+            return cursor.rowcount
+
+
+JOB_QUEUE_BACKENDS = {"sqlite": SQLiteJobQueue, "memory": MemoryJobQueue}
+
+# The template cache of a worker process
+worker_template_cache = None
+
+
+def run_job(options, data):
+    """Processes the image of a job, in a worker process"""
+    # Imported in the worker processes only
+    from src.processing import MarkedImageOptions, process_image_data
+    from src.utils.template_cache import TemplateCache
+
+    global worker_template_cache
+    if worker_template_cache is None:
+        worker_template_cache = TemplateCache()
+    marked_image_options = MarkedImageOptions(**options["marked_image"])
+    result = process_image_data(
+        worker_template_cache,
+        data,
+        options["file_name"],
+        options["template_path"],
+        options.get("output_dir"),
+        marked_image_options,
+    )
+    # Inlined in the result, unless only saved for a url
+    marked_image_bytes = result.pop("marked_image_bytes", None)
+    result["marked_image"] = None
+    if marked_image_bytes and marked_image_options.mode != "url":
+        result["marked_image"] = base64.b64encode(marked_image_bytes).decode("utf-8")
+    return result
+
+
+class JobRunner:
+    """
+    Runs the queued jobs on a pool of worker processes, claiming a job whenever a
+    worker is free, and renewing the leases of the running jobs. Cancelling a running
+    job discards its result. on_finished is called with the options and the result
+    of each finished job.
+    """
+
+    def __init__(
+        self,
+        queue,
+        workers=1,
+        poll_interval=0.2,
+        sweep_interval=60,
+        on_finished=None,
+    ):
+        self.queue = queue
+        self.on_finished = on_finished
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self.executor = self.create_executor()
+        # The futures of the running jobs by their id
+        self.running = {}
+        self.running_lock = threading.Lock()
+        self.free_workers = threading.Semaphore(workers)
+        self.stopped = threading.Event()
+        # Moving average of the job durations, for the retry estimates
+        self.average_duration = 2.0
+        self.thread = threading.Thread(
+            target=self.dispatch, name="omr-jobs", daemon=True
+        )
+        self.thread.start()
+
+    def create_executor(self):
+        # Spawned, as the server process has threads running
+        return ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def renew_leases(self):
+        with self.running_lock:
+            job_ids = list(self.running)
+        try:
+            self.queue.renew(job_ids)
+        except Exception as e:
+            logger.error(f"Failed to renew the job leases: {e}")
+
+    def submit(self, job_id, options, data):
+        try:
+            future = self.executor.submit(run_job, options, data)
+        except BrokenProcessPool:
+            # A worker process died (e.g. killed for its memory), failing its job
+            logger.error("Restarting the job worker processes")
+            self.executor = self.create_executor()
+            future = self.executor.submit(run_job, options, data)
+        with self.running_lock:
+            self.running[job_id] = future
+        future.add_done_callback(partial(self.on_done, job_id, options, time.time()))
+
+    def dispatch(self):
+        last_sweep, last_renewal = 0, time.time()
+        while not self.stopped.is_set():
+            if time.time() - last_renewal > self.queue.lease_seconds / 3:
+                self.renew_leases()
+                last_renewal = time.time()
+
+            if time.time() - last_sweep > self.sweep_interval:
+                try:
+                    expired = self.queue.delete_expired()
+                    if expired:
+                        logger.info(f"Deleted {expired} expired jobs")
+                except Exception as e:
+                    logger.error(f"Failed to delete the expired jobs: {e}")
+                last_sweep = time.time()
+
+            if not self.free_workers.acquire(timeout=self.poll_interval):
+                continue
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                logger.error(f"Failed to claim a job: {e}")
+                job = None
+            if job is None:
+                self.free_workers.release()
+                self.stopped.wait(self.poll_interval)
+                continue
+            self.submit(*job)
+
+    def on_done(self, job_id, options, started_at, future):
+        with self.running_lock:
+            self.running.pop(job_id, None)
+        try:
+            result = future.result()
+            status = DONE if result["success"] else FAILED
+        except Exception as e:
+            result, status = {"success": False, "error": str(e)}, FAILED
+        duration = time.time() - started_at
+        self.average_duration = 0.8 * self.average_duration + 0.2 * duration
+        self.queue.finish(job_id, status, result)
+        self.free_workers.release()
+        if self.on_finished is not None:
+            try:
+                self.on_finished(options, result)
+            except Exception as e:
+                logger.error(f"Failed to handle the finished job {job_id}: {e}")
+
+    def get_retry_after(self):
+        """Seconds until a job finishes and makes room in the backlog, estimated"""
+        return max(1, math.ceil(self.average_duration / self.workers))
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,162 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import os
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+
+from dotmap import DotMap
+
+from src import constants
+from src.defaults import CONFIG_DEFAULTS
+from src.evaluation import EvaluationConfig
+from src.logger import logger
+from src.template import Template
+from src.utils.parsing import open_config_with_defaults
+from src.utils.sources import (
+    CONTAINER_EXTENSIONS,
+    IMAGE_EXTENSIONS,
+    list_container_sheets,
+)
+
+
+@dataclass(frozen=True)
+class DirectoryContext:
+    """
+    The template, config and evaluation a directory is processed with. Subdirectories
+    without their own files share the same (parsed once) context.
+    """
+
+    template: Template = None
+    tuning_config: DotMap = field(default_factory=lambda: CONFIG_DEFAULTS)
+    evaluation_config: EvaluationConfig = None
+
+
+@dataclass
+class DirectoryWork:
+    """The sheets of a directory, with their context"""
+
+    curr_dir: Path
+    context: DirectoryContext
+    omr_files: list
+    local_config_path: Path
+
+
+def scan_dir(curr_dir):
+    """
+    Lists the subdirectories, the images (incl. the sheets inside multi-page images and
+    archives) and all the file names of the directory in one pass
+    """
+    subdirs, image_files, file_names = [], [], set()
+    with os.scandir(curr_dir) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append(curr_dir.joinpath(entry.name))
+            elif entry.is_file():
+                file_names.add(entry.name)
+                if entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    image_files.append(curr_dir.joinpath(entry.name))
+                elif entry.name.lower().endswith(CONTAINER_EXTENSIONS):
+                    image_files.extend(
+                        list_container_sheets(curr_dir.joinpath(entry.name))
+                    )
+    return subdirs, sorted(image_files), file_names
+
+
+def get_local_context(curr_dir, file_names, context, set_layout):
+    """The context of the directory, the parent's one unless it has its own files"""
+    # Update local tuning_config (in current recursion stack)
+    if constants.CONFIG_FILENAME in file_names:
+        context = replace(
+            context,
+            tuning_config=open_config_with_defaults(
+                curr_dir.joinpath(constants.CONFIG_FILENAME)
+            ),
+        )
+
+    # Update local template (in current recursion stack)
+    local_template_exists = constants.TEMPLATE_FILENAME in file_names
+    if local_template_exists:
+        context = replace(
+            context,
+            template=Template(
+                curr_dir.joinpath(constants.TEMPLATE_FILENAME),
+                context.tuning_config,
+            ),
+        )
+
+    if not set_layout and constants.EVALUATION_FILENAME in file_names:
+        local_evaluation_path = curr_dir.joinpath(constants.EVALUATION_FILENAME)
+        if not local_template_exists:
+            logger.warning(
+                f"Found an evaluation file without a parent template file: {local_evaluation_path}"
+            )
+        context = replace(
+            context,
+            evaluation_config=EvaluationConfig(
+                curr_dir,
+                local_evaluation_path,
+                context.template,
+                context.tuning_config,
+            ),
+        )
+    return context
+
+
+def get_excluded_files(context):
+    # Exclude images (take union over all pre_processors)
+    excluded_files = set()
+    if context.template:
+        for pp in context.template.pre_processors:
+            excluded_files.update(Path(p) for p in pp.exclude_files())
+    if context.evaluation_config:
+        excluded_files.update(
+            Path(exclude_file)
+            for exclude_file in context.evaluation_config.get_exclude_files()
+        )
+    return excluded_files
+
+
+def plan_dir(curr_dir, set_layout, context):
+    """
+    Walks the directory tree once, parent directories first, and yields the work of each
+    directory with images. The work is planned lazily, along with the processing.
+    """
+    subdirs, omr_files, file_names = scan_dir(curr_dir)
+    context = get_local_context(curr_dir, file_names, context, set_layout)
+
+    excluded_files = get_excluded_files(context)
+    omr_files = [f for f in omr_files if f not in excluded_files]
+
+    if omr_files:
+        if not context.template:
+            logger.error(
+                f"Found images, but no template in the directory tree \
+                of '{curr_dir}'. \nPlace {constants.TEMPLATE_FILENAME} in the \
+                appropriate directory."
+            )
+            raise Exception(
+                f"No template file found in the directory tree of {curr_dir}"
+            )
+        yield DirectoryWork(
+            curr_dir,
+            context,
+            omr_files,
+            curr_dir.joinpath(constants.CONFIG_FILENAME),
+        )
+
+    elif not subdirs:
+        # Each subdirectory should have images or should be non-leaf
+        logger.info(
+            f"No valid images or sub-folders found in {curr_dir}.\
+            Empty directories not allowed."
+        )
+
+    # recursively plan sub-folders
+    for d in subdirs:
+        yield from plan_dir(d, set_layout, context)
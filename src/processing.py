@@ -0,0 +1,194 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+
+import cv2
+
+from src.evaluation import get_concatenated_response_score
+from src.utils.decode import decode_image, get_decode_size
+from src.utils.file import Paths
+from src.utils.parsing import get_concatenated_response
+
+MARKED_IMAGE_MODES = ("full", "thumbnail", "url", "none")
+# Extension and quality flag of the marked image formats
+MARKED_IMAGE_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", None),
+}
+UPLOAD_FORMATS = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png", ".webp": "webp"}
+
+
+@dataclass(frozen=True)
+class MarkedImageOptions:
+    """How the marked image of a processed image is returned"""
+
+    # The full image or a thumbnail inline, only saved (for a url), or not rendered
+    mode: str = "full"
+    # Longest edge of the thumbnails
+    max_edge: int = 800
+    # jpeg, webp or png, defaults to the format of the uploaded file
+    format: str = None
+    # Quality of jpeg and webp images (1-100), defaults to OpenCV's
+    quality: int = None
+
+    def __post_init__(self):
+        if self.mode not in MARKED_IMAGE_MODES:
+            raise ValueError(
+                f"Invalid marked image mode '{self.mode}', expected one of {MARKED_IMAGE_MODES}"
+            )
+        if self.format is not None and self.format not in MARKED_IMAGE_FORMATS:
+            raise ValueError(
+                f"Invalid marked image format '{self.format}', expected one of {tuple(MARKED_IMAGE_FORMATS)}"
+            )
+        if self.quality is not None and not 1 <= self.quality <= 100:
+            raise ValueError(f"Invalid marked image quality {self.quality}")
+        if self.max_edge < 1:
+            raise ValueError(f"Invalid thumbnail max edge {self.max_edge}")
+
+    @property
+    def responses_only(self):
+        return self.mode == "none"
+
+    def get_format(self, file_name):
+        if self.format is not None:
+            return self.format
+        return UPLOAD_FORMATS.get(Path(file_name).suffix.lower(), "jpeg")
+
+    def encode(self, marked_image, file_name):
+        """The encoded marked image, with the extension of its format"""
+        if self.mode == "thumbnail":
+            height, width = marked_image.shape[:2]
+            scale = self.max_edge / max(height, width)
+            if scale < 1:
+                marked_image = cv2.resize(
+                    marked_image,
+                    (max(1, int(width * scale)), max(1, int(height * scale))),
+                    interpolation=cv2.INTER_AREA,
+                )
+        extension, quality_flag = MARKED_IMAGE_FORMATS[self.get_format(file_name)]
+        params = []
+        if quality_flag is not None and self.quality is not None:
+            params = [quality_flag, self.quality]
+        ok, encoded = cv2.imencode(extension, marked_image, params)
+        return (encoded.tobytes() if ok else None), extension
+
+
+def process_image_data(
+    template_cache,
+    image_data,
+    file_name,
+    template_path,
+    output_dir=None,
+    marked_image_options=None,
+):
+    """
+    Processes the encoded bytes of a single OMR image in memory, with a template of the
+    template cache. The marked image is saved only into the given output_dir.
+
+    Returns a dict of the results (answers, score, etc.), with the marked image encoded
+    as per the marked_image_options in 'marked_image_bytes'.
+    """
+    if marked_image_options is None:
+        marked_image_options = MarkedImageOptions()
+    try:
+        # The template is reused across images until its files change
+        with template_cache.acquire(template_path) as instance:
+            template, tuning_config, evaluation_config = instance
+            in_omr = decode_image(image_data, get_decode_size(tuning_config))
+            if in_omr is None:
+                return {"success": False, "error": "Failed to read image"}
+            result = run_omr_template(
+                template,
+                evaluation_config,
+                in_omr,
+                file_name,
+                marked_image_options.responses_only,
+            )
+
+        marked_image = result.pop("marked_image")
+        result["marked_image_bytes"] = None
+        result["marked_image_format"] = None
+        result["marked_image_path"] = None
+        if marked_image is None:
+            return result
+        marked_image_bytes, extension = marked_image_options.encode(
+            marked_image, file_name
+        )
+        result["marked_image_bytes"] = marked_image_bytes
+        result["marked_image_format"] = marked_image_options.get_format(file_name)
+
+        if output_dir is not None and marked_image_bytes is not None:
+            paths = Paths(Path(output_dir))
+            paths.save_marked_dir.mkdir(parents=True, exist_ok=True)
+            marked_image_path = paths.save_marked_dir.joinpath(
+                Path(file_name).stem + extension
+            )
+            marked_image_path.write_bytes(marked_image_bytes)
+            result["marked_image_path"] = str(marked_image_path)
+
+        return result
+
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "traceback": traceback.format_exc(),
+        }
+
+
+def run_omr_template(template, evaluation_config, in_omr, file_id, responses_only):
+    """Processes a decoded OMR image with a loaded template, see process_image_data"""
+    image_instance_ops = template.image_instance_ops
+    image_instance_ops.reset_all_save_img()
+    if not responses_only:
+        image_instance_ops.append_save_img(1, in_omr)
+
+    in_omr = image_instance_ops.apply_preprocessors(file_id, in_omr, template)
+    if in_omr is None:
+        return {
+            "success": False,
+            "error": "Image preprocessing failed - markers not detected",
+            "marked_image": None,
+        }
+
+    # Nothing is written to disk without a save_dir
+    detection = image_instance_ops.detect_omr_response(
+        template,
+        image=in_omr,
+        name=file_id,
+        save_dir=None,
+        responses_only=responses_only,
+    )
+    omr_response = get_concatenated_response(detection.omr_response, template)
+    answers_array = [omr_response.get(k, "-") for k in template.output_columns]
+
+    # Scored against the evaluation.json next to the template, if any
+    score = None
+    if evaluation_config is not None:
+        score = get_concatenated_response_score(omr_response, evaluation_config)
+
+    return {
+        "success": True,
+        "file_name": file_id,
+        "answers": omr_response,
+        "answers_array": answers_array,
+        "score": score,
+        "multi_marked_count": detection.multi_marked,
+        "thresholds": {
+            "global": float(detection.global_thr),
+            "global_std": float(detection.global_std_thresh),
+            "strips": [float(thr) for thr in detection.strip_thresholds],
+        },
+        "marked_image": detection.final_marked,
+        "output_columns": template.output_columns,
+        "total_questions": len([k for k in omr_response.keys() if k.startswith("Q")]),
+    }
@@ -29,6 +29,10 @@ CONFIG_SCHEMA = {
                     "enum": ["white", "black"],
                     "type": "string",
                 },
+                "THRESHOLD_METHOD": {
+                    "enum": ["iterative", "vectorized"],
+                    "type": "string",
+                },
             },
         },
         "alignment_params": {
@@ -42,6 +46,16 @@ CONFIG_SCHEMA = {
                 "thickness": {"type": "integer", "minimum": 1, "maximum": 10},
             },
         },
+        "processing": {
+            "type": "object",
+            "additionalProperties": False,
+            "properties": {
+                "prefetch_depth": {"type": "integer", "minimum": 0, "maximum": 32},
+                "max_prefetch_mb": {"type": "integer", "minimum": 1},
+                "decode_threads": {"type": "integer", "minimum": 1, "maximum": 16},
+                "reduced_decode": {"type": "boolean"},
+            },
+        },
         "outputs": {
             "type": "object",
             "additionalProperties": False,
@@ -49,6 +63,8 @@ CONFIG_SCHEMA = {
                 "show_image_level": {"type": "integer", "minimum": 0, "maximum": 6},
                 "save_image_level": {"type": "integer", "minimum": 0, "maximum": 6},
                 "save_detections": {"type": "boolean"},
+                "save_parquet": {"type": "boolean"},
+                "max_debug_images_mb": {"type": "integer", "minimum": 1},
                 # This option moves multimarked files into a separate folder for manual checking, skipping evaluation
                 "filter_out_multimarked_files": {"type": "boolean"},
             },
@@ -6,6 +6,8 @@
  Github: https://github.com/Udayraj123
 
 """
+import numpy as np
+
 from src.constants import FIELD_TYPES
 from src.core import ImageInstanceOps
 from src.logger import logger
@@ -61,6 +63,9 @@ class Template:
 
         self.validate_template_columns(non_custom_columns, all_custom_columns)
 
+        # Flat arrays used by the per-sheet hot paths
+        self.compiled = CompiledTemplate(self.field_blocks)
+
     def parse_output_columns(self, output_columns_array):
         self.output_columns = parse_fields(f"Output Columns", output_columns_array)
 
@@ -205,10 +210,111 @@ class Template:
                 f"Overflowing field block '{block_name}' with origin {block_instance.origin} and dimensions {block_instance.dimensions} in template with dimensions {self.page_dimensions}"
             )
 
+    def get_block_shifts(self):
+        return np.array(
+            [field_block.shift for field_block in self.field_blocks], dtype=np.int64
+        )
+
     def __str__(self):
         return str(self.path)
 
 
+class CompiledTemplate:
+    """
+    Read-only struct-of-arrays form of the bubble grid, built once per template.
+
+    Bubbles are stored in the same order as traversing
+    field_blocks -> traverse_bubbles -> Bubble, and each question strip
+    (i.e. one field label of a block) owns the bubble range
+    strip_offsets[i]:strip_offsets[i + 1]. Similarly each field block owns the
+    strip range block_offsets[j]:block_offsets[j + 1].
+
+    All numbers live in a few contiguous numpy buffers (instead of one python
+    object per bubble), so forked workers can share them without copy-on-write
+    page dirtying from refcount updates.
+    """
+
+    def __init__(self, field_blocks):
+        block_names, block_empty_vals = [], []
+        block_origins, block_dimensions, block_bubble_dimensions = [], [], []
+        field_labels, bubble_values, value_codes = [], [], {}
+        strip_offsets, strip_block_ids = [0], []
+        bubble_xs, bubble_ys, bubble_block_ids, bubble_value_ids = [], [], [], []
+
+        for block_id, field_block in enumerate(field_blocks):
+            block_names.append(field_block.name)
+            block_empty_vals.append(field_block.empty_val)
+            block_origins.append(field_block.origin)
+            block_dimensions.append(field_block.dimensions)
+            block_bubble_dimensions.append(field_block.bubble_dimensions)
+            for field_block_bubbles in field_block.traverse_bubbles:
+                field_labels.append(field_block_bubbles[0].field_label)
+                strip_block_ids.append(block_id)
+                for bubble in field_block_bubbles:
+                    field_value = bubble.field_value
+                    if field_value not in value_codes:
+                        value_codes[field_value] = len(bubble_values)
+                        bubble_values.append(field_value)
+                    bubble_xs.append(bubble.x)
+                    bubble_ys.append(bubble.y)
+                    bubble_block_ids.append(block_id)
+                    bubble_value_ids.append(value_codes[field_value])
+                strip_offsets.append(len(bubble_xs))
+
+        # Lookup tables for the integer codes
+        self.block_names = tuple(block_names)
+        self.block_empty_vals = tuple(block_empty_vals)
+        self.field_labels = tuple(field_labels)
+        self.bubble_values = tuple(bubble_values)
+
+        # Per block arrays
+        self.block_origins = self.freeze(block_origins, (-1, 2))
+        self.block_dimensions = self.freeze(block_dimensions, (-1, 2))
+        self.block_bubble_dimensions = self.freeze(block_bubble_dimensions, (-1, 2))
+
+        # Per strip arrays
+        self.block_offsets = self.freeze(
+            np.searchsorted(strip_block_ids, np.arange(len(block_names) + 1))
+        )
+        self.strip_offsets = self.freeze(strip_offsets)
+        self.strip_block_ids = self.freeze(strip_block_ids)
+        self.strip_lengths = self.freeze(np.diff(self.strip_offsets))
+        # Note: field labels are unique in a template, so label id == strip id
+        self.strip_label_ids = self.freeze(np.arange(len(field_labels)))
+
+        # Per bubble arrays
+        self.bubble_xs = self.freeze(bubble_xs)
+        self.bubble_ys = self.freeze(bubble_ys)
+        self.bubble_block_ids = self.freeze(bubble_block_ids)
+        self.bubble_value_ids = self.freeze(bubble_value_ids)
+        self.bubble_strip_ids = self.freeze(
+            np.repeat(np.arange(len(field_labels)), self.strip_lengths)
+        )
+        self.bubble_box_ws = self.freeze(
+            self.block_bubble_dimensions[self.bubble_block_ids, 0]
+        )
+        self.bubble_box_hs = self.freeze(
+            self.block_bubble_dimensions[self.bubble_block_ids, 1]
+        )
+
+    @staticmethod
+    def freeze(values, shape=(-1,)):
+        array = np.ascontiguousarray(values, dtype=np.int64).reshape(shape)
+        array.flags.writeable = False
+        return array
+
+    @property
+    def num_bubbles(self):
+        return len(self.bubble_xs)
+
+    @property
+    def num_strips(self):
+        return len(self.field_labels)
+
+    def get_shifted_xs(self, block_shifts):
+        return self.bubble_xs + block_shifts[self.bubble_block_ids]
+
+
 class FieldBlock:
     def __init__(self, block_name, field_block_object):
         self.name = block_name
@@ -0,0 +1,115 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.template import Template
+from src.utils.alignment import (
+    clip_roi,
+    find_field_block_shifts,
+    get_border_morphs,
+    get_border_rois,
+)
+from src.utils.image import CLAHE_HELPER, ImageUtils
+from src.utils.parsing import open_config_with_defaults
+
+
+def find_shift_stepwise(morph_v, s, d, match_col, max_steps, stride, thk):
+    # Reference: the step-wise search previously done for each field block
+    shift, steps = 0, 0
+    while steps < max_steps:
+        left_mean = np.mean(
+            morph_v[
+                s[1] : s[1] + d[1], s[0] + shift - thk : -thk + s[0] + shift + match_col
+            ]
+        )
+        right_mean = np.mean(
+            morph_v[
+                s[1] : s[1] + d[1],
+                s[0] + shift - match_col + d[0] + thk : thk + s[0] + shift + d[0],
+            ]
+        )
+        left_shift, right_shift = left_mean > 100, right_mean > 100
+        if left_shift:
+            if right_shift:
+                break
+            shift -= stride
+        else:
+            if right_shift:
+                shift += stride
+            else:
+                break
+        steps += 1
+    return shift
+
+
+# The reference search takes means of empty slices near the page borders
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_block_shifts_match_stepwise_search():
+    rng = np.random.default_rng(0)
+    morph_v = np.zeros((300, 400), dtype=np.uint8)
+    # Vertical bars resembling the eroded field block borders
+    for x in rng.integers(0, 400, 40):
+        morph_v[:, x : x + rng.integers(2, 8)] = 255
+    morph_v[rng.random(morph_v.shape) < 0.05] = 255
+
+    count = 300
+    # Include blocks touching (or crossing) the page borders
+    origins = np.stack(
+        [rng.integers(-10, 380, count), rng.integers(-10, 290, count)], axis=1
+    )
+    dimensions = np.stack(
+        [rng.integers(5, 120, count), rng.integers(5, 120, count)], axis=1
+    )
+    for match_col, max_steps, stride, thk in [(5, 20, 1, 3), (3, 7, 2, 1)]:
+        alignment = find_field_block_shifts(
+            morph_v, origins, dimensions, match_col, max_steps, stride, thk
+        )
+        expected_shifts = [
+            find_shift_stepwise(morph_v, s, d, match_col, max_steps, stride, thk)
+            for s, d in zip(origins, dimensions)
+        ]
+        assert alignment.shifts.tolist() == expected_shifts
+
+
+def get_page_morph_v(image, gamma_low):
+    # Reference: the morphology previously done over the whole page
+    morph = CLAHE_HELPER.apply(image)
+    morph = ImageUtils.adjust_gamma(morph, gamma_low)
+    _, morph = cv2.threshold(morph, 220, 220, cv2.THRESH_TRUNC)
+    morph = ImageUtils.normalize_util(morph)
+    v_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 10))
+    morph_v = cv2.morphologyEx(morph, cv2.MORPH_OPEN, v_kernel, iterations=3)
+    _, morph_v = cv2.threshold(morph_v, 200, 200, cv2.THRESH_TRUNC)
+    morph_v = 255 - ImageUtils.normalize_util(morph_v)
+    _, morph_v = cv2.threshold(morph_v, 60, 255, cv2.THRESH_BINARY)
+    return cv2.erode(morph_v, np.ones((5, 5), np.uint8), iterations=2)
+
+
+def test_border_morphs_match_page_morphology():
+    template = Template(
+        Path("samples/sample1/template.json"),
+        open_config_with_defaults(Path("samples/sample1/config.json")),
+    )
+    image = cv2.imread("samples/sample1/MobileCamera/sheet1.jpg", cv2.IMREAD_GRAYSCALE)
+    image = ImageUtils.normalize_util(
+        ImageUtils.resize_util(image, *template.page_dimensions)
+    )
+    compiled = template.compiled
+    alignment_args = (compiled.block_origins, compiled.block_dimensions, 5, 20, 1, 3)
+    rois = get_border_rois(*alignment_args)
+
+    page_morph_v = get_page_morph_v(image, 0.7)
+    morph, morph_v = get_border_morphs(image, rois, 0.7, keep_morph=True)
+
+    assert morph.shape == morph_v.shape == image.shape
+    for roi in rois:
+        x0, y0, x1, y1 = clip_roi(roi, image.shape)
+        assert np.array_equal(
+            morph_v[y0:y1, x0:x1], page_morph_v[y0:y1, x0:x1]
+        ), f"Mismatch in border band {roi}"
+    assert np.array_equal(
+        find_field_block_shifts(morph_v, *alignment_args).shifts,
+        find_field_block_shifts(page_morph_v, *alignment_args).shifts,
+    )
@@ -10,7 +10,7 @@ def read_file(path):
         return file.read()
 
 
-def run_sample(mocker, sample_path):
+def run_sample(mocker, sample_path, **extra_args):
     setup_mocker_patches(mocker)
 
     input_path = os.path.join("samples", sample_path)
@@ -20,7 +20,7 @@ def run_sample(mocker, sample_path):
             f"Warning: output directory already exists: {output_dir}. This may affect the test execution."
         )
 
-    run_entry_point(input_path, output_dir)
+    run_entry_point(input_path, output_dir, **extra_args)
 
     sample_outputs = extract_sample_outputs(output_dir)
 
@@ -110,3 +110,9 @@ def test_run_community_UmarFarootAPS(mocker, snapshot):
 def test_run_community_UPSC_mock(mocker, snapshot):
     sample_outputs = run_sample(mocker, "community/UPSC-mock")
     assert snapshot == sample_outputs
+
+
+def test_run_community_UPSC_mock_with_workers(mocker):
+    # The worker pool writes the same outputs, in the same order
+    sample_outputs = run_sample(mocker, "community/UPSC-mock")
+    assert run_sample(mocker, "community/UPSC-mock", workers=3) == sample_outputs
@@ -0,0 +1,30 @@
+from copy import deepcopy
+
+from benchmarks.bench_pipeline import get_regressions, run_benchmarks
+
+
+def test_stage_timings_and_regression_gate():
+    results = run_benchmarks(["samples/sample1"], [60], 2, repeats=1)
+
+    assert list(results["sets"]) == ["sample1/MobileCamera", "synthetic-60"]
+    sample_stages = results["sets"]["sample1/MobileCamera"]["stages"]
+    for stage in [
+        "decode",
+        "preprocess:CropPage",
+        "preprocess:CropOnMarkers",
+        "sampling",
+        "thresholding",
+        "detection",
+        "output",
+    ]:
+        assert sample_stages[stage]["p95_ms"] >= sample_stages[stage]["p50_ms"] > 0
+    assert results["sets"]["synthetic-60"]["sheets"] == 2
+    assert results["sets"]["synthetic-60"]["failed"] == 0
+
+    assert get_regressions(results, results, tolerance=0, min_ms=0) == []
+    baseline = deepcopy(results)
+    baseline["sets"]["synthetic-60"]["stages"]["decode"]["p50_ms"] /= 2
+    (regression,) = get_regressions(results, baseline, tolerance=0.25, min_ms=0)
+    assert regression.startswith("synthetic-60 / decode")
+    # Within the absolute slack
+    assert get_regressions(results, baseline, tolerance=0.25, min_ms=1e6) == []
@@ -0,0 +1,40 @@
+import pytest
+
+from src.utils.columnar import ParquetResultsWriter
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def test_parquet_results_in_row_groups(tmp_path):
+    path = tmp_path / "Results.parquet"
+    writer = ParquetResultsWriter(path, ["Roll", "q1"], row_group_rows=2)
+    for i in range(5):
+        writer.append(
+            {
+                "file_id": f"sheet{i}.jpg",
+                "input_path": f"inputs/sheet{i}.jpg",
+                "output_path": f"outputs/sheet{i}.jpg",
+                "status": "Results",
+                "score": i / 2,
+                "multi_marked": i == 3,
+                "global_threshold": 120.5,
+                "global_std_threshold": 10.0,
+                "strip_thresholds": [100.0, 110.5],
+                "Roll": f"10{i}",
+                "q1": "A",
+            }
+        )
+    # Unreadable sheets only have the file fields
+    writer.append({"file_id": "error.jpg", "status": "Errors"})
+    writer.close()
+
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.metadata.num_row_groups == 3
+    table = parquet_file.read()
+    assert table.schema.field("score").type == pa.float64()
+    assert table.schema.field("multi_marked").type == pa.bool_()
+    assert table.schema.field("strip_thresholds").type == pa.list_(pa.float64())
+    assert table.column("Roll").to_pylist() == ["100", "101", "102", "103", "104", None]
+    assert table.column("score").to_pylist() == [0.0, 0.5, 1.0, 1.5, 2.0, None]
+    assert table.column("multi_marked").to_pylist()[2:4] == [False, True]
@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+from dotmap import DotMap
+
+from src.core import ImageInstanceOps
+from src.defaults import CONFIG_DEFAULTS
+from src.utils.debug_images import DebugImageStore
+
+DIMENSIONS = DotMap({"display_height": 200, "display_width": 300})
+
+
+def test_instances_keep_separate_debug_images():
+    config = CONFIG_DEFAULTS.copy()
+    config.outputs = DotMap({**CONFIG_DEFAULTS.outputs.toDict(), "save_image_level": 2})
+    first_ops, second_ops = ImageInstanceOps(config), ImageInstanceOps(config)
+
+    first_ops.append_save_img(1, np.zeros((10, 10), np.uint8))
+
+    assert len(first_ops.debug_images.images[1]) == 1
+    assert len(second_ops.debug_images.images[1]) == 0
+
+
+def test_images_are_downsized_within_budget():
+    store = DebugImageStore(3, DIMENSIONS, max_bytes=150_000)
+    image = np.full((400, 600), 128, np.uint8)
+
+    store.append(1, image)
+    store.append(2, image[:100])
+    # Over the budget of the sheet
+    store.append(3, image)
+    # Above the save level
+    store.append(4, image)
+
+    assert [img.shape for img in store.images[1]] == [(200, 300)]
+    assert [img.shape for img in store.images[2]] == [(100, 600)]
+    assert store.images[3] == [] and store.images[4] == []
+    assert store.stored_bytes == 200 * 300 + 100 * 600
+
+    store.reset()
+    assert store.stored_bytes == 0 and store.images[1] == []
+
+
+def test_stack_matches_resized_hstack(tmp_path):
+    store = DebugImageStore(1, DIMENSIONS, max_bytes=10**7)
+    rng = np.random.default_rng(0)
+    images = [
+        rng.integers(0, 256, shape, dtype=np.uint8)
+        for shape in [(150, 100), (300, 500), (200, 40)]
+    ]
+    for image in images:
+        store.append(1, image)
+
+    # Reference: the full hstack at the display height, resized to the stack width
+    full_stack = np.hstack(
+        [
+            cv2.resize(img, (int(img.shape[1] * 200 / img.shape[0]), 200))
+            for img in images
+        ]
+    )
+    stack_width = min(len(images) * 300 // 3, int(300 * 2.5))
+    expected = cv2.resize(
+        full_stack,
+        (stack_width, int(full_stack.shape[0] * stack_width / full_stack.shape[1])),
+    )
+    stack = store.get_stack(1)
+    assert stack.shape == expected.shape
+
+    (tmp_path / "stack").mkdir()
+    store.save_stack(1, "sheet.jpg", tmp_path)
+    store.flush()
+    assert (
+        cv2.imread(str(tmp_path / "stack" / "sheet_1_stack.jpg")).shape[:2]
+        == stack.shape
+    )
@@ -0,0 +1,49 @@
+import io
+
+import cv2
+import numpy as np
+
+from src.utils.decode import get_decode_flag, get_jpeg_size, read_image
+
+
+def test_jpeg_size_from_header(tmp_path):
+    image = np.random.default_rng(0).integers(0, 255, (300, 200), np.uint8)
+    ok, encoded = cv2.imencode(".jpg", image)
+    assert ok
+    assert get_jpeg_size(io.BytesIO(encoded.tobytes())) == (200, 300)
+    ok, encoded = cv2.imencode(".png", image)
+    assert get_jpeg_size(io.BytesIO(encoded.tobytes())) is None
+    assert get_jpeg_size(io.BytesIO(b"\xff\xd8\xff")) is None
+
+
+def test_decode_flag_keeps_the_processing_size():
+    processing_size = (666, 820)
+    assert get_decode_flag((3120, 4160), processing_size) == (
+        cv2.IMREAD_REDUCED_GRAYSCALE_2
+    )
+    assert get_decode_flag((7200, 9600), processing_size) == (
+        cv2.IMREAD_REDUCED_GRAYSCALE_8
+    )
+    # Rotated by the EXIF orientation after decoding
+    assert get_decode_flag((4160, 3120), processing_size) == (
+        cv2.IMREAD_REDUCED_GRAYSCALE_2
+    )
+    assert get_decode_flag((1700, 2000), processing_size) == (
+        cv2.IMREAD_REDUCED_GRAYSCALE_2
+    )
+    assert get_decode_flag((1400, 1700), processing_size) == cv2.IMREAD_GRAYSCALE
+    assert get_decode_flag((3120, 4160), None) == cv2.IMREAD_GRAYSCALE
+    assert get_decode_flag(None, processing_size) == cv2.IMREAD_GRAYSCALE
+
+
+def test_decode_flag_of_landscape_sheets():
+    # 1000x750 at a factor of 4, which would scale the 750 side up to 820
+    assert get_decode_flag((4000, 3000), (666, 820)) == (cv2.IMREAD_REDUCED_GRAYSCALE_2)
+
+
+def test_read_image_reduced(tmp_path):
+    file_path = tmp_path / "sheet.jpg"
+    cv2.imwrite(str(file_path), np.full((2000, 1700), 200, np.uint8))
+    assert read_image(file_path).shape == (2000, 1700)
+    assert read_image(file_path, (666, 820)).shape == (1000, 850)
+    assert read_image(tmp_path / "missing.jpg") is None
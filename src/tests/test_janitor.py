@@ -0,0 +1,63 @@
+import os
+import time
+
+from src.utils.janitor import StorageJanitor
+
+
+def make_session(root, name, size, age=0):
+    session_dir = root / name / "CheckedOMRs"
+    session_dir.mkdir(parents=True)
+    (session_dir / "sheet.jpg").write_bytes(b"0" * size)
+    created_at = time.time() - age
+    os.utime(root / name, (created_at, created_at))
+    return root / name
+
+
+def test_ttl_and_quota(tmp_path):
+    uploads, results = tmp_path / "uploads", tmp_path / "results"
+    uploads.mkdir()
+    results.mkdir()
+    janitor = StorageJanitor([uploads, results], ttl=60, quota=250, min_idle=10)
+
+    expired = make_session(uploads, "expired", 100, age=120)
+    oldest = make_session(results, "oldest", 100, age=30)
+    newer = make_session(results, "newer", 100, age=20)
+    # Sessions written by another process are picked up by the sweep
+    assert janitor.sweep() == (1, 0)
+    assert not expired.exists() and oldest.exists()
+    assert janitor.get_stats()["size_bytes"] == 200
+
+    # Past the quota, the oldest sessions are evicted first
+    make_session(uploads, "newest", 50)
+    janitor.register(make_session(results, "newest", 50).name)
+    assert janitor.wake.is_set()
+    assert janitor.sweep() == (0, 1)
+    assert not oldest.exists() and newer.exists()
+
+    stats = janitor.get_stats()
+    assert (stats["sessions"], stats["size_bytes"]) == (2, 200)
+    assert (stats["expired_sessions"], stats["evicted_sessions"]) == (1, 1)
+    assert stats["deleted_bytes"] == 200 and stats["sweeps"] == 2
+
+
+def test_sessions_being_written(tmp_path):
+    uploads, results = tmp_path / "uploads", tmp_path / "results"
+    uploads.mkdir()
+    results.mkdir()
+    janitor = StorageJanitor([uploads, results], ttl=60, quota=1000, min_idle=10)
+
+    session = make_session(results, "session", 100)
+    janitor.sweep()
+    # Files written after the session was found, in a subdirectory
+    (session / "CheckedOMRs" / "sheet2.jpg").write_bytes(b"0" * 100)
+    janitor.sweep()
+    assert janitor.get_stats()["size_bytes"] == 200
+
+    # A session past its ttl is kept while it is written to
+    make_session(uploads, "written", 100, age=120)
+    written = make_session(results, "written", 100)
+    assert janitor.sweep() == (0, 0)
+    os.utime(written, (time.time() - 20, time.time() - 20))
+    assert janitor.sweep() == (1, 0)
+    assert not written.exists() and not (uploads / "written").exists()
+    assert session.exists()
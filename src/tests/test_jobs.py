@@ -0,0 +1,131 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from src.jobs import (
+    CANCELLED,
+    DONE,
+    FAILED,
+    INTERRUPTED_RESULT,
+    QUEUED,
+    RUNNING,
+    JobQueue,
+    JobRunner,
+    MemoryJobQueue,
+    QueueFullError,
+    SQLiteJobQueue,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def job_queue(request, tmp_path):
+    if request.param == "memory":
+        return MemoryJobQueue(max_depth=2)
+    return SQLiteJobQueue(max_depth=2, path=tmp_path / "jobs.sqlite3")
+
+
+def test_queue_backlog_and_cancellation(job_queue):
+    first_id = job_queue.submit({"file_name": "a.jpg"}, b"a", ttl=60)
+    second_id = job_queue.submit({"file_name": "b.jpg"}, b"b", ttl=60)
+    with pytest.raises(QueueFullError):
+        job_queue.submit({"file_name": "c.jpg"}, b"c", ttl=60)
+
+    assert job_queue.claim() == (first_id, {"file_name": "a.jpg"}, b"a")
+    assert job_queue.get(first_id)["status"] == RUNNING
+    assert job_queue.cancel(second_id)
+    assert job_queue.claim() is None
+    assert job_queue.get_depth() == 1
+
+    job_queue.finish(first_id, DONE, {"success": True})
+    job = job_queue.get(first_id, with_result=True)
+    assert (job["status"], job["result"]) == (DONE, {"success": True})
+    assert not job_queue.cancel(first_id)
+    assert job_queue.get(second_id)["status"] == CANCELLED
+
+    # A running job cancelled meanwhile keeps its cancelled status
+    third_id = job_queue.submit({}, b"", ttl=60)
+    job_queue.claim()
+    job_queue.cancel(third_id)
+    job_queue.finish(third_id, DONE, {"success": True})
+    assert job_queue.get(third_id, with_result=True)["result"] is None
+
+
+def test_incomplete_backend():
+    class IncompleteJobQueue(JobQueue):
+        def submit(self, options, data, ttl):
+            return "job"
+
+    with pytest.raises(TypeError):
+        IncompleteJobQueue(max_depth=2)
+
+
+def test_queue_ttl(job_queue):
+    expired_id = job_queue.submit({}, b"", ttl=-1)
+    job_id = job_queue.submit({}, b"", ttl=60)
+    # Expired jobs are neither run nor reported
+    assert job_queue.claim()[0] == job_id
+    assert job_queue.get(expired_id) is None
+    assert job_queue.delete_expired() == 1
+    assert job_queue.get(job_id)["status"] == RUNNING
+
+
+def test_expired_leases(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    stopped_queue = SQLiteJobQueue(max_depth=2, path=path, lease_seconds=0.5)
+    job_id = stopped_queue.submit({}, b"a", ttl=60)
+    assert stopped_queue.claim()[0] == job_id
+
+    # The job of a stopped runner is queued again once its lease expires
+    job_queue = SQLiteJobQueue(max_depth=2, path=path, lease_seconds=0.5)
+    assert job_queue.claim() is None
+    time.sleep(0.6)
+    assert job_queue.claim() == (job_id, {}, b"a")
+    stopped_queue.finish(job_id, DONE, {"success": True})
+    assert job_queue.get(job_id)["status"] == RUNNING
+
+    # Renewed leases are kept
+    time.sleep(0.3)
+    job_queue.renew([job_id])
+    time.sleep(0.3)
+    assert stopped_queue.claim() is None
+    assert job_queue.get(job_id)["status"] == RUNNING
+
+    # Failed after max_attempts claims
+    time.sleep(0.6)
+    assert stopped_queue.claim() is None
+    job = job_queue.get(job_id, with_result=True)
+    assert (job["status"], job["result"]) == (FAILED, INTERRUPTED_RESULT)
+    assert job_queue.get_depth() == 0
+
+
+def test_job_runner(tmp_path):
+    job_queue = SQLiteJobQueue(max_depth=4, path=tmp_path / "jobs.sqlite3")
+    template_path = str(Path("samples/sample1/template.json").resolve())
+    options = {
+        "file_name": "sheet1.jpg",
+        "template_path": template_path,
+        "marked_image": {"mode": "none"},
+    }
+    image_data = Path("samples/sample1/MobileCamera/sheet1.jpg").read_bytes()
+    job_id = job_queue.submit(options, image_data, ttl=60)
+    # Claimed by the runner of a server process that stopped
+    SQLiteJobQueue(4, tmp_path / "jobs.sqlite3", lease_seconds=0.1).claim()
+
+    runner = JobRunner(job_queue, workers=1, poll_interval=0.05)
+    try:
+        bad_job_id = job_queue.submit(options, b"not an image", ttl=60)
+
+        deadline = time.time() + 120
+        while job_queue.get_depth() > 0 and time.time() < deadline:
+            time.sleep(0.1)
+        job = job_queue.get(job_id, with_result=True)
+        assert job["status"] == DONE
+        assert job["result"]["answers"]["q1"] == "B"
+        assert job["result"]["marked_image"] is None
+        bad_job = job_queue.get(bad_job_id, with_result=True)
+        assert bad_job["status"] == FAILED
+        assert bad_job["result"]["error"] == "Failed to read image"
+        assert QUEUED not in [job["status"], bad_job["status"]]
+    finally:
+        runner.stop()
@@ -0,0 +1,118 @@
+import shutil
+from pathlib import Path
+
+import src.entry as entry
+from src.tests.utils import run_entry_point, setup_mocker_patches
+from src.utils.file import ResultsSink, get_results_writer
+from src.utils.manifest import MANIFEST_FILENAME, RunManifest, get_settings_hash
+from src.utils.template_cache import load_template
+
+
+def test_manifest_keeps_latest_entries(tmp_path):
+    path = tmp_path / MANIFEST_FILENAME
+    manifest = RunManifest(path, "settings")
+    manifest.record("a.jpg", "hash1", "Results", ["a.jpg", 1], "Results.csv")
+    manifest.record("b.jpg", "hash2", "Errors", [], "ErrorFiles.csv")
+    manifest.record("a.jpg", "hash3", "Results", ["a.jpg", 2], "Results.csv")
+    manifest.close()
+    # e.g. a line cut short by a crash
+    with open(path, "a") as file:
+        file.write('{"file_id": "c.j')
+
+    manifest = RunManifest(path, "settings")
+    assert manifest.get_unchanged_entry("a.jpg", "hash1") is None
+    assert manifest.get_unchanged_entry("a.jpg", "hash3")["row"] == ["a.jpg", "2"]
+    assert manifest.get_unchanged_entry("b.jpg", "hash2")["status"] == "Errors"
+    assert manifest.get_unchanged_entry("c.jpg", "hash4") is None
+    # Entries of other settings are stale
+    assert RunManifest(path, "other").get_unchanged_entry("a.jpg", "hash3") is None
+
+
+def test_settings_hash_covers_pre_processor_files(tmp_path):
+    shutil.copytree(
+        Path("samples", "sample1"),
+        tmp_path / "sample1",
+        ignore=shutil.ignore_patterns("MobileCamera"),
+    )
+    template, tuning_config, _ = load_template(tmp_path / "sample1" / "template.json")
+    settings_hash = get_settings_hash(template, tuning_config, None, False)
+    assert get_settings_hash(template, tuning_config, None, False) == settings_hash
+
+    # e.g. a new marker image of CropOnMarkers
+    with open(tmp_path / "sample1" / "omr_marker.jpg", "ab") as file:
+        file.write(b"0")
+    assert get_settings_hash(template, tuning_config, None, False) != settings_hash
+
+
+def write_sheets(output_dir, sheet_count):
+    """Writes the sheets not in the manifest of output_dir, returns the unclosed sink"""
+    results_path = output_dir / "Results.csv"
+    if not results_path.exists():
+        with open(results_path, "w", newline="") as file:
+            get_results_writer(file).writerow(["file_id"])
+    manifest = RunManifest(output_dir / MANIFEST_FILENAME, "settings")
+    sink = ResultsSink({"Results": results_path}, manifest=manifest)
+    for index in range(sheet_count):
+        file_id = f"sheet{index}.jpg"
+        entry = manifest.get_unchanged_entry(file_id, file_id)
+        if entry is not None:
+            sink.write_manifest_entry(entry)
+            continue
+        # Records as large as those with the strip thresholds
+        record = {"file_id": file_id, "thresholds": [0.5] * 200}
+        sink.write_sheet("Results", [file_id], record, content_hash=file_id)
+    return sink
+
+
+def test_crashed_run_is_resumed_with_every_row(tmp_path):
+    output_dir, crashed_dir = tmp_path / "outputs", tmp_path / "crashed"
+    output_dir.mkdir()
+    sink = write_sheets(output_dir, 20)
+    # A crash before the rows are flushed leaves the files as they are on disk now
+    shutil.copytree(output_dir, crashed_dir)
+    sink.close()
+    shutil.rmtree(output_dir)
+    shutil.move(crashed_dir, output_dir)
+
+    write_sheets(output_dir, 20).close()
+    rows = (output_dir / "Results.csv").read_text().splitlines()
+    assert sorted(rows[1:]) == sorted(f'"sheet{index}.jpg"' for index in range(20))
+
+
+def get_processed_sheets(process_file):
+    # The answer key image of the evaluation is also read by process_file
+    return [
+        call.args[0].name
+        for call in process_file.call_args_list
+        if call.args[0].parent.name == "scan-angles"
+    ]
+
+
+def test_incremental_run_skips_unchanged_sheets(mocker, tmp_path):
+    setup_mocker_patches(mocker)
+    input_dir, output_dir = tmp_path / "inputs", tmp_path / "outputs"
+    shutil.copytree(Path("samples", "community", "UPSC-mock"), input_dir)
+    process_file = mocker.spy(entry, "process_file")
+
+    run_entry_point(input_dir, output_dir, incremental=True)
+    assert len(get_processed_sheets(process_file)) == 3
+    (results_path,) = output_dir.joinpath("scan-angles", "Results").glob("*.csv")
+    results = results_path.read_text()
+    assert len(results.splitlines()) == 4
+
+    # Nothing to process, and no repeated rows
+    run_entry_point(input_dir, output_dir, incremental=True)
+    assert len(get_processed_sheets(process_file)) == 3
+    assert results_path.read_text() == results
+
+    # The rows of the skipped sheets are carried into new results files
+    results_path.unlink()
+    run_entry_point(input_dir, output_dir, incremental=True)
+    assert len(get_processed_sheets(process_file)) == 3
+    assert results_path.read_text() == results
+
+    # Only the changed sheet is processed again
+    scan_angles_dir = input_dir / "scan-angles"
+    shutil.copyfile(scan_angles_dir / "angle-1.jpg", scan_angles_dir / "angle-3.jpg")
+    run_entry_point(input_dir, output_dir, incremental=True)
+    assert get_processed_sheets(process_file)[3:] == ["angle-3.jpg"]
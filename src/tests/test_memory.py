@@ -0,0 +1,34 @@
+import tracemalloc
+from pathlib import Path
+
+import cv2
+
+from src.template import Template
+from src.utils.parsing import open_config_with_defaults
+
+# Peak of the numpy buffers allocated while reading one sheet, in page sized buffers
+PEAK_PAGES_BUDGET = 6
+
+
+def test_sheet_peak_allocation_within_budget():
+    config = open_config_with_defaults(Path("samples/sample1/config.json"))
+    config.outputs.show_image_level = 0
+    config.outputs.save_image_level = 0
+    template = Template(Path("samples/sample1/template.json"), config)
+    image_path = "samples/sample1/MobileCamera/sheet1.jpg"
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    page_width, page_height = template.page_dimensions
+    image_ops = template.image_instance_ops
+
+    # Note: numpy reports its buffers (including the ones cv2 returns) to tracemalloc
+    tracemalloc.start()
+    try:
+        image_ops.reset_all_save_img()
+        processed = image_ops.apply_preprocessors(image_path, image, template)
+        detection = image_ops.detect_omr_response(template, processed, "sheet1.jpg")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert detection.final_marked.shape == (page_height, page_width)
+    assert peak <= PEAK_PAGES_BUDGET * page_width * page_height
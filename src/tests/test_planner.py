@@ -0,0 +1,31 @@
+import shutil
+from pathlib import Path
+
+from src.planner import DirectoryContext, plan_dir
+
+
+def test_plan_shares_the_inherited_contexts(tmp_path):
+    shutil.copytree(Path("samples", "sample1"), tmp_path, dirs_exist_ok=True)
+    sheet_path = tmp_path.joinpath("MobileCamera", "sheet1.jpg")
+    for class_name in ["classA", "classB"]:
+        class_dir = tmp_path.joinpath("MobileCamera", class_name)
+        class_dir.mkdir()
+        shutil.copyfile(sheet_path, class_dir / "sheet2.JPG")
+        shutil.copyfile(sheet_path, class_dir / "sheet1.jpeg")
+        class_dir.joinpath("notes.txt").write_text("not a sheet")
+
+    works = list(plan_dir(tmp_path, False, DirectoryContext()))
+
+    # The marker image of the root template is excluded
+    assert sorted(work.curr_dir.relative_to(tmp_path).as_posix() for work in works) == [
+        "MobileCamera",
+        "MobileCamera/classA",
+        "MobileCamera/classB",
+    ]
+    # Parent directories come first, the sheets of a directory are sorted
+    assert works[0].omr_files == [sheet_path]
+    for work in works[1:]:
+        assert [f.name for f in work.omr_files] == ["sheet1.jpeg", "sheet2.JPG"]
+    # The template and config are parsed once, for the root
+    assert all(work.context is works[0].context for work in works)
+    assert works[0].context.template.path == tmp_path / "template.json"
@@ -0,0 +1,59 @@
+import shutil
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from src.tests.utils import run_entry_point, setup_mocker_patches
+from src.utils.prefetch import ImagePrefetcher
+
+
+def write_images(tmp_path, count, shape=(40, 30)):
+    file_paths = []
+    for i in range(count):
+        file_path = tmp_path / f"sheet{i}.png"
+        cv2.imwrite(str(file_path), np.full(shape, i, np.uint8))
+        file_paths.append(file_path)
+    return file_paths
+
+
+def test_prefetch_keeps_the_order(tmp_path):
+    file_paths = write_images(tmp_path, 7)
+    corrupt_path = tmp_path / "corrupt.jpg"
+    corrupt_path.write_bytes(b"not an image")
+    file_paths.insert(3, corrupt_path)
+
+    for depth in [0, 1, 3]:
+        images = list(ImagePrefetcher(file_paths, depth=depth, threads=2))
+        assert [file_path for file_path, _ in images] == file_paths
+        # Unreadable images are yielded as None
+        assert images[3][1] is None
+        del images[3]
+        assert [int(image[0, 0]) for _, image in images] == list(range(7))
+
+
+def test_prefetch_within_the_memory_cap(tmp_path, mocker):
+    file_paths = write_images(tmp_path, 6)
+    prefetcher = ImagePrefetcher(file_paths, depth=4, max_bytes=2 * 40 * 30)
+    can_prefetch = mocker.spy(prefetcher, "can_prefetch")
+    for _ in prefetcher:
+        pass
+    # The first image is prefetched alone, then at most two images are pending
+    pending_counts = [call.args[0] for call in can_prefetch.call_args_list]
+    assert pending_counts[:2] == [0, 1]
+    assert max(pending_counts) == 2
+
+
+def test_unreadable_sheet_goes_to_errors(mocker, tmp_path):
+    setup_mocker_patches(mocker)
+    input_dir, output_dir = tmp_path / "inputs", tmp_path / "outputs"
+    shutil.copytree(Path("samples", "sample1"), input_dir)
+    input_dir.joinpath("MobileCamera", "corrupt.jpg").write_bytes(b"not an image")
+
+    run_entry_point(input_dir, output_dir)
+
+    errors_path = output_dir.joinpath("MobileCamera", "Manual", "ErrorFiles.csv")
+    (error_row,) = errors_path.read_text().splitlines()[1:]
+    assert error_row.startswith('"corrupt.jpg"')
+    (results_path,) = output_dir.joinpath("MobileCamera", "Results").glob("*.csv")
+    assert len(results_path.read_text().splitlines()) == 2
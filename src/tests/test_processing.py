@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.processing import MarkedImageOptions, process_image_data
+from src.utils.template_cache import TemplateCache
+
+
+def test_marked_image_encoding():
+    marked_image = np.zeros((1000, 500, 3), dtype=np.uint8)
+
+    data, extension = MarkedImageOptions(mode="thumbnail", max_edge=200).encode(
+        marked_image, "sheet.png"
+    )
+    assert extension == ".png"
+    assert cv2.imdecode(np.frombuffer(data, np.uint8), 1).shape == (200, 100, 3)
+
+    data, extension = MarkedImageOptions(format="webp", quality=50).encode(
+        marked_image, "sheet.jpg"
+    )
+    assert extension == ".webp"
+    assert cv2.imdecode(np.frombuffer(data, np.uint8), 1).shape == (1000, 500, 3)
+
+    for options in [{"mode": "small"}, {"format": "gif"}, {"quality": 0}]:
+        with pytest.raises(ValueError):
+            MarkedImageOptions(**options)
+
+
+def test_process_image_data(tmp_path):
+    template_path = Path("samples/sample1/template.json")
+    image_data = Path("samples/sample1/MobileCamera/sheet1.jpg").read_bytes()
+    cache = TemplateCache()
+
+    result = process_image_data(
+        cache,
+        image_data,
+        "sheet1.jpg",
+        template_path,
+        # e.g. from the json options of a job
+        str(tmp_path),
+        MarkedImageOptions(mode="url", format="png"),
+    )
+    assert result["success"] and result["answers"]["q1"] == "B"
+    assert result["marked_image_format"] == "png"
+    marked_image_path = Path(result["marked_image_path"])
+    assert marked_image_path.name == "sheet1.png"
+    assert marked_image_path.read_bytes() == result["marked_image_bytes"]
+
+    result = process_image_data(
+        cache,
+        image_data,
+        "sheet1.jpg",
+        template_path,
+        marked_image_options=MarkedImageOptions(mode="none"),
+    )
+    assert result["answers"]["q1"] == "B"
+    assert result["marked_image_bytes"] is None
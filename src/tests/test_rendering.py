@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.utils.rendering import draw_box_outlines, draw_texts, fill_boxes
+
+
+def get_random_boxes(rng, count, shape):
+    # Include boxes crossing the image borders
+    x0s = rng.integers(-15, shape[1], count)
+    y0s = rng.integers(-15, shape[0], count)
+    sizes = rng.choice([8, 15, 24], size=(count, 2))
+    return x0s, y0s, x0s + sizes[:, 0], y0s + sizes[:, 1]
+
+
+@pytest.mark.parametrize("channels", [1, 3])
+@pytest.mark.parametrize("thickness", [-1, 1, 2, 3, 5])
+def test_boxes_match_cv2(channels, thickness):
+    rng = np.random.default_rng(thickness + channels)
+    shape = (120, 160) if channels == 1 else (120, 160, 3)
+    image = rng.integers(0, 256, shape, dtype=np.uint8)
+    x0s, y0s, x1s, y1s = get_random_boxes(rng, 60, shape)
+    color = (130, 40, 220)
+
+    expected = image.copy()
+    for box in zip(x0s.tolist(), y0s.tolist(), x1s.tolist(), y1s.tolist()):
+        cv2.rectangle(expected, box[:2], box[2:], color, thickness)
+    if thickness < 0:
+        fill_boxes(image, x0s, y0s, x1s, y1s, color)
+    else:
+        draw_box_outlines(image, x0s, y0s, x1s, y1s, color, thickness)
+    assert np.array_equal(image, expected)
+
+
+@pytest.mark.parametrize("channels", [1, 3])
+def test_texts_match_cv2(channels):
+    rng = np.random.default_rng(channels)
+    shape = (120, 160) if channels == 1 else (120, 160, 3)
+    image = rng.integers(0, 256, shape, dtype=np.uint8)
+    # Texts are spread apart, the antialiased edges of overlapping texts blend in order
+    xs, ys = np.meshgrid(np.arange(-10, 160, 55), np.arange(5, 140, 35))
+    xs, ys = xs.ravel(), ys.ravel()
+    texts = rng.choice(["A", "B", "12", "xyz"], size=len(xs))
+    color = (20, 20, 10)
+
+    expected = image.copy()
+    for text, x, y in zip(texts.tolist(), xs.tolist(), ys.tolist()):
+        cv2.putText(expected, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    draw_texts(image, texts, xs, ys, cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    # Overlapping antialiased strokes within a glyph may round differently
+    differences = np.abs(image.astype(np.int32) - expected)
+    assert differences.max() <= 1
+    assert np.count_nonzero(differences) <= 5
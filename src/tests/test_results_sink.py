@@ -0,0 +1,49 @@
+from csv import QUOTE_NONNUMERIC
+from pathlib import Path
+
+import pandas as pd
+
+from src.utils.file import ResultsSink
+
+ROWS = [
+    ["sheet1.jpg", Path("inputs/sheet1.jpg"), Path("outputs/sheet1.jpg"), 5.5, "A", ""],
+    ["sheet,2.jpg", Path('in"puts/sheet 2.jpg'), "NA", "NA", "AB", "-"],
+    [
+        "sheet3.jpg",
+        Path("inputs/sheet3.jpg"),
+        Path("out/sheet3.jpg"),
+        70.66666666666669,
+        "D",
+        "C\nD",
+    ],
+]
+
+
+def test_rows_match_pandas_to_csv(tmp_path):
+    expected_path, path = tmp_path / "expected.csv", tmp_path / "results.csv"
+    sink = ResultsSink({"Results": path})
+    for row in ROWS:
+        # Reference: the one row data frame previously appended for each sheet
+        pd.DataFrame(row, dtype=str).T.to_csv(
+            expected_path,
+            mode="a",
+            quoting=QUOTE_NONNUMERIC,
+            header=False,
+            index=False,
+        )
+        sink.write_row("Results", row)
+    sink.close()
+
+    assert path.read_bytes() == expected_path.read_bytes()
+
+
+def test_rows_are_flushed_on_flush(tmp_path):
+    path = tmp_path / "errors.csv"
+    sink = ResultsSink({"Errors": path, "Results": tmp_path / "unused.csv"})
+    sink.write_row("Errors", ROWS[0])
+    sink.flush()
+
+    assert path.read_text().startswith('"sheet1.jpg","inputs/sheet1.jpg"')
+    # Files without any rows are not opened
+    assert not (tmp_path / "unused.csv").exists()
+    sink.close()
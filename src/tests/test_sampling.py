@@ -0,0 +1,21 @@
+import cv2
+import numpy as np
+
+from src.utils.sampling import get_box_means, get_integral_image
+
+
+def test_box_means_match_cv2_mean():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (400, 300), dtype=np.uint8)
+    count = 2000
+    # Include boxes overflowing (or starting before) the image borders
+    xs, ys = rng.integers(-20, 320, count), rng.integers(-20, 420, count)
+    box_ws, box_hs = rng.integers(1, 40, count), rng.integers(1, 40, count)
+
+    box_means = get_box_means(get_integral_image(image), xs, ys, box_ws, box_hs)
+
+    expected_means = [
+        cv2.mean(image[y : y + h, x : x + w])[0]
+        for x, y, w, h in zip(xs, ys, box_ws, box_hs)
+    ]
+    assert box_means.tolist() == expected_means
@@ -0,0 +1,72 @@
+import csv
+import shutil
+import zipfile
+from pathlib import Path
+
+import cv2
+
+from src.tests.utils import run_entry_point, setup_mocker_patches
+from src.utils.sources import get_sheet_hash, list_container_sheets, read_sheet
+
+
+def read_results(output_dir):
+    (results_path,) = output_dir.joinpath("Results").glob("*.csv")
+    with open(results_path) as file:
+        rows = list(csv.reader(file))[1:]
+    return {Path(row[0]).name: row[4:] for row in rows}
+
+
+def test_sheets_inside_containers(tmp_path):
+    sheet = cv2.imread("samples/sample1/MobileCamera/sheet1.jpg", cv2.IMREAD_GRAYSCALE)
+    tiff_path = tmp_path / "batch.tiff"
+    assert cv2.imwritemulti(str(tiff_path), [sheet, 255 - sheet])
+    zip_path = tmp_path / "scans.zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.write("samples/sample1/MobileCamera/sheet1.jpg", "class-a/sheet1.jpg")
+        archive.writestr("class-a/notes.txt", "not a sheet")
+
+    tiff_sheets = list_container_sheets(tiff_path)
+    assert [f.name for f in tiff_sheets] == [
+        "batch.tiff#page-0001.png",
+        "batch.tiff#page-0002.png",
+    ]
+    assert (read_sheet(tiff_sheets[1]) == 255 - sheet).all()
+    (zip_sheet,) = list_container_sheets(zip_path)
+    assert zip_sheet == tmp_path / "scans.zip#class-a__sheet1.jpg"
+    assert read_sheet(zip_sheet).shape == sheet.shape
+    # Stable ids, with the content hash of each sheet
+    assert get_sheet_hash(tiff_sheets[0]) != get_sheet_hash(tiff_sheets[1])
+    # Container and member names with the separator in them
+    hash_zip_path = tmp_path / "scans#2.zip"
+    with zipfile.ZipFile(hash_zip_path, "w") as archive:
+        archive.write("samples/sample1/MobileCamera/sheet1.jpg", "class#b/sheet1.jpg")
+    (hash_zip_sheet,) = list_container_sheets(hash_zip_path)
+    assert hash_zip_sheet.name == "scans#2.zip#class#b__sheet1.jpg"
+    assert read_sheet(hash_zip_sheet).shape == sheet.shape
+    assert get_sheet_hash(zip_sheet) == get_sheet_hash(
+        Path("samples/sample1/MobileCamera/sheet1.jpg")
+    )
+    assert read_sheet(tmp_path / "scans.zip#missing.jpg") is None
+
+
+def test_run_with_containers(mocker, tmp_path):
+    setup_mocker_patches(mocker)
+    input_dir = tmp_path / "inputs"
+    shutil.copytree(Path("samples", "sample1"), input_dir)
+    sheets_dir = input_dir / "MobileCamera"
+    sheet_path = sheets_dir / "sheet1.jpg"
+    sheet = cv2.imread(str(sheet_path), cv2.IMREAD_GRAYSCALE)
+    assert cv2.imwritemulti(str(sheets_dir / "batch.tif"), [sheet, sheet])
+    with zipfile.ZipFile(sheets_dir / "scans.zip", "w") as archive:
+        archive.write(sheet_path, "class-a/sheet1.jpg")
+
+    run_entry_point(input_dir, tmp_path / "outputs")
+
+    results = read_results(tmp_path.joinpath("outputs", "MobileCamera"))
+    assert list(results) == [
+        "batch.tif#page-0001.png",
+        "batch.tif#page-0002.png",
+        "scans.zip#class-a__sheet1.jpg",
+        "sheet1.jpg",
+    ]
+    assert all(response == results["sheet1.jpg"] for response in results.values())
@@ -0,0 +1,56 @@
+import csv
+import shutil
+from pathlib import Path
+
+import pytest
+
+from src.defaults import CONFIG_DEFAULTS
+from src.template import Template
+from src.tests.utils import run_entry_point, setup_mocker_patches
+from src.utils.parsing import open_config_with_defaults
+from src.utils.synthetic import SheetGenerator, SyntheticOptions, read_ground_truth
+
+
+def test_rendered_responses():
+    template = Template(Path("samples/sample2/template.json"), CONFIG_DEFAULTS)
+    generator = SheetGenerator(template, SyntheticOptions(border=0), seed=0)
+
+    image, omr_response = generator.render({"q1": "A", "q2": ["B", "D"]})
+    assert image.shape == tuple(reversed(template.page_dimensions))
+    assert omr_response["q1"] == "A"
+    assert omr_response["q2"] == "BD"
+    assert omr_response["q3"] == ""
+    with pytest.raises(Exception):
+        generator.render({"q1": "Z"})
+
+
+def test_detection_matches_ground_truth(mocker, tmp_path):
+    setup_mocker_patches(mocker)
+    input_dir = tmp_path / "inputs"
+    shutil.copytree(
+        Path("samples", "sample1"),
+        input_dir,
+        ignore=shutil.ignore_patterns("MobileCamera"),
+    )
+    tuning_config = open_config_with_defaults(input_dir / "config.json")
+    template = Template(input_dir / "template.json", tuning_config)
+    options = SyntheticOptions(
+        multi_mark_rate=0.1,
+        fill_range=(0.6, 1.0),
+        noise_std=6,
+        blur_sigma=1,
+        max_rotation=2,
+        lighting=0.3,
+    )
+    SheetGenerator(template, options, seed=1).generate(input_dir / "synthetic", 4)
+
+    run_entry_point(input_dir, tmp_path / "outputs")
+
+    (results_path,) = tmp_path.joinpath("outputs", "synthetic", "Results").glob("*.csv")
+    with open(results_path) as file:
+        header, *rows = csv.reader(file)
+    ground_truth = read_ground_truth(input_dir / "synthetic")
+    assert len(rows) == 4
+    for row in rows:
+        response = dict(zip(header[4:], row[4:]))
+        assert response == ground_truth[Path(row[0]).name]
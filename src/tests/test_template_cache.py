@@ -0,0 +1,62 @@
+import os
+import shutil
+from pathlib import Path
+
+from src.utils.template_cache import TemplateCache
+
+
+def touch(file_path):
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_template_reuse_and_invalidation(tmp_path):
+    shutil.copytree(
+        Path("samples", "sample1"),
+        tmp_path / "sample1",
+        ignore=shutil.ignore_patterns("MobileCamera"),
+    )
+    shutil.copytree(Path("samples", "sample2"), tmp_path / "sample2")
+    template_path = tmp_path / "sample1" / "template.json"
+    cache = TemplateCache(max_templates=1)
+
+    with cache.acquire(template_path) as (template, tuning_config, _):
+        # A concurrent request gets its own instance
+        with cache.acquire(template_path) as (other_template, _, _):
+            assert other_template is not template
+    with cache.acquire(template_path) as (cached_template, cached_config, _):
+        assert cached_template in [template, other_template]
+        assert cached_config.dimensions == tuning_config.dimensions
+    assert cache.get_stats()["hits"] == 1
+
+    # Changes to the config or the marker reload the template
+    for file_name in ["config.json", "omr_marker.jpg"]:
+        touch(tmp_path / "sample1" / file_name)
+        with cache.acquire(template_path) as (reloaded_template, _, _):
+            assert reloaded_template not in [template, other_template]
+        template = reloaded_template
+    assert cache.get_stats()["hits"] == 1
+
+    # Least recently used templates are evicted
+    with cache.acquire(tmp_path / "sample2" / "template.json"):
+        pass
+    assert cache.get_stats()["templates"] == [
+        str((tmp_path / "sample2" / "template.json").resolve())
+    ]
+    assert cache.invalidate(template_path) == 0
+    assert cache.invalidate() == 1
+    assert cache.get_stats()["templates"] == []
+
+
+def test_evaluation_reload(tmp_path):
+    shutil.copytree(Path("samples", "answer-key", "using-csv"), tmp_path / "using-csv")
+    template_path = tmp_path / "using-csv" / "template.json"
+    cache = TemplateCache()
+
+    with cache.acquire(template_path) as (template, _, evaluation_config):
+        assert evaluation_config.questions_in_order
+    # The answer key is a file of the evaluation
+    touch(tmp_path / "using-csv" / "answer_key.csv")
+    with cache.acquire(template_path) as (_, _, reloaded_evaluation_config):
+        assert reloaded_evaluation_config is not evaluation_config
+    assert cache.get_stats()["hits"] == 0
@@ -0,0 +1,75 @@
+import numpy as np
+
+from src.core import ImageInstanceOps
+from src.defaults import CONFIG_DEFAULTS
+from src.tests.test_all_samples import run_sample
+from src.utils import thresholding
+
+SAMPLE_PATHS = [
+    "answer-key/using-csv",
+    "answer-key/weighted-answers",
+    "sample1",
+    "sample2",
+    "sample3",
+    "sample4",
+    "sample5",
+    "sample6",
+    "community/Antibodyy",
+    "community/ibrahimkilic",
+    "community/Sandeep-1507",
+    "community/Shamanth",
+    "community/UmarFarootAPS",
+    "community/UPSC-mock",
+]
+
+
+def test_vectorized_thresholds_match_iterative_on_samples(mocker):
+    compared_sheets = []
+
+    def compare_threshold_methods(self, all_q_box_vals, template):
+        expected = self.get_iterative_sheet_thresholds(all_q_box_vals, template)
+        actual = self.get_vectorized_sheet_thresholds(all_q_box_vals, template)
+        # Bit-for-bit equality of global and per strip thresholds
+        assert actual == expected
+        compared_sheets.append(template.path)
+        return expected
+
+    mocker.patch.object(
+        ImageInstanceOps, "get_sheet_thresholds", compare_threshold_methods
+    )
+    for sample_path in SAMPLE_PATHS:
+        run_sample(mocker, sample_path)
+
+    assert len(compared_sheets) > len(SAMPLE_PATHS)
+
+
+def test_vectorized_local_thresholds_match_iterative():
+    rng = np.random.default_rng(0)
+    image_instance_ops = ImageInstanceOps(CONFIG_DEFAULTS)
+    threshold_params = CONFIG_DEFAULTS.threshold_params
+    # Mix of strip lengths, including the 1-2 bubble base cases and tied values
+    strip_lengths = rng.integers(1, 12, 300)
+    strip_offsets = np.concatenate([[0], np.cumsum(strip_lengths)])
+    q_vals = rng.choice([40.0, 60.5, 90.25, 150.0, 200.0, 230.75], strip_offsets[-1])
+    q_vals += rng.integers(0, 3, len(q_vals))
+    no_outliers = rng.integers(0, 2, len(strip_lengths)).astype(bool)
+    global_thr = 160.5
+
+    expected = [
+        image_instance_ops.get_local_threshold(
+            q_vals[start:end].tolist(), global_thr, outlier_flag, plot_show=False
+        )
+        for start, end, outlier_flag in zip(
+            strip_offsets, strip_offsets[1:], no_outliers
+        )
+    ]
+    actual = thresholding.get_local_thresholds(
+        q_vals,
+        strip_offsets,
+        global_thr,
+        no_outliers,
+        threshold_params.MIN_GAP,
+        threshold_params.MIN_JUMP,
+        threshold_params.CONFIDENT_SURPLUS,
+    )
+    assert actual.tolist() == expected
@@ -20,7 +20,7 @@ def setup_mocker_patches(mocker):
     mock_wait_key.return_value = ord("q")
 
 
-def run_entry_point(input_path, output_dir):
+def run_entry_point(input_path, output_dir, **extra_args):
     args = {
         "autoAlign": False,
         "debug": False,
@@ -28,6 +28,7 @@ def run_entry_point(input_path, output_dir):
         "output_dir": output_dir,
         "setLayout": False,
         "silent": True,
+        **extra_args,
     }
     with freeze_time(FROZEN_TIMESTAMP):
         entry_point_for_args(args)
@@ -0,0 +1,242 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from src.utils.image import CLAHE_HELPER, ImageUtils
+from src.utils.sampling import get_box_sums, get_integral_image
+
+# A border column is considered found when its mean intensity crosses this value
+BORDER_MEAN_THRESHOLD = 100
+
+# Morphology used to bring out the vertical borders of the field blocks
+V_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 10))
+OPEN_ITERATIONS = 3
+ERODE_KERNEL = np.ones((5, 5), np.uint8)
+ERODE_ITERATIONS = 2
+MORPH_THRESHOLD = 60  # for Mobile images, 40 for scanned Images
+# (x, y) reach of the erosion around a pixel
+MORPH_HALO = tuple(
+    ERODE_ITERATIONS * (ERODE_KERNEL.shape[1 - axis] // 2) for axis in range(2)
+)
+
+
+@dataclass
+class AlignmentResult:
+    """Chosen shift of each field block with the mean border intensities (scores) at that shift"""
+
+    shifts: np.ndarray
+    left_means: np.ndarray
+    right_means: np.ndarray
+    steps: np.ndarray
+
+
+def get_border_window_sums(
+    integral_image,
+    block_origins,
+    block_dimensions,
+    candidate_shifts,
+    match_col,
+    thickness,
+):
+    """
+    Sums and pixel counts of the left and right border windows for every
+    (block, candidate shift) pair, i.e. arrays of shape (blocks, candidates).
+    Each window is an O(1) lookup into the prefix sums of the page.
+    """
+    s_x, s_y = block_origins[:, 0:1], block_origins[:, 1:2]
+    d_x, d_y = block_dimensions[:, 0:1], block_dimensions[:, 1:2]
+    shifts = np.asarray(candidate_shifts)[np.newaxis, :]
+    ys = np.broadcast_to(s_y, (len(block_origins), shifts.shape[1]))
+    heights = np.broadcast_to(d_y, ys.shape)
+
+    # morph_v[s1 : s1 + d1, s0 + shift - thk : -thk + s0 + shift + match_col]
+    left_xs = s_x + shifts - thickness
+    left_sums, left_counts = get_box_sums(
+        integral_image, left_xs, ys, match_col, heights
+    )
+    # morph_v[s1 : s1 + d1, s0 + shift - match_col + d0 + thk : thk + s0 + shift + d0]
+    right_xs = s_x + shifts - match_col + d_x + thickness
+    right_sums, right_counts = get_box_sums(
+        integral_image, right_xs, ys, match_col, heights
+    )
+    return left_sums, left_counts, right_sums, right_counts
+
+
+def find_field_block_shifts(
+    morph_v, block_origins, block_dimensions, match_col, max_steps, stride, thickness
+):
+    """
+    Finds the horizontal shift of every field block at once.
+
+    The border scores of all reachable shifts are computed upfront from one
+    integral image, then the original step-wise search (move towards the
+    side whose border column is dark, stop when both or none are) is replayed
+    for all the blocks together on those precomputed scores.
+    """
+    block_origins = np.asarray(block_origins, dtype=np.int64).reshape(-1, 2)
+    block_dimensions = np.asarray(block_dimensions, dtype=np.int64).reshape(-1, 2)
+    candidate_shifts = np.arange(-max_steps, max_steps + 1) * stride
+
+    left_sums, left_counts, right_sums, right_counts = get_border_window_sums(
+        get_integral_image(morph_v),
+        block_origins,
+        block_dimensions,
+        candidate_shifts,
+        match_col,
+        thickness,
+    )
+    # Same as `np.mean(window) > 100`, including empty windows (nan mean)
+    left_dark = (left_counts > 0) & (left_sums > BORDER_MEAN_THRESHOLD * left_counts)
+    right_dark = (right_counts > 0) & (
+        right_sums > BORDER_MEAN_THRESHOLD * right_counts
+    )
+
+    blocks = np.arange(len(block_origins))
+    shift_indices = np.full(len(blocks), max_steps)
+    steps = np.zeros(len(blocks), dtype=np.int64)
+    active = np.ones(len(blocks), dtype=bool)
+    for _ in range(max_steps):
+        left_shift = left_dark[blocks, shift_indices]
+        right_shift = right_dark[blocks, shift_indices]
+        moves = right_shift.astype(np.int64) - left_shift.astype(np.int64)
+        # Stop when both borders or none of them are dark
+        active &= moves != 0
+        if not active.any():
+            break
+        shift_indices += moves * active
+        steps += active
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        left_means = (left_sums / left_counts)[blocks, shift_indices]
+        right_means = (right_sums / right_counts)[blocks, shift_indices]
+
+    return AlignmentResult(
+        shifts=candidate_shifts[shift_indices],
+        left_means=left_means,
+        right_means=right_means,
+        steps=steps,
+    )
+
+
+def get_border_rois(
+    block_origins, block_dimensions, match_col, max_steps, stride, thickness
+):
+    """
+    (x, y, w, h) of the left and right border bands of each field block, i.e. the
+    union of all the windows that find_field_block_shifts can read for it.
+    """
+    block_origins = np.asarray(block_origins, dtype=np.int64).reshape(-1, 2)
+    block_dimensions = np.asarray(block_dimensions, dtype=np.int64).reshape(-1, 2)
+    s_x, s_y = block_origins[:, 0], block_origins[:, 1]
+    d_x, d_y = block_dimensions[:, 0], block_dimensions[:, 1]
+    span = max_steps * stride
+    band_w = 2 * span + match_col
+    left_xs = s_x - span - thickness
+    right_xs = s_x + d_x + thickness - match_col - span
+    return [
+        (x, y, band_w, h)
+        for left_x, right_x, y, h in zip(left_xs, right_xs, s_y, d_y)
+        for x in (left_x, right_x)
+    ]
+
+
+def clip_roi(roi, page_shape, halo=(0, 0)):
+    """Pads the roi by the halo and clips it to the page, returns (x0, y0, x1, y1)"""
+    x, y, w, h = roi
+    page_h, page_w = page_shape[:2]
+    x0, y0 = max(0, x - halo[0]), max(0, y - halo[1])
+    x1, y1 = min(page_w, x + w + halo[0]), min(page_h, y + h + halo[1])
+    return int(x0), int(y0), int(max(x0, x1)), int(max(y0, y1))
+
+
+def get_area(bounds):
+    x0, y0, x1, y1 = bounds
+    return (x1 - x0) * (y1 - y0)
+
+
+def normalize_jointly(crops, bounds):
+    """
+    Same as ImageUtils.normalize_util, but with the given (min, max) bounds shared
+    by all the crops, e.g. the bounds of the page they were cropped from.
+    """
+    low, high = bounds
+    # Note: cv2.normalize maps a constant image to alpha
+    scale = 255.0 * (1.0 / (high - low) if high - low > np.finfo(float).eps else 0)
+    return [cv2.convertScaleAbs(crop, alpha=scale, beta=-low * scale) for crop in crops]
+
+
+def brighten_for_morph(image, gamma_low):
+    # Remove shadows further, make columns/boxes darker (less gamma)
+    image = ImageUtils.adjust_gamma(image, gamma_low)
+    _, image = cv2.threshold(image, 220, 220, cv2.THRESH_TRUNC)
+    return image
+
+
+def get_border_morphs(image, rois, gamma_low, keep_morph=False):
+    """
+    Computes the auto-align morphology of the page only within the border bands
+    of the field blocks, pasted into page sized canvases that are blank elsewhere.
+    Returns (morph, morph_v), morph is None unless keep_morph is set.
+    """
+    page_shape = image.shape[:2]
+    # Note: clahe is good for morphology, bad for thresholding
+    # Its tiles span the whole page, hence it can't be applied per band
+    equalized = CLAHE_HELPER.apply(image)
+    # Open : erode then dilate
+    # The opening commutes with the monotonic brightening and normalizations
+    # below, so it is done first, and their page-wide bounds become exact to get
+    opened = cv2.morphologyEx(
+        equalized, cv2.MORPH_OPEN, V_KERNEL, iterations=OPEN_ITERATIONS
+    )
+    extremes = np.array(
+        [cv2.minMaxLoc(equalized)[:2] + cv2.minMaxLoc(opened)[:2]], dtype=np.uint8
+    )
+    extremes = brighten_for_morph(extremes, gamma_low)
+    morph_bounds = tuple(map(float, extremes[0, :2]))
+    (extremes,) = normalize_jointly([extremes], morph_bounds)
+    _, extremes = cv2.threshold(extremes, 200, 200, cv2.THRESH_TRUNC)
+    morph_v_bounds = tuple(map(float, extremes[0, 2:]))
+
+    # Skip the bands lying completely outside the page
+    rois = [roi for roi in rois if get_area(clip_roi(roi, page_shape)) > 0]
+    padded_bounds = [clip_roi(roi, page_shape, MORPH_HALO) for roi in rois]
+    morph = None
+    if keep_morph:
+        crops = [
+            brighten_for_morph(equalized[y0:y1, x0:x1], gamma_low)
+            for x0, y0, x1, y1 in padded_bounds
+        ]
+        crops = normalize_jointly(crops, morph_bounds)
+        morph = paste_crops(crops, rois, padded_bounds, page_shape)
+
+    v_crops = [
+        brighten_for_morph(opened[y0:y1, x0:x1], gamma_low)
+        for x0, y0, x1, y1 in padded_bounds
+    ]
+    v_crops = normalize_jointly(v_crops, morph_bounds)
+    v_crops = [cv2.threshold(crop, 200, 200, cv2.THRESH_TRUNC)[1] for crop in v_crops]
+    v_crops = normalize_jointly(v_crops, morph_v_bounds)
+    for i, crop in enumerate(v_crops):
+        _, crop = cv2.threshold(255 - crop, MORPH_THRESHOLD, 255, cv2.THRESH_BINARY)
+        # kernel best tuned to 5x5 now
+        v_crops[i] = cv2.erode(crop, ERODE_KERNEL, iterations=ERODE_ITERATIONS)
+    morph_v = paste_crops(v_crops, rois, padded_bounds, page_shape)
+    return morph, morph_v
+
+
+def paste_crops(crops, rois, padded_bounds, page_shape):
+    canvas = np.zeros(page_shape, dtype=np.uint8)
+    for crop, roi, (px0, py0, _, _) in zip(crops, rois, padded_bounds):
+        # Only the inner band is pasted, the halo is not reliable
+        x0, y0, x1, y1 = clip_roi(roi, page_shape)
+        canvas[y0:y1, x0:x1] = crop[y0 - py0 : y1 - py0, x0 - px0 : x1 - px0]
+    return canvas
@@ -0,0 +1,75 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+from src.logger import logger
+
+# pyarrow is only needed for the (optional) parquet results
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+PARQUET_ROW_GROUP_ROWS = 1000
+
+
+def get_results_schema(output_columns):
+    return pa.schema(
+        [
+            ("file_id", pa.string()),
+            ("input_path", pa.string()),
+            ("output_path", pa.string()),
+            # One of "Results", "MultiMarked" or "Errors", like the csv files
+            ("status", pa.string()),
+            ("score", pa.float64()),
+            ("multi_marked", pa.bool_()),
+            ("global_threshold", pa.float64()),
+            ("global_std_threshold", pa.float64()),
+            ("strip_thresholds", pa.list_(pa.float64())),
+            *[(column, pa.string()) for column in output_columns],
+        ]
+    )
+
+
+class ParquetResultsWriter:
+    """
+    Writes the results of the sheets into a parquet file with typed columns and one
+    string column per template output column, in row groups as the sheets finish.
+    Fields missing from a record (e.g. the thresholds of an unreadable sheet) are null.
+    """
+
+    def __init__(self, path, output_columns, row_group_rows=PARQUET_ROW_GROUP_ROWS):
+        if pa is None:
+            raise Exception(
+                "Saving the results as parquet requires pyarrow: 'pip install pyarrow'"
+            )
+        self.path = path
+        self.schema = get_results_schema(output_columns)
+        self.row_group_rows = row_group_rows
+        self.records, self.writer = [], None
+
+    def append(self, record):
+        self.records.append(record)
+        if len(self.records) >= self.row_group_rows:
+            self.flush()
+
+    def flush(self):
+        """Writes the pending records as a row group"""
+        if not self.records:
+            return
+        if self.writer is None:
+            logger.info(f"Created new file: '{self.path}'")
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(pa.Table.from_pylist(self.records, schema=self.schema))
+        self.records = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,129 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import atexit
+import os
+from collections import defaultdict
+from pathlib import Path
+from queue import Queue
+from threading import Thread
+
+import cv2
+import numpy as np
+
+from src.logger import logger
+from src.utils.image import ImageUtils
+
+
+class ImageWriter:
+    """Encodes and writes images on a background thread, in their submission order"""
+
+    def __init__(self, max_pending=4):
+        # Bounds the images held in memory while waiting to be written
+        self.max_pending = max_pending
+        self.queue = None
+        self.pid = None
+
+    def start(self):
+        # Threads do not survive a fork, so each (forked) process starts its own
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.queue = Queue(maxsize=self.max_pending)
+        Thread(target=self.run, args=(self.queue,), daemon=True).start()
+        atexit.register(self.flush)
+
+    def submit(self, path, image):
+        self.start()
+        logger.info(f"Saving Image to '{path}'")
+        self.queue.put((str(path), image))
+
+    def flush(self):
+        """Blocks until all the submitted images are written"""
+        if self.pid == os.getpid():
+            self.queue.join()
+
+    @staticmethod
+    def run(queue):
+        while True:
+            path, image = queue.get()
+            try:
+                if not cv2.imwrite(path, image):
+                    logger.warning(f"Could not save image to '{path}'")
+            except Exception as e:
+                logger.error(f"Error while saving image to '{path}': {e}")
+            finally:
+                queue.task_done()
+
+
+class DebugImageStore:
+    """
+    Debug images of the current sheet by their save level, for the saved image stacks.
+    Images are stored downsized to the display height within a memory budget, and
+    each stack is composed straight at its final size when saved.
+    """
+
+    def __init__(self, save_image_level, dimensions, max_bytes):
+        self.save_image_level = save_image_level
+        self.display_height = int(dimensions.display_height)
+        self.display_width = int(dimensions.display_width)
+        self.max_bytes = max_bytes
+        self.images = defaultdict(list)
+        self.stored_bytes = 0
+        self.writer = ImageWriter()
+
+    def reset(self):
+        self.images.clear()
+        self.stored_bytes = 0
+
+    def append(self, key, img):
+        if self.save_image_level < int(key):
+            return
+        # The stacks are saved at (most) the display height
+        if img.shape[0] > self.display_height:
+            img = ImageUtils.resize_util_h(img, self.display_height)
+        else:
+            img = img.copy()
+        if self.stored_bytes + img.nbytes > self.max_bytes:
+            logger.warning(
+                f"Skipped a level {key} debug image: over the budget of {round(self.max_bytes / 2**20, 1)} MB per sheet"
+            )
+            return
+        self.stored_bytes += img.nbytes
+        self.images[key].append(img)
+
+    def get_stack(self, key):
+        """The images of the level side by side at the same height, resized to the stack width"""
+        images = self.images[key]
+        # Widths of the images when brought to the display height
+        widths = [
+            int(img.shape[1] * self.display_height / img.shape[0]) for img in images
+        ]
+        stack_width = min(
+            len(images) * self.display_width // 3, int(self.display_width * 2.5)
+        )
+        total_width = sum(widths)
+        stack_height = int(self.display_height * stack_width / total_width)
+        # Column bounds of each image, scaled together so that they add up exactly
+        bounds = np.cumsum([0] + widths) * stack_width // total_width
+        stack = np.zeros((stack_height, stack_width, *images[0].shape[2:]), np.uint8)
+        for img, x0, x1 in zip(images, bounds[:-1], bounds[1:]):
+            if x1 > x0 and stack_height > 0:
+                stack[:, x0:x1] = cv2.resize(img, (int(x1 - x0), stack_height))
+        return stack
+
+    def save_stack(self, key, filename, save_dir):
+        if self.save_image_level >= int(key) and self.images[key]:
+            name = os.path.splitext(filename)[0]
+            self.writer.submit(
+                Path(save_dir, "stack", f"{name}_{str(key)}_stack.jpg"),
+                self.get_stack(key),
+            )
+
+    def flush(self):
+        self.writer.flush()
@@ -0,0 +1,100 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import io
+
+import cv2
+import numpy as np
+
+from src.logger import logger
+
+# The JPEG decoder can scale the image down by these factors while decoding
+REDUCED_GRAYSCALE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+# Start Of Frame markers, that hold the dimensions of a JPEG image
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def get_jpeg_size(file):
+    """(width, height) from the header of a JPEG file object, None if it is not a JPEG"""
+    if file.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        marker = file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        # Markers can be padded with fill bytes
+        while marker[1] == 0xFF:
+            marker = marker[1:] + file.read(1)
+            if len(marker) < 2:
+                return None
+        code = marker[1]
+        # Standalone markers have no length
+        if code == 0x01 or 0xD0 <= code <= 0xD8:
+            continue
+        length = int.from_bytes(file.read(2), "big")
+        if code in JPEG_SOF_MARKERS:
+            data = file.read(5)
+            if len(data) < 5:
+                return None
+            return int.from_bytes(data[3:5], "big"), int.from_bytes(data[1:3], "big")
+        file.seek(length - 2, io.SEEK_CUR)
+
+
+def get_decode_size(tuning_config):
+    """The size to decode the sheets for, None to decode them in full resolution"""
+    if not tuning_config.processing.reduced_decode:
+        return None
+    dimensions = tuning_config.dimensions
+    return dimensions.processing_width, dimensions.processing_height
+
+
+def get_decode_flag(image_size, decode_size):
+    """
+    The grayscale imread flag with the largest reduction that still leaves the image
+    at least as large as decode_size, so that it is only scaled down afterwards.
+    """
+    if image_size is None or decode_size is None:
+        return cv2.IMREAD_GRAYSCALE
+    # Note: the EXIF orientation is applied after decoding, so either side of the
+    # image can end up along either side of decode_size
+    for factor in sorted(REDUCED_GRAYSCALE_FLAGS, reverse=True):
+        if min(image_size) // factor >= max(decode_size):
+            return REDUCED_GRAYSCALE_FLAGS[factor]
+    return cv2.IMREAD_GRAYSCALE
+
+
+def read_image(file_path, decode_size=None):
+    """
+    Decodes the sheet in grayscale, None when it can't be read. JPEG images larger than
+    decode_size are scaled down by the decoder itself, which is much faster.
+    """
+    try:
+        with open(file_path, "rb") as file:
+            image_size = get_jpeg_size(file)
+        image = cv2.imread(str(file_path), get_decode_flag(image_size, decode_size))
+    except Exception as e:
+        logger.error(f"Error while reading image '{file_path}': {e}")
+        return None
+    if image is None:
+        logger.error(f"Could not read image: '{file_path}'")
+    return image
+
+
+def decode_image(data, decode_size=None):
+    """Like read_image, for the encoded bytes of an image"""
+    image_size = get_jpeg_size(io.BytesIO(data))
+    try:
+        return cv2.imdecode(
+            np.frombuffer(data, np.uint8), get_decode_flag(image_size, decode_size)
+        )
+    except cv2.error:
+        return None
@@ -1,12 +1,16 @@
 import argparse
+import csv
 import json
 import os
 from csv import QUOTE_NONNUMERIC
-from time import localtime, strftime
-
-import pandas as pd
+from time import localtime, strftime, time
 
 from src.logger import logger
+from src.utils.columnar import ParquetResultsWriter
+
+# The results files are flushed after these many rows or seconds, whichever comes first
+RESULTS_FLUSH_ROWS = 100
+RESULTS_FLUSH_SECONDS = 5
 
 
 def load_json(path, **rest):
@@ -30,6 +34,104 @@ class Paths:
         self.multi_marked_dir = self.manual_dir.joinpath("MultiMarkedFiles")
 
 
+def get_results_writer(file):
+    # Same rows as a one row pandas `to_csv(quoting=QUOTE_NONNUMERIC)` of strings
+    return csv.writer(file, quoting=QUOTE_NONNUMERIC, lineterminator=os.linesep)
+
+
+class ResultsSink:
+    """
+    Appends rows to the results csv files by their key ("Results", "MultiMarked", "Errors").
+    Each file is opened on its first row and kept open, the rows are buffered and flushed
+    periodically, and on flush() or close().
+    The typed records of the sheets also go to the columnar_writer, and the sheets
+    to the manifest of incremental runs, if any.
+    """
+
+    def __init__(
+        self, files_map, columnar_writer=None, manifest=None, created_files=()
+    ):
+        self.files_map = files_map
+        self.columnar_writer = columnar_writer
+        self.manifest = manifest
+        # The results files created in this run, i.e. without any previous rows
+        self.created_files = set(created_files)
+        self.files, self.writers = {}, {}
+        self.pending_rows = 0
+        self.last_flush_time = time()
+
+    def write_row(self, key, row):
+        if key not in self.writers:
+            self.files[key] = open(self.files_map[key], "a", newline="")
+            self.writers[key] = get_results_writer(self.files[key])
+        # Note: all the values are written as (quoted) strings
+        self.writers[key].writerow([str(value) for value in row])
+        self.pending_rows += 1
+        if (
+            self.pending_rows >= RESULTS_FLUSH_ROWS
+            or time() - self.last_flush_time >= RESULTS_FLUSH_SECONDS
+        ):
+            self.flush()
+
+    def write_record(self, record):
+        if self.columnar_writer is not None:
+            self.columnar_writer.append(record)
+
+    def write_sheet(self, status, row, record, content_hash=None):
+        """Writes the results of a sheet, status is the key of its results file"""
+        if row is not None:
+            self.write_row(status, row)
+        self.write_record(record)
+        if self.manifest is not None and content_hash is not None:
+            self.manifest.record(
+                record["file_id"],
+                content_hash,
+                status,
+                row or [],
+                self.files_map[status],
+                record,
+            )
+
+    def write_manifest_entry(self, entry):
+        """Brings the results of a sheet skipped by an incremental run into this run's files"""
+        status, results_file = entry["status"], self.files_map[entry["status"]]
+        # Rows already in the results file are not repeated
+        if entry["row"] and (
+            entry["results_file"] != str(results_file)
+            or results_file in self.created_files
+        ):
+            self.write_row(status, entry["row"])
+            self.manifest.record(
+                entry["file_id"],
+                entry["content_hash"],
+                status,
+                entry["row"],
+                results_file,
+                entry["record"],
+            )
+        self.write_record(entry["record"])
+
+    def flush(self):
+        for file in self.files.values():
+            file.flush()
+        # Only after the rows its new entries refer to
+        if self.manifest is not None:
+            self.manifest.flush()
+        self.pending_rows = 0
+        self.last_flush_time = time()
+
+    def close(self):
+        # The manifest is closed last, after the rows its new entries refer to
+        for file in self.files.values():
+            file.close()
+        if self.columnar_writer is not None:
+            self.columnar_writer.close()
+        if self.manifest is not None:
+            self.manifest.close()
+        self.files, self.writers = {}, {}
+        self.pending_rows = 0
+
+
 def setup_dirs_for_paths(paths):
     logger.info("Checking Directories...")
     for save_output_dir in [paths.save_marked_dir]:
@@ -51,7 +153,16 @@ def setup_dirs_for_paths(paths):
             os.makedirs(save_output_dir)
 
 
-def setup_outputs_for_template(paths, template):
+def get_unused_path(path):
+    stem, ext = os.path.splitext(path)
+    suffix = 0
+    while os.path.exists(path):
+        suffix += 1
+        path = f"{stem}_{suffix}{ext}"
+    return path
+
+
+def setup_outputs_for_template(paths, template, save_parquet=False, manifest=None):
     # TODO: consider moving this into a class instance
     ns = argparse.Namespace()
     logger.info("Checking Files...")
@@ -59,6 +170,7 @@ def setup_outputs_for_template(paths, template):
     # Include current output paths
     ns.paths = paths
 
+    ns.output_columns = template.output_columns
     ns.empty_resp = [""] * len(template.output_columns)
     ns.sheetCols = [
         "file_id",
@@ -67,7 +179,6 @@ def setup_outputs_for_template(paths, template):
         "score",
     ] + template.output_columns
     ns.OUTPUT_SET = []
-    ns.files_obj = {}
     TIME_NOW_HRS = strftime("%I%p", localtime())
     ns.filesMap = {
         "Results": os.path.join(paths.results_dir, f"Results_{TIME_NOW_HRS}.csv"),
@@ -75,21 +186,27 @@ def setup_outputs_for_template(paths, template):
         "Errors": os.path.join(paths.manual_dir, "ErrorFiles.csv"),
     }
 
+    # Note: files_obj holds the file paths, the rows are written by results_sink
+    ns.files_obj = dict(ns.filesMap)
+    created_files = []
     for file_key, file_name in ns.filesMap.items():
         if not os.path.exists(file_name):
             logger.info(f"Created new file: '{file_name}'")
-            # moved handling of files to pandas csv writer
-            ns.files_obj[file_key] = file_name
+            created_files.append(file_name)
             # Create Header Columns
-            pd.DataFrame([ns.sheetCols], dtype=str).to_csv(
-                ns.files_obj[file_key],
-                mode="a",
-                quoting=QUOTE_NONNUMERIC,
-                header=False,
-                index=False,
-            )
+            with open(file_name, "a", newline="") as file:
+                get_results_writer(file).writerow(ns.sheetCols)
         else:
             logger.info(f"Present : appending to '{file_name}'")
-            ns.files_obj[file_key] = open(file_name, "a")
 
+    columnar_writer = None
+    if save_parquet:
+        # Note: unlike the csv files, parquet files can't be appended to
+        columnar_writer = ParquetResultsWriter(
+            get_unused_path(
+                os.path.join(paths.results_dir, f"Results_{TIME_NOW_HRS}.parquet")
+            ),
+            template.output_columns,
+        )
+    ns.results_sink = ResultsSink(ns.filesMap, columnar_writer, manifest, created_files)
     return ns
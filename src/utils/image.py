@@ -6,6 +6,8 @@
  Github: https://github.com/Udayraj123
 
 """
+from functools import lru_cache
+
 import cv2
 import matplotlib.pyplot as plt
 import numpy as np
@@ -69,8 +71,9 @@ class ImageUtils:
         return cnts
 
     @staticmethod
-    def normalize_util(img, alpha=0, beta=255):
-        return cv2.normalize(img, alpha, beta, norm_type=cv2.NORM_MINMAX)
+    def normalize_util(img, alpha=0, beta=255, out=None):
+        # out=img normalizes in place
+        return cv2.normalize(img, out, alpha, beta, norm_type=cv2.NORM_MINMAX)
 
     @staticmethod
     def auto_canny(image, sigma=0.93):
@@ -86,16 +89,21 @@ class ImageUtils:
         return edged
 
     @staticmethod
-    def adjust_gamma(image, gamma=1.0):
+    @lru_cache(maxsize=None)
+    def get_gamma_table(gamma):
         # build a lookup table mapping the pixel values [0, 255] to
         # their adjusted gamma values
         inv_gamma = 1.0 / gamma
         table = np.array(
             [((i / 255.0) ** inv_gamma) * 255 for i in np.arange(0, 256)]
         ).astype("uint8")
+        table.flags.writeable = False
+        return table
 
+    @staticmethod
+    def adjust_gamma(image, gamma=1.0):
         # apply gamma correction using the lookup table
-        return cv2.LUT(image, table)
+        return cv2.LUT(image, ImageUtils.get_gamma_table(gamma))
 
     @staticmethod
     def four_point_transform(image, pts):
@@ -0,0 +1,259 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import os
+import shutil
+import threading
+import time
+
+from src.logger import logger
+
+
+def get_dir_size(dir_path):
+    """Total size of the files under a directory, in bytes"""
+    size = 0
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    size += get_dir_size(entry.path)
+                else:
+                    size += entry.stat(follow_symlinks=False).st_size
+    except OSError:
+        pass
+    return size
+
+
+class SessionEntry:
+    def __init__(self, session_id, created_at, modified_at, size):
+        self.session_id = session_id
+        self.created_at = created_at
+        # The latest mtime of the session directories when the size was measured
+        self.modified_at = modified_at
+        self.measured_at = time.time()
+        self.size = size
+
+
+class StorageJanitor:
+    """
+    Deletes the sessions once past their ttl, and the oldest ones first whenever their
+    total size goes over the quota (down to the low watermark of the quota). A session
+    is the directories of the same name under the given roots, e.g. the upload and the
+    results of a request.
+
+    The sessions are kept in an index: the server registers the sessions it writes,
+    and each sweep lists the roots (not their trees) to pick up the sessions written
+    by other processes, e.g. the job workers or the other gunicorn workers. A session
+    is measured again when its directories change, and until it has been idle for
+    min_idle seconds, as its files can be written after it is found. Sessions modified
+    in the last min_idle seconds are not deleted, as they can still be written to.
+    """
+
+    def __init__(
+        self,
+        roots,
+        ttl=3600,
+        quota=None,
+        interval=60,
+        low_watermark=0.9,
+        min_idle=60,
+    ):
+        self.roots = [os.fspath(root) for root in roots]
+        self.ttl = ttl
+        self.quota = quota
+        self.interval = interval
+        self.low_watermark = low_watermark
+        self.min_idle = min_idle
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.metrics = {
+            "sweeps": 0,
+            "expired_sessions": 0,
+            "evicted_sessions": 0,
+            "deleted_bytes": 0,
+            "errors": 0,
+            "last_sweep_at": None,
+            "last_sweep_seconds": None,
+        }
+
+    def get_session_size(self, session_id):
+        return sum(get_dir_size(os.path.join(root, session_id)) for root in self.roots)
+
+    def get_session_mtime(self, session_id):
+        mtimes = []
+        for root in self.roots:
+            try:
+                mtimes.append(os.stat(os.path.join(root, session_id)).st_mtime)
+            except OSError:
+                pass
+        return max(mtimes, default=None)
+
+    def register(self, session_id):
+        """Indexes (or measures again) a written session, wakes the janitor past the quota"""
+        modified_at = self.get_session_mtime(session_id)
+        if modified_at is None:
+            # e.g. a job that failed before saving anything
+            return
+        size = self.get_session_size(session_id)
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                self.sessions[session_id] = SessionEntry(
+                    session_id, time.time(), modified_at, size
+                )
+            else:
+                entry.modified_at, entry.size = modified_at, size
+                entry.measured_at = time.time()
+            over_quota = self.quota is not None and self.get_size() > self.quota
+        if over_quota:
+            self.wake.set()
+
+    def get_size(self):
+        # Needs self.lock
+        return sum(entry.size for entry in self.sessions.values())
+
+    def refresh(self):
+        """Indexes the new sessions, measures the changed ones and forgets the deleted ones"""
+        # The (earliest, latest) mtimes of the directories of each session
+        found = {}
+        for root in self.roots:
+            try:
+                with os.scandir(root) as entries:
+                    for dir_entry in entries:
+                        if dir_entry.is_dir(follow_symlinks=False):
+                            mtime = dir_entry.stat().st_mtime
+                            earliest, latest = found.get(dir_entry.name, (mtime, mtime))
+                            found[dir_entry.name] = (
+                                min(earliest, mtime),
+                                max(latest, mtime),
+                            )
+            except OSError:
+                continue
+        with self.lock:
+            for session_id in set(self.sessions) - set(found):
+                del self.sessions[session_id]
+            new_session_ids = set(found) - set(self.sessions)
+            # Files can be written into the subdirectories without changing the mtimes
+            changed_session_ids = [
+                session_id
+                for session_id, entry in self.sessions.items()
+                # Not found when registered during the listing
+                if session_id in found
+                and (
+                    entry.modified_at != found[session_id][1]
+                    or entry.measured_at - entry.modified_at < self.min_idle
+                )
+            ]
+        for session_id in new_session_ids:
+            created_at, modified_at = found[session_id]
+            size = self.get_session_size(session_id)
+            with self.lock:
+                self.sessions.setdefault(
+                    session_id,
+                    SessionEntry(session_id, created_at, modified_at, size),
+                )
+        for session_id in changed_session_ids:
+            modified_at = found[session_id][1]
+            size = self.get_session_size(session_id)
+            with self.lock:
+                entry = self.sessions.get(session_id)
+                if entry is not None:
+                    entry.modified_at, entry.size = modified_at, size
+                    entry.measured_at = time.time()
+
+    def sweep(self):
+        """Deletes the expired sessions, then the oldest ones past the quota"""
+        started = time.perf_counter()
+        self.refresh()
+        now = time.time()
+        with self.lock:
+            # Sessions still being written are kept
+            entries = sorted(
+                (
+                    e
+                    for e in self.sessions.values()
+                    if now - e.modified_at >= self.min_idle
+                ),
+                key=lambda e: e.created_at,
+            )
+            expired = [e for e in entries if now - e.created_at > self.ttl]
+            expired_ids = {entry.session_id for entry in expired}
+            evicted = []
+            if self.quota is not None:
+                size = self.get_size() - sum(e.size for e in expired)
+                if size > self.quota:
+                    for entry in entries:
+                        if size <= self.quota * self.low_watermark:
+                            break
+                        if entry.session_id not in expired_ids:
+                            evicted.append(entry)
+                            size -= entry.size
+            for entry in expired + evicted:
+                del self.sessions[entry.session_id]
+
+        deleted_bytes, errors = 0, 0
+        for entry in expired + evicted:
+            try:
+                for root in self.roots:
+                    try:
+                        shutil.rmtree(os.path.join(root, entry.session_id))
+                    except FileNotFoundError:
+                        # Not in this root, or deleted by the janitor of another process
+                        pass
+                deleted_bytes += entry.size
+            except OSError as e:
+                errors += 1
+                logger.error(f"Failed to delete the session {entry.session_id}: {e}")
+
+        with self.lock:
+            self.metrics["sweeps"] += 1
+            self.metrics["expired_sessions"] += len(expired)
+            self.metrics["evicted_sessions"] += len(evicted)
+            self.metrics["deleted_bytes"] += deleted_bytes
+            self.metrics["errors"] += errors
+            self.metrics["last_sweep_at"] = now
+            self.metrics["last_sweep_seconds"] = round(time.perf_counter() - started, 3)
+        if expired or evicted:
+            logger.info(
+                f"Deleted {len(expired)} expired and {len(evicted)} evicted sessions, freeing {deleted_bytes} bytes"
+            )
+        return len(expired), len(evicted)
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                with self.lock:
+                    self.metrics["errors"] += 1
+                logger.error(f"Failed to sweep the sessions: {e}")
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="omr-janitor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "size_bytes": self.get_size(),
+                "quota_bytes": self.quota,
+                "ttl_seconds": self.ttl,
+                **self.metrics,
+            }
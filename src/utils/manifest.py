@@ -0,0 +1,113 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from src.logger import logger
+
+MANIFEST_FILENAME = "manifest.jsonl"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def get_file_hash(file_path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_settings_hash(template, tuning_config, evaluation_config, responses_only):
+    """Hash of everything besides the image that decides the results of a sheet"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(Path(template.path).read_bytes())
+    digest.update(json.dumps(tuning_config.toDict(), sort_keys=True).encode())
+    digest.update(str(responses_only).encode())
+    # The files the pre-processors read, e.g. a marker or a reference image
+    for pre_processor in template.pre_processors:
+        for file_path in pre_processor.exclude_files():
+            digest.update(get_file_hash(file_path).encode())
+    if evaluation_config is not None:
+        digest.update(Path(evaluation_config.path).read_bytes())
+        # The answers can also come from an answer key csv or image
+        for question in evaluation_config.questions_in_order:
+            answer_matcher = evaluation_config.question_to_answer_matcher[question]
+            digest.update(repr((question, answer_matcher.answer_item)).encode())
+    return digest.hexdigest()
+
+
+class RunManifest:
+    """
+    The processed sheets of an output directory by their file name, with the content
+    hash of the image, the hash of the settings, and the result row written for it.
+    Entries are appended as json lines, so the latest entry of a file wins.
+    New entries are only written on flush(), which the ResultsSink calls after
+    flushing the result rows they refer to, so that a crash never leaves an entry
+    for a row missing from the results files.
+    """
+
+    def __init__(self, path, settings_hash):
+        self.path = path
+        self.settings_hash = settings_hash
+        self.entries = {}
+        self.pending_lines = []
+        self.file = None
+        if os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    # e.g. the last line of a crashed run
+                    logger.warning(f"Skipped an unreadable line of '{self.path}'")
+                    continue
+                self.entries[entry["file_id"]] = entry
+
+    def get_unchanged_entry(self, file_id, content_hash):
+        entry = self.entries.get(file_id)
+        if (
+            entry is not None
+            and entry["content_hash"] == content_hash
+            and entry["settings_hash"] == self.settings_hash
+        ):
+            return entry
+        return None
+
+    def record(self, file_id, content_hash, status, row, results_file, record=None):
+        entry = {
+            "file_id": file_id,
+            "content_hash": content_hash,
+            "settings_hash": self.settings_hash,
+            "status": status,
+            "row": [str(value) for value in row],
+            "results_file": str(results_file),
+            "record": record,
+        }
+        self.entries[file_id] = entry
+        self.pending_lines.append(json.dumps(entry) + "\n")
+
+    def flush(self):
+        if not self.pending_lines:
+            return
+        if self.file is None:
+            self.file = open(self.path, "a")
+        self.file.writelines(self.pending_lines)
+        self.file.flush()
+        self.pending_lines = []
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
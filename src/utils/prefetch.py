@@ -0,0 +1,78 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.sources import read_sheet
+
+
+class ImagePrefetcher:
+    """
+    Iterates over (file_path, image) of the files in their order, while a few threads
+    decode up to `depth` of the next images in the background (cv2 releases the GIL).
+    The images are decoded for decode_size, see read_sheet.
+    The decoded images waiting to be taken are kept within max_bytes, as estimated
+    from the largest image so far. Unreadable images are yielded as None.
+    """
+
+    def __init__(
+        self, file_paths, depth=2, max_bytes=256 * 2**20, threads=2, decode_size=None
+    ):
+        self.file_paths = file_paths
+        self.decode_size = decode_size
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.threads = threads
+        self.max_image_bytes = 0
+
+    def can_prefetch(self, pending_count):
+        # There is always one image being decoded, for the next sheet
+        if pending_count == 0:
+            return True
+        # Until the first image is decoded, its size is unknown
+        return (
+            pending_count < self.depth
+            and self.max_image_bytes > 0
+            and (pending_count + 1) * self.max_image_bytes <= self.max_bytes
+        )
+
+    def __iter__(self):
+        if self.depth <= 0:
+            for file_path in self.file_paths:
+                yield file_path, read_sheet(file_path, self.decode_size)
+            return
+
+        file_paths = iter(self.file_paths)
+        pending = deque()
+        with ThreadPoolExecutor(self.threads, "ImagePrefetcher") as executor:
+            try:
+                while True:
+                    while self.can_prefetch(len(pending)):
+                        file_path = next(file_paths, None)
+                        if file_path is None:
+                            break
+                        pending.append(
+                            (
+                                file_path,
+                                executor.submit(
+                                    read_sheet, file_path, self.decode_size
+                                ),
+                            )
+                        )
+                    if not pending:
+                        return
+                    file_path, future = pending.popleft()
+                    image = future.result()
+                    if image is not None:
+                        self.max_image_bytes = max(self.max_image_bytes, image.nbytes)
+                    yield file_path, image
+            finally:
+                # e.g. when the consumer stops early
+                for _, future in pending:
+                    future.cancel()
@@ -0,0 +1,173 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def get_channel_color(image, color):
+    # Like cv2 drawing functions, single channel images only take the first value
+    return color[0] if image.ndim == 2 else tuple(color[: image.shape[2]])
+
+
+def iterate_boxes_by_size(x0s, y0s, x1s, y1s):
+    """Yields (box_w, box_h, box_ids) for each size among the inclusive boxes"""
+    box_ws = np.asarray(x1s, dtype=np.int64) - x0s + 1
+    box_hs = np.asarray(y1s, dtype=np.int64) - y0s + 1
+    # Boxes of a template mostly come in a handful of sizes
+    size_keys = np.where((box_ws > 0) & (box_hs > 0), (box_ws << 32) + box_hs, -1)
+    for size_key in np.unique(size_keys):
+        if size_key >= 0:
+            box_ids = np.flatnonzero(size_keys == size_key)
+            yield int(size_key >> 32), int(size_key & 0xFFFFFFFF), box_ids
+
+
+def fill_same_size_boxes(image, xs, ys, box_w, box_h, color):
+    height, width = image.shape[:2]
+    inside = (xs >= 0) & (ys >= 0) & (xs + box_w <= width) & (ys + box_h <= height)
+    if inside.any():
+        # A (h, w) window at every pixel, so that each box is one block write
+        windows = sliding_window_view(
+            image, (box_h, box_w), axis=(0, 1), writeable=True
+        )
+        windows[ys[inside], xs[inside]] = np.reshape(color, (-1, 1, 1))
+    # The few boxes crossing the image borders get clipped by cv2
+    for x, y in zip(xs[~inside].tolist(), ys[~inside].tolist()):
+        cv2.rectangle(image, (x, y), (x + box_w - 1, y + box_h - 1), color, -1)
+
+
+def fill_boxes(image, x0s, y0s, x1s, y1s, color):
+    """Vectorized `cv2.rectangle(image, (x0, y0), (x1, y1), color, -1)` for all the boxes"""
+    x0s, y0s = np.asarray(x0s, dtype=np.int64), np.asarray(y0s, dtype=np.int64)
+    color = get_channel_color(image, color)
+    for box_w, box_h, box_ids in iterate_boxes_by_size(x0s, y0s, x1s, y1s):
+        fill_same_size_boxes(image, x0s[box_ids], y0s[box_ids], box_w, box_h, color)
+
+
+def rasterize_sprite(canvas, origin):
+    """
+    Converts a drawing in white over black into a sprite relative to the origin:
+    ((pixel_ys, pixel_xs) of the opaque pixels, (pixel_ys, pixel_xs, alphas) of the antialiased ones)
+    """
+    pixel_ys, pixel_xs = np.nonzero(canvas)
+    alphas = canvas[pixel_ys, pixel_xs]
+    pixel_ys, pixel_xs = pixel_ys - origin[1], pixel_xs - origin[0]
+    opaque = alphas == 255
+    sprite = (
+        (pixel_ys[opaque], pixel_xs[opaque]),
+        (pixel_ys[~opaque], pixel_xs[~opaque], alphas[~opaque].astype(np.int32)),
+    )
+    for part in sprite:
+        for values in part:
+            values.flags.writeable = False
+    return sprite
+
+
+def get_mask_rects(mask):
+    """Decomposes a binary mask into (x, y, w, h) rects: runs of each row, merged with the identical runs below"""
+    rects, open_rects = [], {}
+    for y, row in enumerate(np.pad(mask, ((0, 1), (0, 0)))):
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], row > 0, [0]])))
+        runs = set(zip(edges[::2].tolist(), (edges[1::2] - edges[::2]).tolist()))
+        for run in set(open_rects) - runs:
+            (x, w), start_y = run, open_rects.pop(run)
+            rects.append((x, start_y, w, y - start_y))
+        for run in runs - set(open_rects):
+            open_rects[run] = y
+    return rects
+
+
+@lru_cache(maxsize=None)
+def get_box_outline_rects(box_w, box_h, thickness):
+    """Pre-rasterized `cv2.rectangle` outline of a box as solid rects relative to its top-left corner"""
+    pad = thickness + 1
+    canvas = np.zeros((box_h + 2 * pad, box_w + 2 * pad), dtype=np.uint8)
+    cv2.rectangle(
+        canvas, (pad, pad), (pad + box_w - 1, pad + box_h - 1), 255, thickness
+    )
+    # Note: cv2 draws rectangles without antialiasing by default
+    return tuple((x - pad, y - pad, w, h) for x, y, w, h in get_mask_rects(canvas))
+
+
+@lru_cache(maxsize=None)
+def get_text_sprite(text, font_face, font_scale, thickness):
+    """
+    Pre-rasterized `cv2.putText` of the text, relative to the text origin.
+    The hershey fonts render exactly the same at any integer origin.
+    Note: cv2 blends the few pixels where antialiased strokes of a glyph overlap
+    once per stroke, the sprite blends them once, which can differ by 1 level.
+    """
+    (text_w, text_h), baseline = cv2.getTextSize(text, font_face, font_scale, thickness)
+    pad = thickness + 2
+    canvas = np.zeros((text_h + baseline + 2 * pad, text_w + 2 * pad), dtype=np.uint8)
+    origin = (pad, text_h + pad)
+    cv2.putText(canvas, text, origin, font_face, font_scale, 255, thickness)
+    return rasterize_sprite(canvas, origin)
+
+
+def get_stamp_pixels(image, xs, ys, pixel_ys, pixel_xs, *values):
+    """(n, pixels) coordinates of the sprite pixels stamped at each (x, y), flattened and clipped to the image"""
+    pixel_ys = ys[:, np.newaxis] + pixel_ys
+    pixel_xs = xs[:, np.newaxis] + pixel_xs
+    values = [np.broadcast_to(value, pixel_ys.shape) for value in values]
+    height, width = image.shape[:2]
+    inside = (
+        (pixel_ys >= 0) & (pixel_ys < height) & (pixel_xs >= 0) & (pixel_xs < width)
+    )
+    if inside.all():
+        return (pixel_ys.ravel(), pixel_xs.ravel(), *(v.ravel() for v in values))
+    return (pixel_ys[inside], pixel_xs[inside], *(v[inside] for v in values))
+
+
+def stamp_sprite(image, sprite, xs, ys, color):
+    """Draws the sprite at each (x, y), blending its antialiased pixels the same way as cv2"""
+    (opaque_ys, opaque_xs), (partial_ys, partial_xs, alphas) = sprite
+    color = get_channel_color(image, color)
+    pixel_ys, pixel_xs = get_stamp_pixels(image, xs, ys, opaque_ys, opaque_xs)
+    image[pixel_ys, pixel_xs] = color
+    if len(alphas) == 0:
+        return
+    pixel_ys, pixel_xs, alphas = get_stamp_pixels(
+        image, xs, ys, partial_ys, partial_xs, alphas
+    )
+    if image.ndim == 3:
+        alphas = alphas[:, np.newaxis]
+    background = image[pixel_ys, pixel_xs].astype(np.int32)
+    image[pixel_ys, pixel_xs] = (
+        background * (255 - alphas) + np.int32(color) * alphas + 127
+    ) // 255
+
+
+def draw_box_outlines(image, x0s, y0s, x1s, y1s, color, thickness):
+    """Vectorized `cv2.rectangle(image, (x0, y0), (x1, y1), color, thickness)` for all the boxes"""
+    x0s, y0s = np.asarray(x0s, dtype=np.int64), np.asarray(y0s, dtype=np.int64)
+    color = get_channel_color(image, color)
+    for box_w, box_h, box_ids in iterate_boxes_by_size(x0s, y0s, x1s, y1s):
+        xs, ys = x0s[box_ids], y0s[box_ids]
+        for x, y, w, h in get_box_outline_rects(box_w, box_h, thickness):
+            fill_same_size_boxes(image, xs + x, ys + y, w, h, color)
+
+
+def draw_texts(image, texts, xs, ys, font_face, font_scale, color, thickness):
+    """Vectorized `cv2.putText(image, text, (x, y), ...)` for all the texts, using one sprite per distinct text"""
+    texts = np.asarray(texts, dtype=str)
+    xs, ys = np.asarray(xs, dtype=np.int64), np.asarray(ys, dtype=np.int64)
+    if len(texts) == 0:
+        return
+    unique_texts, text_ids = np.unique(texts, return_inverse=True)
+    text_ids = text_ids.ravel()
+    # Group the positions of each text together
+    order = np.argsort(text_ids, kind="stable")
+    bounds = np.searchsorted(text_ids[order], np.arange(len(unique_texts) + 1))
+    for text, start, end in zip(unique_texts, bounds[:-1], bounds[1:]):
+        sprite = get_text_sprite(str(text), font_face, font_scale, thickness)
+        stamp_ids = order[start:end]
+        stamp_sprite(image, sprite, xs[stamp_ids], ys[stamp_ids], color)
@@ -0,0 +1,60 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import cv2
+import numpy as np
+
+
+def normalize_slice_bounds(starts, stops, size):
+    """Vectorized equivalent of python's `slice(start, stop).indices(size)` for unit steps.
+    Negative bounds wrap around and out of range bounds get clipped, exactly like `img[a:b]`.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+    starts = np.where(starts < 0, starts + size, starts).clip(0, size)
+    stops = np.where(stops < 0, stops + size, stops).clip(0, size)
+    # Empty slices when stop is before start
+    stops = np.maximum(starts, stops)
+    return starts, stops
+
+
+# Largest 8-bit image area whose pixel sum still fits in an int32
+MAX_INT32_SUM_AREA = np.iinfo(np.int32).max // 255
+
+
+def get_integral_image(image):
+    # int32 sums are exact for pages up to ~8.4 megapixels at half the memory of
+    # float64, which stays exact for any 8-bit page that fits in memory
+    if image.shape[0] * image.shape[1] <= MAX_INT32_SUM_AREA:
+        return cv2.integral(image, sdepth=cv2.CV_32S)
+    return cv2.integral(image, sdepth=cv2.CV_64F)
+
+
+def get_box_sums(integral_image, xs, ys, box_ws, box_hs):
+    """Returns the pixel sums and pixel counts of the boxes `img[y:y+h, x:x+w]` in a single gather"""
+    height, width = integral_image.shape[0] - 1, integral_image.shape[1] - 1
+    xs, ys = np.asarray(xs, dtype=np.int64), np.asarray(ys, dtype=np.int64)
+    x_starts, x_stops = normalize_slice_bounds(xs, xs + box_ws, width)
+    y_starts, y_stops = normalize_slice_bounds(ys, ys + box_hs, height)
+    sums = (
+        integral_image[y_stops, x_stops]
+        - integral_image[y_starts, x_stops]
+        - integral_image[y_stops, x_starts]
+        + integral_image[y_starts, x_starts]
+    )
+    counts = (x_stops - x_starts) * (y_stops - y_starts)
+    return sums, counts
+
+
+def get_box_means(integral_image, xs, ys, box_ws, box_hs):
+    """Bit-exact vectorized equivalent of `cv2.mean(img[y:y+h, x:x+w])[0]` for each box"""
+    sums, counts = get_box_sums(integral_image, xs, ys, box_ws, box_hs)
+    # Note: cv2.mean scales by the reciprocal (and gives 0 for empty boxes)
+    with np.errstate(divide="ignore"):
+        scale = np.where(counts > 0, 1.0 / counts, 0.0)
+    return sums * scale
@@ -0,0 +1,159 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import hashlib
+import os
+import zipfile
+from functools import lru_cache
+from pathlib import Path
+
+import cv2
+
+from src.logger import logger
+from src.utils.decode import decode_image, read_image
+from src.utils.manifest import get_file_hash
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+MULTI_PAGE_EXTENSIONS = (".tif", ".tiff")
+ARCHIVE_EXTENSIONS = (".zip",)
+CONTAINER_EXTENSIONS = MULTI_PAGE_EXTENSIONS + ARCHIVE_EXTENSIONS
+
+# The sheets inside a container file are named '<container name>#<member id>' in its
+# directory, e.g. 'batch.tiff#page-0001.png' or 'scans.zip#class-a__roll-12.jpg'
+MEMBER_SEPARATOR = "#"
+# Replaces the folder separators of the archive members
+ARCHIVE_FOLDER_SEPARATOR = "__"
+
+
+def get_page_id(page_index):
+    # Note: the saved marked images take the extension of the member id
+    return f"page-{page_index + 1:04d}.png"
+
+
+def get_archive_member_id(member_name):
+    return member_name.replace("/", ARCHIVE_FOLDER_SEPARATOR)
+
+
+def get_member_path(container_path, member_id):
+    return container_path.with_name(
+        f"{container_path.name}{MEMBER_SEPARATOR}{member_id}"
+    )
+
+
+def split_member_path(file_path):
+    """(container_path, member_id) of a sheet inside a container file, else None"""
+    name = file_path.name
+    # Both the container name and the member id can contain the separator, so the
+    # container is the first one found as a file
+    index = name.find(MEMBER_SEPARATOR)
+    while index != -1:
+        container_name = name[:index]
+        if container_name.lower().endswith(CONTAINER_EXTENSIONS):
+            container_path = file_path.with_name(container_name)
+            if container_path.is_file():
+                return container_path, name[index + 1 :]
+        index = name.find(MEMBER_SEPARATOR, index + 1)
+    return None
+
+
+def get_file_key(file_path):
+    # The open files can't be shared with forked processes, and the files can change
+    return file_path, os.stat(file_path).st_mtime_ns, os.getpid()
+
+
+def open_archive(container_path):
+    """The archive with its image members by member id, kept open for the next reads"""
+    return open_archive_for_key(get_file_key(container_path))
+
+
+@lru_cache(maxsize=8)
+def open_archive_for_key(file_key):
+    archive = zipfile.ZipFile(file_key[0])
+    members = {
+        get_archive_member_id(info.filename): info.filename
+        for info in archive.infolist()
+        if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+    }
+    return archive, members
+
+
+def list_container_sheets(container_path):
+    """The sheets inside a multi-page image or an archive, in their order"""
+    try:
+        if container_path.name.lower().endswith(ARCHIVE_EXTENSIONS):
+            _archive, members = open_archive(container_path)
+            member_ids = sorted(members)
+        else:
+            page_count = cv2.imcount(str(container_path), cv2.IMREAD_GRAYSCALE)
+            member_ids = [get_page_id(page_index) for page_index in range(page_count)]
+    except (OSError, zipfile.BadZipFile, cv2.error) as e:
+        logger.error(f"Could not list the sheets of '{container_path}': {e}")
+        return []
+    return [get_member_path(container_path, member_id) for member_id in member_ids]
+
+
+def read_member_bytes(container_path, member_id):
+    archive, members = open_archive(container_path)
+    return archive.read(members[member_id])
+
+
+def get_page_index(member_id):
+    return int(Path(member_id).stem.removeprefix("page-")) - 1
+
+
+def read_sheet(file_path, decode_size=None):
+    """
+    Decodes the sheet in grayscale, None when it can't be read. The sheets inside a
+    container are decoded straight from it, without extracting them to disk.
+    """
+    member = split_member_path(file_path)
+    if member is None:
+        return read_image(file_path, decode_size)
+
+    container_path, member_id = member
+    try:
+        if container_path.name.lower().endswith(ARCHIVE_EXTENSIONS):
+            image = decode_image(
+                read_member_bytes(container_path, member_id), decode_size
+            )
+        else:
+            ok, pages = cv2.imreadmulti(
+                str(container_path),
+                get_page_index(member_id),
+                1,
+                flags=cv2.IMREAD_GRAYSCALE,
+            )
+            image = pages[0] if ok and pages else None
+    except Exception as e:
+        logger.error(f"Error while reading image '{file_path}': {e}")
+        return None
+    if image is None:
+        logger.error(f"Could not read image: '{file_path}'")
+    return image
+
+
+def get_sheet_hash(file_path):
+    """Content hash of the sheet, for the sheets inside containers too"""
+    member = split_member_path(file_path)
+    if member is None:
+        return get_file_hash(file_path)
+
+    container_path, member_id = member
+    if container_path.name.lower().endswith(ARCHIVE_EXTENSIONS):
+        return hashlib.blake2b(
+            read_member_bytes(container_path, member_id), digest_size=16
+        ).hexdigest()
+    # The pages are hashed along with the whole multi-page file
+    digest = hashlib.blake2b(member_id.encode(), digest_size=16)
+    digest.update(get_container_hash(get_file_key(container_path)).encode())
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=8)
+def get_container_hash(file_key):
+    return get_file_hash(file_key[0])
@@ -0,0 +1,266 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import csv
+import os
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from src.utils.file import get_results_writer
+from src.utils.parsing import get_concatenated_response
+
+PAPER_INTENSITY = 238
+BACKGROUND_INTENSITY = 60
+OUTLINE_INTENSITY = 110
+FILL_INTENSITY = 45
+GROUND_TRUTH_FILENAME = "ground_truth.csv"
+
+
+@dataclass
+class SyntheticOptions:
+    """How the synthetic sheets are filled and degraded, the defaults give clean scans"""
+
+    # Chances of a field being left blank, or marked with an extra bubble
+    blank_rate: float = 0.05
+    multi_mark_rate: float = 0.0
+    # Range of the fraction of a bubble's area filled by a mark (partial fills below 1)
+    fill_range: tuple = (0.8, 1.0)
+    noise_std: float = 3.0
+    blur_sigma: float = 0.0
+    # Maximum rotation (in degrees) and corner displacement (as a fraction of the sheet)
+    max_rotation: float = 0.0
+    max_perspective: float = 0.0
+    # Maximum darkening by a lighting gradient across the sheet
+    lighting: float = 0.0
+    # Draw the markers of CropOnMarkers, when the template has it
+    markers: bool = True
+    # Background margin around the paper, defaults to one only when needed by CropPage
+    border: int = None
+
+
+class SheetGenerator:
+    """
+    Renders filled sheets of a template, along with their ground truth responses.
+    The bubbles are drawn at the template's coordinates, onto a page of its page
+    dimensions, which is placed as CropOnMarkers and CropPage would find it.
+    """
+
+    def __init__(self, template, options=None, seed=None):
+        self.template = template
+        self.options = options or SyntheticOptions()
+        self.rng = np.random.default_rng(seed)
+        self.compiled = template.compiled
+        pre_processor_names = [pp.__class__.__name__ for pp in template.pre_processors]
+        self.marker_processor = None
+        if self.options.markers and "CropOnMarkers" in pre_processor_names:
+            self.marker_processor = template.pre_processors[
+                pre_processor_names.index("CropOnMarkers")
+            ]
+        self.border = self.options.border
+        if self.border is None:
+            self.border = 40 if "CropPage" in pre_processor_names else 0
+
+    def get_strip_values(self, strip_no):
+        compiled = self.compiled
+        start, stop = compiled.strip_offsets[strip_no : strip_no + 2]
+        return [
+            compiled.bubble_values[v] for v in compiled.bubble_value_ids[start:stop]
+        ]
+
+    def get_random_answers(self):
+        """Marked values of each field label, an empty list for blank fields"""
+        options, answers = self.options, {}
+        for strip_no, field_label in enumerate(self.compiled.field_labels):
+            values = self.get_strip_values(strip_no)
+            if self.rng.random() < options.blank_rate:
+                answers[field_label] = []
+                continue
+            # Marking every bubble of a strip would leave no unmarked one to compare with
+            count = 1
+            if len(values) > 2 and self.rng.random() < options.multi_mark_rate:
+                count = 2
+            marked = self.rng.choice(len(values), count, False)
+            answers[field_label] = [values[i] for i in sorted(marked)]
+        return answers
+
+    def get_marked_bubbles(self, answers):
+        """
+        Boolean mask of the marked bubbles. The answers of a field label can be a value
+        or a list of values, labels without an answer are left blank.
+        """
+        compiled = self.compiled
+        bubbles_marked = np.zeros(compiled.num_bubbles, bool)
+        for strip_no, field_label in enumerate(compiled.field_labels):
+            answer = answers.get(field_label, [])
+            values = self.get_strip_values(strip_no)
+            if isinstance(answer, str):
+                answer = [answer] if answer in values else list(answer)
+            for value in answer:
+                if value not in values:
+                    raise Exception(
+                        f"Invalid value '{value}' for the field '{field_label}', expected one of {values}"
+                    )
+                bubbles_marked[
+                    compiled.strip_offsets[strip_no] + values.index(value)
+                ] = True
+        return bubbles_marked
+
+    def get_response(self, bubbles_marked):
+        """The response the sheet should be read as, per field label"""
+        compiled = self.compiled
+        omr_response = {}
+        for strip_no, field_label in enumerate(compiled.field_labels):
+            start, stop = compiled.strip_offsets[strip_no : strip_no + 2]
+            marked_values = "".join(
+                compiled.bubble_values[compiled.bubble_value_ids[bubble_no]]
+                for bubble_no in range(start, stop)
+                if bubbles_marked[bubble_no]
+            )
+            block_id = compiled.strip_block_ids[strip_no]
+            omr_response[field_label] = (
+                marked_values or compiled.block_empty_vals[block_id]
+            )
+        return omr_response
+
+    def draw_page(self, bubbles_marked):
+        compiled, rng = self.compiled, self.rng
+        page_width, page_height = self.template.page_dimensions
+        page = np.full((page_height, page_width), PAPER_INTENSITY, np.uint8)
+        fill_min, fill_max = self.options.fill_range
+        for x, y, w, h, is_marked in zip(
+            compiled.bubble_xs.tolist(),
+            compiled.bubble_ys.tolist(),
+            compiled.bubble_box_ws.tolist(),
+            compiled.bubble_box_hs.tolist(),
+            bubbles_marked.tolist(),
+        ):
+            center, axes = (x + w // 2, y + h // 2), (w // 2 - 1, h // 2 - 1)
+            cv2.ellipse(
+                page, center, axes, 0, 0, 360, OUTLINE_INTENSITY, 1, cv2.LINE_AA
+            )
+            if is_marked:
+                # A partial fill covers a part of the bubble's area
+                scale = np.sqrt(rng.uniform(fill_min, fill_max))
+                fill_axes = (int(axes[0] * scale), int(axes[1] * scale))
+                intensity = int(FILL_INTENSITY + rng.integers(-15, 16))
+                cv2.ellipse(
+                    page, center, fill_axes, 0, 0, 360, intensity, -1, cv2.LINE_AA
+                )
+        return page
+
+    def add_markers(self, page):
+        """The paper with the markers centered on the corners of the page"""
+        marker_processor = self.marker_processor
+        marker = cv2.imread(marker_processor.marker_path, cv2.IMREAD_GRAYSCALE)
+        # The size of the marker searched for, in the sheet resized to the processing size
+        page_height, page_width = page.shape
+        processing_width = (
+            self.template.image_instance_ops.tuning_config.dimensions.processing_width
+        )
+        marker_h, marker_w = marker_processor.marker.shape
+        # Assuming the markers take about a tenth of the paper width as margins
+        scale = page_width * 1.1 / processing_width
+        marker = cv2.resize(marker, (int(marker_w * scale), int(marker_h * scale)))
+        margin_y, margin_x = marker.shape[0], marker.shape[1]
+        paper = np.full(
+            (page_height + 2 * margin_y, page_width + 2 * margin_x),
+            PAPER_INTENSITY,
+            np.uint8,
+        )
+        paper[margin_y:-margin_y, margin_x:-margin_x] = page
+        half_h, half_w = marker.shape[0] // 2, marker.shape[1] // 2
+        for corner_x in [margin_x, margin_x + page_width]:
+            for corner_y in [margin_y, margin_y + page_height]:
+                y0, x0 = corner_y - half_h, corner_x - half_w
+                region = paper[y0 : y0 + marker.shape[0], x0 : x0 + marker.shape[1]]
+                np.minimum(region, marker, out=region)
+        return paper
+
+    def degrade(self, sheet):
+        options, rng = self.options, self.rng
+        height, width = sheet.shape
+        if options.lighting > 0:
+            angle = rng.uniform(0, 2 * np.pi)
+            ys, xs = np.mgrid[0:height, 0:width]
+            ramp = xs * np.cos(angle) + ys * np.sin(angle)
+            ramp = (ramp - ramp.min()) / max(np.ptp(ramp), 1)
+            sheet = (sheet * (1 - options.lighting * ramp)).astype(np.uint8)
+
+        if options.max_rotation > 0 or options.max_perspective > 0:
+            corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+            jitter = rng.uniform(-1, 1, (4, 2)) * options.max_perspective
+            warped = corners + jitter * [width, height]
+            rotation = cv2.getRotationMatrix2D(
+                (width / 2, height / 2),
+                rng.uniform(-options.max_rotation, options.max_rotation),
+                1,
+            )
+            warped = cv2.transform(warped[None], rotation)[0]
+            # Grow the canvas to keep the whole of the warped sheet within it
+            warped = (warped - warped.min(axis=0)).astype(np.float32)
+            warped_width, warped_height = np.ceil(warped.max(axis=0)).astype(int)
+            sheet = cv2.warpPerspective(
+                sheet,
+                cv2.getPerspectiveTransform(corners, warped),
+                (int(warped_width), int(warped_height)),
+                borderValue=BACKGROUND_INTENSITY,
+            )
+
+        if options.blur_sigma > 0:
+            sheet = cv2.GaussianBlur(sheet, (0, 0), options.blur_sigma)
+        if options.noise_std > 0:
+            noise = rng.normal(0, options.noise_std, sheet.shape)
+            sheet = np.clip(sheet + noise, 0, 255).astype(np.uint8)
+        return sheet
+
+    def render(self, answers=None):
+        """A filled sheet, with its ground truth response per field label"""
+        if answers is None:
+            answers = self.get_random_answers()
+        bubbles_marked = self.get_marked_bubbles(answers)
+        sheet = self.draw_page(bubbles_marked)
+        if self.marker_processor is not None:
+            sheet = self.add_markers(sheet)
+        if self.border > 0:
+            sheet = cv2.copyMakeBorder(
+                sheet,
+                *[self.border] * 4,
+                cv2.BORDER_CONSTANT,
+                value=BACKGROUND_INTENSITY,
+            )
+        return self.degrade(sheet), self.get_response(bubbles_marked)
+
+    def generate(self, output_dir, count, answers_list=None, ext=".jpg"):
+        """
+        Writes `count` sheets (or one per answers of answers_list) into output_dir,
+        with the expected row of each sheet in its ground truth csv.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        if answers_list is None:
+            answers_list = [None] * count
+        output_columns = self.template.output_columns
+        with open(
+            os.path.join(output_dir, GROUND_TRUTH_FILENAME), "w", newline=""
+        ) as file:
+            writer = get_results_writer(file)
+            writer.writerow(["file_id"] + output_columns)
+            for sheet_no, answers in enumerate(answers_list, 1):
+                sheet, omr_response = self.render(answers)
+                file_id = f"synthetic_{sheet_no:05d}{ext}"
+                cv2.imwrite(os.path.join(output_dir, file_id), sheet)
+                response = get_concatenated_response(omr_response, self.template)
+                writer.writerow([file_id] + [response[c] for c in output_columns])
+
+
+def read_ground_truth(output_dir):
+    with open(os.path.join(output_dir, GROUND_TRUTH_FILENAME), newline="") as file:
+        rows = list(csv.reader(file))
+    header = rows[0]
+    return {row[0]: dict(zip(header[1:], row[1:])) for row in rows[1:]}
@@ -0,0 +1,166 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+from src.constants import CONFIG_FILENAME, EVALUATION_FILENAME
+from src.defaults import CONFIG_DEFAULTS
+from src.evaluation import EvaluationConfig
+from src.template import Template
+from src.utils.parsing import open_config_with_defaults
+
+
+def load_template(template_path):
+    """The template with the tuning config and evaluation config of its directory"""
+    template_dir = template_path.parent
+    tuning_config = CONFIG_DEFAULTS
+    local_config_path = template_dir.joinpath(CONFIG_FILENAME)
+    if local_config_path.exists():
+        tuning_config = open_config_with_defaults(local_config_path)
+    template = Template(template_path, tuning_config)
+    evaluation_config = None
+    local_evaluation_path = template_dir.joinpath(EVALUATION_FILENAME)
+    if local_evaluation_path.exists():
+        evaluation_config = EvaluationConfig(
+            template_dir, local_evaluation_path, template, tuning_config
+        )
+    return template, tuning_config, evaluation_config
+
+
+def get_files_signature(file_paths):
+    signature = []
+    for file_path in file_paths:
+        try:
+            stat = os.stat(file_path)
+            signature.append((str(file_path), stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((str(file_path), None, None))
+    return tuple(signature)
+
+
+class TemplateEntry:
+    def __init__(self, file_paths, signature):
+        self.file_paths = file_paths
+        self.signature = signature
+        # The instances not in use by a request
+        self.idle = []
+
+
+class TemplateCache:
+    """
+    Ready to run templates with their tuning and evaluation configs, keyed by the
+    template path. An entry is rebuilt when the template, its config.json or
+    evaluation.json, or the files they refer to (markers, reference images, answer
+    keys) change, and the least recently used entries are evicted.
+
+    A template keeps the images of the sheet being processed (and an evaluation config
+    its explanation), so each instance is used by one request at a time, and
+    concurrent requests build more instances.
+    """
+
+    def __init__(self, max_templates=8, max_idle=4):
+        self.max_templates = max_templates
+        self.max_idle = max_idle
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_entry(self, template_path):
+        # Needs self.lock, returns the entry if its files are unchanged
+        entry = self.entries.get(template_path)
+        if entry is None:
+            return None
+        if get_files_signature(entry.file_paths) != entry.signature:
+            del self.entries[template_path]
+            return None
+        self.entries.move_to_end(template_path)
+        return entry
+
+    def build(self, template_path):
+        file_paths = [
+            template_path.parent.joinpath(file_name)
+            for file_name in [template_path.name, CONFIG_FILENAME, EVALUATION_FILENAME]
+        ]
+        # Taken before loading, so that an edit made while loading rebuilds it later
+        signature = get_files_signature(file_paths)
+        instance = load_template(template_path)
+        template, _, evaluation_config = instance
+        referred_files = [
+            Path(file_path)
+            for pre_processor in template.pre_processors
+            for file_path in pre_processor.exclude_files()
+        ]
+        if evaluation_config is not None:
+            referred_files += map(Path, evaluation_config.get_exclude_files())
+            referred_files += map(Path, evaluation_config.get_answer_key_files())
+        file_paths += referred_files
+        signature += get_files_signature(referred_files)
+        return TemplateEntry(file_paths, signature), instance
+
+    @contextmanager
+    def acquire(self, template_path):
+        """
+        Checks out a (template, tuning_config, evaluation_config) for the duration of
+        the block, the evaluation_config is None without an evaluation.json
+        """
+        template_path = Path(template_path).resolve()
+        instance = None
+        with self.lock:
+            entry = self.get_entry(template_path)
+            if entry is not None and entry.idle:
+                instance = entry.idle.pop()
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if instance is None:
+            # Loading runs outside the lock, it validates and sets up the pre-processors
+            built_entry, instance = self.build(template_path)
+            with self.lock:
+                entry = self.get_entry(template_path)
+                if entry is None or entry.signature != built_entry.signature:
+                    entry = built_entry
+                    self.entries[template_path] = entry
+                while len(self.entries) > self.max_templates:
+                    self.entries.popitem(last=False)
+
+        try:
+            yield instance
+        finally:
+            with self.lock:
+                # Dropped if the entry was invalidated or evicted meanwhile
+                if (
+                    self.entries.get(template_path) is entry
+                    and len(entry.idle) < self.max_idle
+                ):
+                    entry.idle.append(instance)
+
+    def invalidate(self, template_path=None):
+        """Drops the given template, or all of them. Returns the number of entries dropped"""
+        with self.lock:
+            if template_path is None:
+                count = len(self.entries)
+                self.entries.clear()
+                return count
+            entry = self.entries.pop(Path(template_path).resolve(), None)
+            return 0 if entry is None else 1
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "templates": [str(template_path) for template_path in self.entries],
+                "idle_instances": sum(len(e.idle) for e in self.entries.values()),
+                "max_templates": self.max_templates,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
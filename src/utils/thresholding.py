@@ -0,0 +1,107 @@
+"""
+
+ OMRChecker
+
+ Author: Udayraj Deshmukh
+ Github: https://github.com/Udayraj123
+
+"""
+import numpy as np
+
+
+def get_global_threshold(q_vals, min_jump, jump_delta, default_threshold, looseness=1):
+    """
+    Vectorized form of ImageInstanceOps.get_global_threshold.
+    Returns (global_thr, j_low, j_high, thr2) with identical values.
+    """
+    q_vals = np.sort(np.asarray(q_vals, dtype=np.float64))
+    ls = (looseness + 1) // 2
+    # jumps[k] corresponds to the loop index i = k + ls
+    jumps = q_vals[2 * ls :] - q_vals[: max(0, len(q_vals) - 2 * ls)]
+    new_thresholds = q_vals[: len(jumps)] + jumps / 2
+
+    # Find the FIRST LARGE GAP and set it as threshold
+    max1, thr1 = min_jump, default_threshold
+    if len(jumps) > 0:
+        k = int(np.argmax(jumps))
+        if jumps[k] > min_jump:
+            max1, thr1 = float(jumps[k]), float(new_thresholds[k])
+
+    # NOTE: thr2 is deprecated, thus is JUMP_DELTA
+    max2, thr2 = min_jump, default_threshold
+    far_jumps = np.where(np.abs(thr1 - new_thresholds) > jump_delta, jumps, -np.inf)
+    if len(far_jumps) > 0:
+        k = int(np.argmax(far_jumps))
+        if far_jumps[k] > max2:
+            thr2 = float(new_thresholds[k])
+
+    return thr1, thr1 - max1 // 2, thr1 + max1 // 2, thr2
+
+
+def iterate_strips_by_length(strip_offsets):
+    """Yields (strip_length, strip_ids, bubble_indices) with one row of indices per strip"""
+    strip_offsets = np.asarray(strip_offsets)
+    strip_lengths = np.diff(strip_offsets)
+    for strip_length in np.unique(strip_lengths):
+        strip_ids = np.flatnonzero(strip_lengths == strip_length)
+        bubble_indices = strip_offsets[strip_ids, np.newaxis] + np.arange(strip_length)
+        yield int(strip_length), strip_ids, bubble_indices
+
+
+def get_strip_std_vals(q_vals, strip_offsets):
+    """Per strip standard deviations rounded like `round(np.std(q_strip_vals), 2)`"""
+    q_vals = np.asarray(q_vals, dtype=np.float64)
+    q_std_vals = np.empty(len(strip_offsets) - 1, dtype=np.float64)
+    for _, strip_ids, bubble_indices in iterate_strips_by_length(strip_offsets):
+        q_std_vals[strip_ids] = np.round(np.std(q_vals[bubble_indices], axis=1), 2)
+    return q_std_vals
+
+
+def get_local_thresholds(
+    q_vals,
+    strip_offsets,
+    global_thr,
+    no_outliers,
+    min_gap,
+    min_jump,
+    confident_surplus,
+):
+    """
+    Vectorized form of ImageInstanceOps.get_local_threshold for all strips of a sheet.
+    Strips of equal length are sorted together as one matrix, and the largest
+    jump of each row is found with a single argmax.
+    """
+    q_vals = np.asarray(q_vals, dtype=np.float64)
+    no_outliers = np.asarray(no_outliers, dtype=bool)
+    thresholds = np.empty(len(strip_offsets) - 1, dtype=np.float64)
+    for strip_length, strip_ids, bubble_indices in iterate_strips_by_length(
+        strip_offsets
+    ):
+        q_strips = np.sort(q_vals[bubble_indices], axis=1)
+
+        # Small no of pts cases:
+        # base case: 1 or 2 pts
+        if strip_length < 3:
+            thresholds[strip_ids] = np.where(
+                q_strips[:, -1] - q_strips[:, 0] < min_gap,
+                global_thr,
+                np.mean(q_strips, axis=1),
+            )
+            continue
+
+        # Find the LARGEST GAP and set it as threshold: //(FIRST LARGE GAP)
+        jumps = q_strips[:, 2:] - q_strips[:, :-2]
+        rows = np.arange(len(strip_ids))
+        k = np.argmax(jumps, axis=1)
+        max_jumps = jumps[rows, k]
+        found_jumps = max_jumps > min_jump
+        max1 = np.where(found_jumps, max_jumps, min_jump)
+        thr1 = np.where(found_jumps, q_strips[rows, k] + max_jumps / 2, 255)
+
+        # If not confident, then only take help of global_thr
+        confident_jump = min_jump + confident_surplus
+        thresholds[strip_ids] = np.where(
+            (max1 < confident_jump) & no_outliers[strip_ids], global_thr, thr1
+        )
+
+    return thresholds